@@ -0,0 +1,49 @@
+"""
+Compare the batch APIs with per-key loops on sorted micro-batches.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_batch
+"""
+
+from __future__ import annotations
+import random
+import time
+from typing import Callable
+
+from py_treaps.treap_map import TreapMap
+
+BASE = 10 ** 5
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rng = random.Random(0)
+    print(f"existing keys: {BASE}")
+    print(f"{'batch':>7} {'insert loop':>12} {'insert_many':>12} {'lookup loop':>12} {'lookup_many':>12}  (kops/s)")
+    for size in (100, 1000, 10000, 100000):
+        # A sorted run of new keys interleaved with the existing (even) keys
+        start = rng.randrange(BASE)
+        batch = [(2 * k + 1, k) for k in range(start, start + size)]
+        keys = [k for k, _ in batch]
+
+        loop_map = TreapMap.from_sorted(((2 * i, i) for i in range(BASE)), seed=1)
+        batch_map = TreapMap.from_sorted(((2 * i, i) for i in range(BASE)), seed=1)
+
+        def insert_loop():
+            for k, v in batch:
+                loop_map.insert(k, v)
+
+        rates = [size / timed(insert_loop), size / timed(lambda: batch_map.insert_many(batch))]
+        rates.append(size / timed(lambda: [loop_map.lookup(k) for k in keys]))
+        rates.append(size / timed(lambda: batch_map.lookup_many(keys)))
+        print(f"{size:>7} " + " ".join(f"{r / 1000:>12.1f}" for r in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Measure reader throughput on a shared ConcurrentTreapMap under writes.
+
+Reader threads look up random keys while one writer thread keeps
+inserting and removing. Compares reads under the readers-writer lock
+with lock-free reads from published snapshots.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrent
+"""
+
+from __future__ import annotations
+import random
+import threading
+import time
+
+from py_treaps.concurrent_treap import ConcurrentTreapMap
+
+KEYS = 10 ** 5
+DURATION = 1.0
+
+
+def run(lock_free_reads: bool, readers: int) -> tuple:
+    """Return (reads per second, writes per second) for one configuration."""
+    shared: ConcurrentTreapMap[int, int] = ConcurrentTreapMap(lock_free_reads=lock_free_reads)
+    with shared.write_batch() as treap:
+        for k in range(0, KEYS, 2):
+            treap.insert(k, k)
+
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+
+    def reader(slot: int) -> None:
+        rng = random.Random(slot)
+        count = 0
+        while not stop.is_set():
+            shared.lookup(rng.randrange(KEYS))
+            count += 1
+        reads[slot] = count
+
+    def writer() -> None:
+        rng = random.Random(-1)
+        count = 0
+        while not stop.is_set():
+            k = rng.randrange(KEYS)
+            if k % 2:
+                shared.insert(k, k)
+            else:
+                shared.remove(k)
+            count += 1
+        writes[0] = count
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / DURATION, writes[0] / DURATION
+
+
+def main() -> None:
+    print(f"{'readers':>8} {'mode':>10} {'reads/s':>12} {'writes/s':>10}")
+    for readers in (1, 4, 16):
+        for lock_free_reads in (False, True):
+            read_rate, write_rate = run(lock_free_reads, readers)
+            mode = "lock-free" if lock_free_reads else "rw-lock"
+            print(f"{readers:>8} {mode:>10} {read_rate:>12.0f} {write_rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
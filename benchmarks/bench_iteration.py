@@ -0,0 +1,63 @@
+"""
+Compare TreapMap iteration against the old recursive generator.
+
+The old `__iter__` nested one generator per tree level, so every key
+was passed up the whole chain of generators. The current iterator
+follows successor links instead.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_iteration
+"""
+
+from __future__ import annotations
+import sys
+import time
+from typing import Callable, Iterator
+
+from py_treaps.treap_map import TreapMap
+
+
+def recursive_keys(treap: TreapMap) -> Iterator:
+    """The in-order generator TreapMap used before successor links."""
+
+    def inorder(node):
+        if node is not None:
+            yield from inorder(node.left_child)
+            yield node.key
+            yield from inorder(node.right_child)
+
+    yield from inorder(treap.get_root_node())
+
+
+def best_of(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Return the fastest of `repeat` timed calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(f"{'n':>9} {'recursive (s)':>14} {'successor (s)':>14} {'speedup':>8}")
+    for n in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        treap = TreapMap.from_sorted(((i, i) for i in range(n)), seed=0)
+        old = best_of(lambda: sum(1 for _ in recursive_keys(treap)))
+        new = best_of(lambda: sum(1 for _ in treap))
+        print(f"{n:>9} {old:>14.4f} {new:>14.4f} {old / new:>7.2f}x")
+
+    # A degenerate path (priorities falling with the key) is as deep as it is long
+    depth = sys.getrecursionlimit() * 2
+    path = TreapMap.from_sorted(((i, i) for i in range(depth)), priority_source=lambda key: -key)
+    try:
+        sum(1 for _ in recursive_keys(path))
+        outcome = "ok"
+    except RecursionError:
+        outcome = "RecursionError"
+    print(f"\npath of depth {depth}: recursive -> {outcome}, successor -> {sum(1 for _ in path)} keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Time the parallel builders against building in a single process.
+
+For each size the benchmark times `TreapMap.from_items`, then splits
+`parallel_build` into its worker part (partitioning, sorting and shape
+building, run in this process so it can be timed alone) and the
+parent's `_stitch`, which creates the TreapNode objects. It also times
+`TreapArena` built by repeated inserts and by `parallel_build_arena`
+end to end. The worker part divides over the cores; the stitch does not.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parallel
+"""
+
+from __future__ import annotations
+import os
+import random
+import time
+from typing import Any, Callable
+
+from py_treaps import parallel
+from py_treaps.treap_arena import TreapArena
+from py_treaps.treap_map import TreapMap
+
+SIZES = (10 ** 4, 10 ** 5, 3 * 10 ** 5)
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    """Return the wall-clock time of one call of `fn`."""
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    workers = os.cpu_count() or 1
+    print(f"{workers} CPU(s)")
+    print(f"{'n':>8} {'from_items':>11} {'workers':>8} {'stitch':>8} {'arena ins':>10} {'arena par':>10}")
+    for n in SIZES:
+        rng = random.Random(n)
+        pairs = [(k, k) for k in rng.sample(range(10 * n), n)]
+        from_items = timed(lambda: TreapMap.from_items(pairs, seed=1))
+
+        # The worker part, run serially: its share of the wall time shrinks with the core count
+        start = time.perf_counter()
+        parts = parallel._partition(list(pairs), workers, random.Random(1))
+        encoded = [parallel._build_chunk((part, i)) for i, part in enumerate(parts)]
+        worker_part = time.perf_counter() - start
+        stitch = timed(lambda: parallel._stitch(encoded, TreapMap(seed=1)))
+
+        def insert_all() -> None:
+            arena: TreapArena = TreapArena(seed=1)
+            for k, v in pairs:
+                arena.insert(k, v)
+
+        arena_insert = timed(insert_all)
+        arena_parallel = timed(lambda: parallel.parallel_build_arena(pairs, workers=workers, seed=1))
+        print(
+            f"{n:>8} {from_items:>10.3f}s {worker_part:>7.3f}s {stitch:>7.3f}s"
+            f" {arena_insert:>9.3f}s {arena_parallel:>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
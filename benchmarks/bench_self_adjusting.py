@@ -0,0 +1,77 @@
+"""
+Compare the search paths of plain and self-adjusting TreapMaps under skewed lookups.
+
+Both maps hold the same keys with the same initial priorities. A
+warm-up stream of Zipf-distributed lookups is run on each, then a
+second stream from the same distribution is timed, and the mean path
+length (the number of nodes visited by a lookup, i.e. depth + 1) is
+measured over that second stream. In the self-adjusting map the hot
+keys have floated toward the root by then, while the plain map keeps
+them at random depths.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_self_adjusting
+"""
+
+from __future__ import annotations
+import itertools
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.bench_suite import ZIPF_EXPONENT, height
+from py_treaps.treap_map import TreapMap
+
+SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+
+# Lookups per stream, as a multiple of the number of keys
+STREAM_FACTOR = 5
+
+
+def zipf_stream(by_popularity: List[Any], length: int, rng: random.Random) -> List[Any]:
+    """Return `length` keys, drawing the key of popularity rank r with weight 1 / r^s."""
+    weights = list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(by_popularity) + 1)))
+    return rng.choices(by_popularity, cum_weights=weights, k=length)
+
+
+def depths(treap: TreapMap) -> Dict[Any, int]:
+    """Return the depth of every key, the root being at depth 0."""
+    result = {}
+    stack = [(treap.get_root_node(), 0)] if treap.get_root_node() is not None else []
+    while stack:
+        node, depth = stack.pop()
+        result[node.key] = depth
+        for child in (node.left_child, node.right_child):
+            if child is not None:
+                stack.append((child, depth + 1))
+    return result
+
+
+def main() -> None:
+    print(f"{'n':>8} {'mode':>14} {'mean path':>10} {'height':>7} {'kops/s':>8}")
+    for n in SIZES:
+        rng = random.Random(n)
+        keys = list(range(n))
+        # Hot keys are scattered over the key range
+        by_popularity = rng.sample(keys, n)
+        warm_up = zipf_stream(by_popularity, STREAM_FACTOR * n, rng)
+        measured = zipf_stream(by_popularity, STREAM_FACTOR * n, rng)
+        for mode, self_adjusting in (("plain", False), ("self-adjusting", True)):
+            treap: TreapMap = TreapMap(seed=1, self_adjusting=self_adjusting)
+            for k in keys:
+                treap.insert(k, k)
+            for k in warm_up:
+                treap.lookup(k)
+            # Path lengths are read off the shape the measured stream starts from
+            depth = depths(treap)
+            mean_path = sum(depth[k] + 1 for k in measured) / len(measured)
+            start = time.perf_counter()
+            for k in measured:
+                treap.lookup(k)
+            elapsed = time.perf_counter() - start
+            print(f"{n:>8} {mode:>14} {mean_path:>10.2f} {height(treap):>7} {len(measured) / elapsed / 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark split and join, and their use as a range-operation primitive.
+
+`sentinel_round_trip` reproduces the old approach: insert the threshold
+with an infinite priority so it rotates to the root, cut off its two
+subtrees, and later glue them back under a temporary root that is
+removed again. The current `split`/`join` walk one path each and
+allocate no nodes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_split_join
+"""
+
+from __future__ import annotations
+import random
+import time
+from typing import Callable
+
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+ROUNDS = 2000
+
+
+def sentinel_round_trip(treap: TreapMap, threshold: int) -> None:
+    """Split and re-join `treap` the old way, around an absent threshold."""
+    treap.insert_priority(threshold, threshold, float("inf"))
+    top = treap.root
+    left, right = top.left_child, top.right_child
+    top.left_child = top.right_child = None
+    # Join: hang both halves under a temporary root, then remove it
+    glue = TreapNode(threshold, None, priority=float("inf"))
+    glue.left_child, glue.right_child = left, right
+    for child in (left, right):
+        if child is not None:
+            child.parent = glue
+    treap._refresh(glue)
+    treap.root = glue
+    treap.remove(threshold)
+
+
+def split_round_trip(treap: TreapMap, threshold: int) -> TreapMap:
+    """Split and re-join `treap` with the current primitives."""
+    left, right = treap.split(threshold)
+    left.join(right)
+    return left
+
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rng = random.Random(0)
+    print(f"{'n':>9} {'sentinel us/op':>15} {'split+join us/op':>17}")
+    for n in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+        # Even keys only, so odd thresholds are always absent
+        thresholds = [rng.randrange(n) * 2 + 1 for _ in range(ROUNDS)]
+        treap = TreapMap.from_sorted(((i * 2, i) for i in range(n)), seed=1)
+
+        def old():
+            for t in thresholds:
+                sentinel_round_trip(treap, t)
+
+        holder = [TreapMap.from_sorted(((i * 2, i) for i in range(n)), seed=1)]
+
+        def new():
+            for t in thresholds:
+                holder[0] = split_round_trip(holder[0], t)
+
+        old_us = timed(old) / ROUNDS * 1e6
+        new_us = timed(new) / ROUNDS * 1e6
+        print(f"{n:>9} {old_us:>15.2f} {new_us:>17.2f}")
+
+    # Deleting a key range: two splits and a join versus one remove per key
+    n, width = 10 ** 5, 10 ** 4
+    print(f"\ndelete {width} consecutive keys out of {n}:")
+    treap = TreapMap.from_sorted(((i, i) for i in range(n)), seed=2)
+
+    def remove_loop():
+        for k in range(n // 2, n // 2 + width):
+            treap.remove(k)
+
+    print(f"  remove loop      {timed(remove_loop) * 1e3:8.2f} ms")
+    treap = TreapMap.from_sorted(((i, i) for i in range(n)), seed=2)
+
+    def split_delete():
+        low, rest = treap.split(n // 2)
+        _, high = rest.split(n // 2 + width)
+        low.join(high)
+
+    print(f"  split/split/join {timed(split_delete) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
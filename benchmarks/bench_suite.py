@@ -0,0 +1,222 @@
+"""
+Time every TreapMap operation across data sizes and key distributions.
+
+For each distribution and size the suite measures the throughput of
+insert, lookup, remove, split, join, meld and iteration, the peak
+memory of building the map (with `tracemalloc`, in a separate untimed
+run since tracing slows Python down several times), and the height of
+the built treap. Results are printed as a table and written as JSON;
+`--compare` checks a run against an earlier JSON file and lists the
+operations that got slower.
+
+Distributions:
+
+    sequential  keys 0, 1, 2, ... in order
+    random      distinct random ints
+    zipf        ints drawn from a Zipf(1.1) distribution, so a few hot
+                keys repeat often (repeated inserts update in place)
+    string      random fixed-length str keys
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --sizes 1000 10000 --output new.json --compare old.json
+"""
+
+from __future__ import annotations
+import argparse
+import gc
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from py_treaps.treap_map import TreapMap
+
+SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+DISTRIBUTIONS = ("sequential", "random", "zipf", "string")
+OPERATIONS = ("insert", "lookup", "iterate", "split", "join", "meld", "remove")
+
+# Number of split/join round trips timed per configuration
+SPLIT_ROUNDS = 200
+
+# Slowdown, as a ratio of ops/s, reported as a regression by --compare
+REGRESSION_RATIO = 0.9
+
+ZIPF_EXPONENT = 1.1
+
+
+def make_keys(distribution: str, n: int, rng: random.Random) -> List[Any]:
+    """Return n keys from a distribution, in insertion order."""
+    if distribution == "sequential":
+        return list(range(n))
+    if distribution == "random":
+        return rng.sample(range(n * 10), n)
+    if distribution == "zipf":
+        # Rank r is drawn with weight 1 / r^s; ranks are scattered over the key space
+        weights = list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, n + 1)))
+        scattered = rng.sample(range(n * 10), n)
+        return [scattered[r] for r in rng.choices(range(n), cum_weights=weights, k=n)]
+    if distribution == "string":
+        return [f"{rng.getrandbits(64):016x}" for _ in range(n)]
+    raise ValueError(f"unknown distribution {distribution!r}")
+
+
+def height(treap: TreapMap) -> int:
+    """Return the number of nodes on the longest root-to-leaf path."""
+    deepest = 0
+    stack = [(treap.get_root_node(), 1)] if treap.get_root_node() is not None else []
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        for child in (node.left_child, node.right_child):
+            if child is not None:
+                stack.append((child, depth + 1))
+    return deepest
+
+
+def timed(fn: Callable[[], object]) -> float:
+    """Return the wall time of one call, with the garbage collector paused."""
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def build(keys: List[Any], seed: int) -> TreapMap:
+    # The priority seed must differ from the key seed: two generators on one seed would
+    # hand out random string keys in the same order as their priorities, giving a path
+    treap: TreapMap = TreapMap(seed=seed)
+    for k in keys:
+        treap.insert(k, k)
+    return treap
+
+
+def peak_memory(keys: List[Any], seed: int) -> int:
+    """Return the peak traced allocation, in bytes, of building a map of keys."""
+    tracemalloc.start()
+    try:
+        treap = build(keys, seed)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del treap
+    return peak
+
+
+def run_one(distribution: str, n: int, seed: int) -> Dict[str, Any]:
+    """Benchmark every operation for one distribution and size."""
+    rng = random.Random(seed)
+    keys = make_keys(distribution, n, rng)
+    probes = keys[:]
+    rng.shuffle(probes)
+    rates: Dict[str, float] = {}
+
+    treap: Optional[TreapMap] = None
+
+    def insert() -> None:
+        nonlocal treap
+        treap = build(keys, seed + 1)
+
+    rates["insert"] = n / timed(insert)
+    size = len(treap)
+    rates["lookup"] = n / timed(lambda: [treap.lookup(k) for k in probes])
+    rates["iterate"] = size / timed(lambda: sum(1 for _ in treap))
+
+    # Split at random keys and join the parts back, so each round starts from the same map
+    thresholds = [rng.choice(keys) for _ in range(SPLIT_ROUNDS)]
+    split_time = join_time = 0.0
+    for threshold in thresholds:
+        start = time.perf_counter()
+        left, right = treap.split(threshold)
+        split_time += time.perf_counter() - start
+        start = time.perf_counter()
+        left.join(right)
+        join_time += time.perf_counter() - start
+        treap = left
+    rates["split"] = SPLIT_ROUNDS / split_time
+    rates["join"] = SPLIT_ROUNDS / join_time
+
+    # Meld two maps with interleaved halves of the keys
+    evens = TreapMap.from_items(((k, k) for k in keys[0::2]), seed=seed + 2)
+    odds = TreapMap.from_items(((k, k) for k in keys[1::2]), seed=seed + 3)
+    meld_size = len(evens) + len(odds)
+    rates["meld"] = meld_size / timed(lambda: evens.meld(odds))
+
+    shape_height = height(treap)
+    rates["remove"] = n / timed(lambda: [treap.remove(k) for k in probes])
+    return {
+        "distribution": distribution,
+        "n": n,
+        "distinct_keys": size,
+        "height": shape_height,
+        "peak_memory_bytes": peak_memory(keys, seed + 1),
+        "ops_per_second": rates,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> List[str]:
+    """Return a line for each operation that is slower than in the baseline run."""
+    with open(baseline_path) as fp:
+        baseline = {(r["distribution"], r["n"]): r for r in json.load(fp)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get((result["distribution"], result["n"]))
+        if old is None:
+            continue
+        for op, rate in result["ops_per_second"].items():
+            old_rate = old["ops_per_second"].get(op)
+            if old_rate and rate < old_rate * REGRESSION_RATIO:
+                regressions.append(
+                    f"{result['distribution']:>10} n={result['n']:<8} {op:<8} "
+                    f"{old_rate:>12.0f} -> {rate:>12.0f} ops/s ({rate / old_rate:.2f}x)"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file of an earlier run")
+    args = parser.parse_args(argv)
+
+    print(f"{'distribution':>12} {'n':>8} {'height':>6} {'peak MB':>8} " + " ".join(f"{op:>8}" for op in OPERATIONS))
+    print(f"{'':>38}(kops/s)")
+    results = []
+    for distribution in args.distributions:
+        for n in args.sizes:
+            result = run_one(distribution, n, args.seed)
+            results.append(result)
+            rates = result["ops_per_second"]
+            print(
+                f"{distribution:>12} {n:>8} {result['height']:>6} {result['peak_memory_bytes'] / 2 ** 20:>8.1f} "
+                + " ".join(f"{rates[op] / 1000:>8.1f}" for op in OPERATIONS)
+            )
+
+    with open(args.output, "w") as fp:
+        json.dump(
+            {"python": sys.version.split()[0], "platform": platform.platform(), "seed": args.seed, "results": results},
+            fp,
+            indent=2,
+        )
+    print(f"wrote {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        print(f"{len(regressions)} regression(s) below {REGRESSION_RATIO:.0%} of {args.compare}")
+        for line in regressions:
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+This module contains ConcurrentTreapMap, a thread-safe Treap wrapper.
+
+Rotations rewrite several pointers one after another, so a thread
+reading a TreapMap while another thread updates it can see a torn tree.
+ConcurrentTreapMap guards an inner Treap with a readers-writer lock:
+any number of readers, or one writer.
+
+With `lock_free_reads=True` the inner Treap is a PersistentTreapMap.
+After every write section the current version is published as an
+immutable snapshot, and readers use the latest published snapshot
+without taking any lock.
+
+"""
+
+from __future__ import annotations
+import threading
+import typing
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from py_treaps.persistent_treap import PersistentTreapMap
+from py_treaps.treap import KT, VT, Treap
+from py_treaps.treap_map import TreapMap
+
+
+class ReadWriteLock:
+    """A readers-writer lock that prefers waiting writers.
+
+    New readers wait while a writer is waiting, so a steady stream of
+    readers cannot starve writers. The lock is not reentrant.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+
+    def release_write(self) -> None:
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self) -> Iterator[None]:
+        """Hold the lock as a reader for the duration of a `with` block."""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self) -> Iterator[None]:
+        """Hold the lock as the writer for the duration of a `with` block."""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentTreapMap(Treap[KT, VT]):
+    """A Treap that can be shared between threads.
+
+    Every method takes the lock it needs, so each call is atomic.
+    `write_batch()` runs several updates in one write section.
+    """
+
+    def __init__(self, treap: Optional[Treap[KT, VT]] = None, lock_free_reads: bool = False):
+        """
+        Args:
+            treap: The Treap to guard. Defaults to a new TreapMap, or a new
+                PersistentTreapMap with `lock_free_reads`. Callers must not
+                use it directly afterwards.
+            lock_free_reads: Serve reads from published immutable snapshots
+                without locking. Requires a PersistentTreapMap.
+
+        Raises:
+            TypeError: If `lock_free_reads` is set and `treap` is not a
+                PersistentTreapMap.
+        """
+        if treap is None:
+            treap = PersistentTreapMap() if lock_free_reads else TreapMap()
+        if lock_free_reads and not isinstance(treap, PersistentTreapMap):
+            raise TypeError("lock_free_reads requires a PersistentTreapMap")
+        self._treap = treap
+        self._lock = ReadWriteLock()
+        self._lock_free_reads = lock_free_reads
+        self._published: Optional[PersistentTreapMap[KT, VT]] = None
+        self._publish()
+
+    def _publish(self) -> None:
+        """Make the current version visible to lock-free readers.
+
+        Rebinding one attribute is atomic, so readers see either the old
+        snapshot or the new one, never a mix.
+        """
+        if self._lock_free_reads:
+            self._published = self._treap.snapshot()
+
+    @contextmanager
+    def _writing(self) -> Iterator[Treap[KT, VT]]:
+        """Hold the write lock, then publish the result."""
+        with self._lock.write_locked():
+            try:
+                yield self._treap
+            finally:
+                self._publish()
+
+    @contextmanager
+    def _reading(self) -> Iterator[Treap[KT, VT]]:
+        """Give access to a consistent version: the published snapshot, or the inner Treap under the read lock."""
+        if self._lock_free_reads:
+            yield self._published
+        else:
+            with self._lock.read_locked():
+                yield self._treap
+
+    @contextmanager
+    def write_batch(self) -> Iterator[Treap[KT, VT]]:
+        """Run several updates in one write section.
+
+        The inner Treap is yielded for the duration of the `with` block.
+        Lock-free readers see none of the updates until the block ends.
+
+        Example
+        -------
+        ```
+        with shared.write_batch() as treap:
+            for key, value in pairs:
+                treap.insert(key, value)
+        ```
+        """
+        with self._writing() as treap:
+            yield treap
+
+    def _lookup_writes(self) -> bool:
+        """Tell whether lookups must exclude each other.
+
+        Asked on every lookup, since counters and instrumentation can be
+        switched on after the inner TreapMap was handed over.
+        """
+        # Lookups that rotate the tree or update fingers, a cache or statistics
+        treap = self._treap
+        return isinstance(treap, TreapMap) and treap._lookup_mutates()
+
+    def snapshot(self) -> Treap[KT, VT]:
+        """Return an immutable view of the current contents.
+
+        O(1) with `lock_free_reads`. Otherwise it is taken under the read
+        lock: O(1) if the inner Treap has a `snapshot` method, like
+        PersistentTreapMap, and an O(n) `copy` for a TreapMap or a
+        TreapArena.
+        """
+        if self._lock_free_reads:
+            # A version of its own, so updating it cannot reach other readers
+            return self._published.snapshot()
+        with self._lock.read_locked():
+            # Persistent maps share structure with their snapshots instead of copying
+            snapshot = getattr(self._treap, "snapshot", None)
+            return snapshot() if snapshot is not None else self._treap.copy()
+
+    def get_root_node(self):
+        """Return the root node of the current version.
+
+        Without `lock_free_reads` the node can be changed by later writes.
+        """
+        with self._reading() as treap:
+            return treap.get_root_node()
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        """Retrieve the value associated with a key in this Treap.
+
+        Takes the write lock if the inner TreapMap's lookups change its
+        state (`self_adjusting`, `fingers`, `cache_size`, counters or
+        latency histograms), and the read lock otherwise.
+        """
+        if self._lookup_writes():
+            # Only a PersistentTreapMap publishes snapshots, so nothing needs publishing here
+            with self._lock.write_locked():
+                return self._treap.lookup(key)
+        with self._reading() as treap:
+            return treap.lookup(key)
+
+    def insert(self, key: KT, value: VT) -> None:
+        """Add a key-value pair to this Treap."""
+        with self._writing() as treap:
+            treap.insert(key, value)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        """Remove a key from this Treap and return its value."""
+        with self._writing() as treap:
+            return treap.remove(key)
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        """Split this Treap into two ConcurrentTreapMaps around `threshold`.
+
+        Uses the inner Treap's split, so a TreapMap is left empty and a
+        PersistentTreapMap is left unchanged.
+        """
+        with self._writing() as treap:
+            parts = treap.split(threshold)
+        return [ConcurrentTreapMap(part, self._lock_free_reads) for part in parts]
+
+    def join(self, other: Treap[KT, VT]) -> None:
+        """Join this Treap with another Treap whose keys are all larger."""
+        self._combine("join", other)
+
+    def meld(self, other: Treap[KT, VT]) -> None:
+        """Meld another Treap into this Treap; see the inner Treap's `meld`."""
+        self._combine("meld", other)
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        """Remove the keys of another Treap from this Treap."""
+        self._combine("difference", other)
+
+    def _combine(self, method: str, other: Treap[KT, VT]) -> None:
+        """Apply a two-treap method, write-locking both wrappers in a fixed order."""
+        if not isinstance(other, ConcurrentTreapMap):
+            with self._writing() as treap:
+                getattr(treap, method)(other)
+            return
+        if other is self:
+            raise ValueError(f"cannot {method} a ConcurrentTreapMap with itself")
+        # Lock by id so two threads combining the same pair cannot deadlock
+        first, second = sorted((self, other), key=id)
+        with first._writing(), second._writing():
+            getattr(self._treap, method)(other._treap)
+
+    def balance_factor(self) -> float:
+        with self._reading() as treap:
+            return treap.balance_factor()
+
+    def __len__(self) -> int:
+        with self._reading() as treap:
+            return len(treap)
+
+    def __str__(self) -> str:
+        with self._reading() as treap:
+            return str(treap)
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        """Return an iterator over the keys of one consistent version.
+
+        With `lock_free_reads` this walks the published snapshot lazily;
+        otherwise the keys are copied out under the read lock first.
+        """
+        if self._lock_free_reads:
+            return iter(self._published)
+        with self._lock.read_locked():
+            return iter(list(self._treap))
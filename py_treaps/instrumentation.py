@@ -0,0 +1,70 @@
+"""
+This module contains the latency histograms used by `TreapMap.instrument`.
+
+Timings are kept in log-scaled buckets: bucket b counts the operations
+that took between 2^(b-1) and 2^b nanoseconds. Recording is one integer
+`bit_length` and one list increment, and percentiles are read off the
+bucket counts with at most a factor of two of error.
+
+"""
+
+from __future__ import annotations
+from typing import List
+
+
+class LatencyHistogram:
+    """Log2-bucketed histogram of operation durations.
+
+    Attributes:
+        count (int): The number of recorded operations.
+        total_ns (int): The sum of the recorded durations.
+        max_ns (int): The longest recorded duration.
+        buckets (List[int]): Entry b counts durations with bit length b.
+    """
+
+    __slots__ = ("count", "total_ns", "max_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        # 2^64 ns is over 500 years, so 65 buckets always suffice
+        self.buckets: List[int] = [0] * 65
+
+    def record(self, duration_ns: int) -> None:
+        """Add one operation that took `duration_ns` nanoseconds."""
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[duration_ns.bit_length()] += 1
+
+    def percentile(self, p: float) -> int:
+        """Return an upper bound, in nanoseconds, on the p-th percentile duration.
+
+        Args:
+            p: The percentile, between 0 and 100.
+
+        Returns:
+            The upper edge of the bucket holding the percentile, capped
+            at the longest recorded duration; 0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for b, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min((1 << b) - 1, self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict:
+        """Return the count, mean, p50, p99 and max, in nanoseconds."""
+        return {
+            "count": self.count,
+            "mean_ns": self.total_ns / self.count if self.count else 0.0,
+            "p50_ns": self.percentile(50),
+            "p99_ns": self.percentile(99),
+            "max_ns": self.max_ns,
+        }
@@ -0,0 +1,415 @@
+"""
+This module contains MappedTreap, a read-only Treap backed by a file.
+
+`write_mapped` stores a Treap as a node array in sorted key order: the
+node at index i holds the i-th smallest key, and its children are
+stored as indices into the same array. Every column has a fixed width
+(or, for str and bytes, a fixed-width offset into one blob), so a
+MappedTreap reads nodes straight out of an `mmap` of the file and the
+operating system only pages in the parts of the file that are touched.
+
+Because of the sorted layout, the index of a node is its rank: `rank`
+and range queries descend the treap once and then scan the columns
+sequentially, and `select` is a single array access.
+
+"""
+
+from __future__ import annotations
+import mmap
+import struct
+import typing
+from array import array
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple
+
+from py_treaps.serialization import (
+    _BYTES, _FLOAT64, _INT64, _PRIORITY_TYPECODES, _STR, _aligned, _codec_for, _packed, _priority_codec_for,
+    _read_packed, _write, _write_column,
+)
+from py_treaps.treap import KT, VT, Treap
+
+MAGIC = b"TRPM"
+VERSION = 1
+
+# magic, version, key codec, value codec, priority codec, node count, root index
+_HEADER = struct.Struct("<4sBBBBQq")
+
+# Index used for a missing child
+NIL = -1
+
+
+def write_mapped(treap: Treap[KT, VT], fp: BinaryIO) -> None:
+    """Write a Treap in the file format read by MappedTreap.
+
+    The shape and priorities of the treap are kept as they are.
+
+    Args:
+        treap: The Treap to write. It is not modified.
+        fp: A file object opened for binary writing.
+
+    Raises:
+        TypeError: If the keys or values are not all ints fitting in
+            64 bits, all floats, all str or all bytes, or if the treap
+            is ordered by a key_func, which MappedTreap cannot apply;
+            or if the priorities are not all ints or all floats.
+        ValueError: If an int priority does not fit in 64 bits.
+    """
+    if getattr(treap, "_key_func", None) is not None:
+        raise TypeError("write_mapped cannot write a TreapMap ordered by a key_func")
+    # Part 0) Tombstones of a lazy-delete TreapMap are not written; drop them from a copy
+    if getattr(treap, "_dead", 0):
+        treap = treap.copy()
+        treap.compact()
+    # Part 1) List the nodes in sorted order; a node's position is its index in the file
+    nodes: List[Any] = []
+    stack: List[Any] = []
+    current = treap.get_root_node()
+    while stack or current is not None:
+        while current is not None:
+            stack.append(current)
+            current = current.left_child
+        current = stack.pop()
+        nodes.append(current)
+        current = current.right_child
+    index = {id(node): i for i, node in enumerate(nodes)}
+
+    # Part 2) Check that both columns have a fixed-width encoding
+    keys = [node.key for node in nodes]
+    values = [node.value for node in nodes]
+    key_codec, value_codec = _codec_for(keys), _codec_for(values)
+    if key_codec not in (_INT64, _FLOAT64, _STR, _BYTES) or value_codec not in (_INT64, _FLOAT64, _STR, _BYTES):
+        raise TypeError("MappedTreap keys and values must be all int, all float, all str or all bytes")
+
+    priorities = [node.priority for node in nodes]
+    priority_codec = _priority_codec_for(priorities)
+
+    # Part 3) Write the header and the columns, each padded to 8 bytes
+    root = treap.get_root_node()
+    header = (MAGIC, VERSION, key_codec, value_codec, priority_codec, len(nodes), index[id(root)] if nodes else NIL)
+    _write(fp, _HEADER.pack(*header))
+    _write_column(fp, key_codec, keys)
+    _write_column(fp, value_codec, values)
+    _write(fp, _packed(array(_PRIORITY_TYPECODES[priority_codec], priorities)))
+    _write(fp, _packed(array("q", (NIL if node.left_child is None else index[id(node.left_child)] for node in nodes))))
+    _write(fp, _packed(array("q", (NIL if node.right_child is None else index[id(node.right_child)] for node in nodes))))
+
+
+class _BlobColumn:
+    """A lazily decoded column of str or bytes: n + 1 offsets into one blob."""
+
+    __slots__ = ("offsets", "blob", "decode")
+
+    def __init__(self, offsets: Any, blob: memoryview, decode: Callable[[memoryview], Any]):
+        self.offsets = offsets
+        self.blob = blob
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Any:
+        return self.decode(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+
+class MappedNode:
+    """A read-only view of one node of a MappedTreap.
+
+    The view has no `parent`: the file only stores child links.
+    """
+
+    __slots__ = ("_treap", "index")
+
+    def __init__(self, treap: MappedTreap, index: int):
+        self._treap = treap
+        self.index = index
+
+    def _view(self, i: int) -> Optional[MappedNode]:
+        return None if i == NIL else MappedNode(self._treap, i)
+
+    @property
+    def key(self) -> Any:
+        return self._treap._keys[self.index]
+
+    @property
+    def value(self) -> Any:
+        return self._treap._values[self.index]
+
+    @property
+    def priority(self) -> int:
+        return self._treap._priorities[self.index]
+
+    @property
+    def left_child(self) -> Optional[MappedNode]:
+        return self._view(self._treap._left[self.index])
+
+    @property
+    def right_child(self) -> Optional[MappedNode]:
+        return self._view(self._treap._right[self.index])
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MappedNode) and other._treap is self._treap and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self._treap), self.index))
+
+
+class MappedTreap(Treap[KT, VT]):
+    """A read-only Treap reading its nodes from a memory-mapped file.
+
+    Use it as a context manager, or call `close()`, to unmap the file.
+    The methods that would modify the treap raise AttributeError.
+
+    Example
+    -------
+    ```
+    with open(path, "wb") as fp:
+        write_mapped(treap, fp)
+    with MappedTreap(path) as mapped:
+        mapped.lookup(key)
+    ```
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: The file written by `write_mapped`.
+
+        Raises:
+            ValueError: If the file is not in this format.
+        """
+        with open(path, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise ValueError("truncated MappedTreap file")
+        magic, version, key_codec, value_codec, priority_codec, n, root = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION or priority_codec >= len(_PRIORITY_TYPECODES):
+            self.close()
+            raise ValueError("not a MappedTreap file, or an unsupported version")
+
+        # Every column is a view of the mapping; nothing is read until it is indexed
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self._keys, offset = self._column(view, offset, key_codec, n)
+        self._values, offset = self._column(view, offset, value_codec, n)
+        self._priorities, offset = _read_packed(view, offset, _PRIORITY_TYPECODES[priority_codec], n)
+        self._left, offset = _read_packed(view, offset, "q", n)
+        self._right, offset = _read_packed(view, offset, "q", n)
+        self._size = n
+        self._root = root
+
+    @staticmethod
+    def _column(view: memoryview, offset: int, codec: int, count: int) -> Tuple[Any, int]:
+        """Return an indexable view of the column at offset, and the offset after it."""
+        if codec == _INT64:
+            return _read_packed(view, offset, "q", count)
+        if codec == _FLOAT64:
+            return _read_packed(view, offset, "d", count)
+        offsets, start = _read_packed(view, offset, "Q", count + 1)
+        blob = view[start:start + offsets[count]]
+        decode: Callable[[memoryview], Any] = (lambda b: str(b, "utf-8")) if codec == _STR else bytes
+        return _BlobColumn(offsets, blob, decode), _aligned(start + len(blob))
+
+    def close(self) -> None:
+        """Release the column views and unmap the file."""
+        for name in ("_keys", "_values", "_priorities", "_left", "_right"):
+            column = self.__dict__.pop(name, None)
+            # Byte-swapped columns on big-endian machines are arrays and hold no view
+            for part in (column.offsets, column.blob) if isinstance(column, _BlobColumn) else (column,):
+                if isinstance(part, memoryview):
+                    part.release()
+        self._mmap.close()
+
+    def __enter__(self) -> MappedTreap[KT, VT]:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def get_root_node(self) -> Optional[MappedNode]:
+        """Return a view of the root node, or None if the Treap is empty."""
+        return None if self._root == NIL else MappedNode(self, self._root)
+
+    def _find(self, key: KT) -> int:
+        """Return the index of key, or NIL if it is missing."""
+        keys, left, right = self._keys, self._left, self._right
+        i = self._root
+        while i != NIL:
+            current = keys[i]
+            if key < current:
+                i = left[i]
+            elif current < key:
+                i = right[i]
+            else:
+                return i
+        return NIL
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        """Retrieve the value associated with a key in this Treap.
+
+        Args:
+            key: The key whose associated value should be retrieved.
+
+        Returns:
+            The value associated with the key, or `None` if the key
+            is not in this Treap.
+        """
+        i = self._find(key)
+        return None if i == NIL else self._values[i]
+
+    def _bound(self, key: KT, inclusive: bool) -> int:
+        """Count the keys smaller than `key`, or not larger if `inclusive`."""
+        keys, left, right = self._keys, self._left, self._right
+        result = 0
+        i = self._root
+        while i != NIL:
+            current = keys[i]
+            if current < key or (inclusive and not key < current):
+                # Everything up to this index is before key
+                result = i + 1
+                i = right[i]
+            else:
+                i = left[i]
+        return result
+
+    def rank(self, key: KT) -> int:
+        """Return the number of keys smaller than `key` in O(log n).
+
+        Args:
+            key: The key to rank.
+        """
+        return self._bound(key, False)
+
+    def select(self, k: int) -> KT:
+        """Return the key with zero-based rank k in O(1).
+
+        Args:
+            k: The rank; negative values count from the largest key.
+
+        Raises:
+            IndexError: If k is out of range.
+        """
+        if k < 0:
+            k += self._size
+        if not 0 <= k < self._size:
+            raise IndexError("select index out of range")
+        return self._keys[k]
+
+    def _span(self, lo: Optional[KT], hi: Optional[KT], inclusive: Tuple[bool, bool]) -> range:
+        """Return the indices of the keys between `lo` and `hi`."""
+        start = 0 if lo is None else self._bound(lo, not inclusive[0])
+        stop = self._size if hi is None else self._bound(hi, inclusive[1])
+        return range(start, max(start, stop))
+
+    def irange(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+        reverse: bool = False,
+    ) -> typing.Iterator[KT]:
+        """Iterate over the keys between `lo` and `hi` in sorted order.
+
+        Takes the same arguments as `TreapMap.irange`. After one descent
+        to each bound the keys are read sequentially from the file.
+        """
+        span = self._span(lo, hi, inclusive)
+        keys = self._keys
+        for i in reversed(span) if reverse else span:
+            yield keys[i]
+
+    def items_range(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+        reverse: bool = False,
+    ) -> typing.Iterator[Tuple[KT, VT]]:
+        """Iterate over the (key, value) pairs between `lo` and `hi`.
+
+        Takes the same arguments as `irange`.
+        """
+        span = self._span(lo, hi, inclusive)
+        keys, values = self._keys, self._values
+        for i in reversed(span) if reverse else span:
+            yield keys[i], values[i]
+
+    def count_range(
+        self, lo: Optional[KT] = None, hi: Optional[KT] = None, inclusive: Tuple[bool, bool] = (True, False)
+    ) -> int:
+        """Count the keys between `lo` and `hi` in O(log n)."""
+        return len(self._span(lo, hi, inclusive))
+
+    def insert(self, key: KT, value: VT) -> None:
+        raise AttributeError
+
+    def remove(self, key: KT) -> Optional[VT]:
+        raise AttributeError
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        raise AttributeError
+
+    def join(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def meld(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def balance_factor(self) -> float:
+        raise AttributeError
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __str__(self) -> str:
+        """Build a human-readable representation of this Treap.
+
+        Uses the same pre-order layout as `TreapMap.__str__`.
+        """
+        if self._root == NIL:
+            return "<empty treap>"
+        keys, values, priorities, left, right = self._keys, self._values, self._priorities, self._left, self._right
+        result = []
+        # Explicit stack of (index, prefix) in pre-order; NIL entries print as empty slots
+        stack = [(self._root, "")]
+        while stack:
+            i, prefix = stack.pop()
+            if i == NIL:
+                result.append(f"{prefix}<empty>")
+                continue
+            result.append(f"{prefix}[{priorities[i]}]<{keys[i]}, {values[i]}>")
+            if left[i] != NIL or right[i] != NIL:
+                stack.append((right[i], prefix + "R---"))
+                stack.append((left[i], prefix + "L---"))
+        return "\n".join(result)
+
+    def keys(self) -> typing.Iterator[KT]:
+        """Iterate over the keys in sorted order."""
+        return iter(self)
+
+    def values(self) -> typing.Iterator[VT]:
+        """Iterate over the values in key order."""
+        values = self._values
+        for i in range(self._size):
+            yield values[i]
+
+    def items(self) -> typing.Iterator[Tuple[KT, VT]]:
+        """Iterate over the (key, value) pairs in key order."""
+        return self.items_range()
+
+    def __reversed__(self) -> typing.Iterator[KT]:
+        keys = self._keys
+        for i in range(self._size - 1, -1, -1):
+            yield keys[i]
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        """Return a new iterator over the keys in sorted order.
+
+        The keys are stored in sorted order, so this is a sequential
+        scan of the key column.
+        """
+        keys = self._keys
+        for i in range(self._size):
+            yield keys[i]
@@ -0,0 +1,49 @@
+"""
+This module contains the Monoid type used for TreapMap range aggregates.
+
+A TreapMap created with a monoid caches, on every node, the combination
+of the projected values in its subtree. `TreapMap.aggregate(lo, hi)`
+then combines O(log n) cached values instead of scanning the range.
+
+"""
+
+from __future__ import annotations
+import math
+import operator
+from typing import Any, Callable
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class Monoid:
+    """An associative combine function with an identity element.
+
+    `combine` does not need to be commutative: values are always
+    combined in key order.
+
+    Attributes:
+        identity: The neutral element, returned for an empty range.
+        combine: Associative function of two aggregates.
+        project: Maps a stored value to the aggregate of that one entry.
+    """
+
+    __slots__ = ("identity", "combine", "project")
+
+    def __init__(
+        self,
+        identity: Any,
+        combine: Callable[[Any, Any], Any],
+        project: Callable[[Any], Any] = _identity,
+    ):
+        self.identity = identity
+        self.combine = combine
+        self.project = project
+
+
+# Common monoids over numeric values
+SUM = Monoid(0, operator.add)
+MIN = Monoid(math.inf, min)
+MAX = Monoid(-math.inf, max)
+COUNT = Monoid(0, operator.add, lambda value: 1)
@@ -0,0 +1,346 @@
+"""
+This module contains multi-process builders for large treaps.
+
+The input is range-partitioned into chunks of consecutive keys. Each
+chunk is sorted and turned into a Cartesian tree shape in a worker
+process. The worker returns compact array encodings (keys, values,
+priority and child-index arrays) instead of pickled node graphs. The
+parent turns each chunk into a treap without key comparisons and joins
+the chunks in key order.
+
+All priorities are drawn independently from the same 64-bit
+distribution, and `join` merges chunks by priority, so the result is
+an ordinary treap with the heap property holding across chunk borders.
+
+`parallel_build_arena` appends the encodings to the columns of a
+TreapArena almost unchanged, so nearly all of its work runs in the
+workers. `parallel_build` and `parallel_union` return TreapMaps, whose
+TreapNode objects can only be created in the parent, one per key: that
+serial part costs about as much as `TreapMap.from_items` on its own,
+so these two are not faster than building in one process unless the
+keys are costly to sort. `benchmarks/bench_parallel.py` times each part.
+
+"""
+
+from __future__ import annotations
+import os
+import random
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+from py_treaps.priority import RandomPriority
+from py_treaps.treap import KT, VT
+from py_treaps.treap_arena import NIL, TreapArena
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+# (keys, values, priorities, left, right, subtree sizes, root index) of one chunk; see `_encode_sorted`
+Encoded = Tuple[List[Any], List[Any], array, array, array, array, int]
+
+# Number of sampled keys per chunk used to pick the partition boundaries
+_OVERSAMPLE = 64
+
+
+def parallel_build(
+    pairs: Iterable[Tuple[KT, VT]],
+    workers: Optional[int] = None,
+    chunks: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> TreapMap[KT, VT]:
+    """Build a TreapMap from (key, value) pairs using several processes.
+
+    Repeated keys keep their last value, as with `TreapMap.from_items`.
+    The nodes are created in this process, which takes about as long as
+    `from_items`; see the module docstring.
+
+    Args:
+        pairs: The (key, value) pairs to add, in any order. Keys and
+            values must be picklable.
+        workers: Number of worker processes; defaults to the CPU count.
+            With 1 worker everything runs in this process.
+        chunks: Number of key ranges to build separately; defaults to
+            `workers`.
+        seed: Seed for reproducible priorities and partitioning.
+
+    Returns:
+        A new TreapMap containing the pairs.
+    """
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    items = list(pairs)
+    parts = _partition(items, chunks or workers, rng)
+    seeds = [rng.getrandbits(64) for _ in parts]
+    encoded = _run(_build_chunk, list(zip(parts, seeds)), workers)
+    return _stitch(encoded, TreapMap(seed=seed))
+
+
+def parallel_build_arena(
+    pairs: Iterable[Tuple[KT, VT]],
+    workers: Optional[int] = None,
+    chunks: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> TreapArena[KT, VT]:
+    """Build a TreapArena from (key, value) pairs using several processes.
+
+    Like `parallel_build`, but the chunks' columns are appended to the
+    arena's columns as they are, with their child indices shifted, and
+    the chunks are joined along their spines. No per-key objects are
+    created here.
+
+    Args:
+        pairs: The (key, value) pairs to add, in any order. Keys and
+            values must be picklable.
+        workers: Number of worker processes; defaults to the CPU count.
+            With 1 worker everything runs in this process.
+        chunks: Number of key ranges to build separately; defaults to
+            `workers`.
+        seed: Seed for reproducible priorities and partitioning.
+
+    Returns:
+        A new TreapArena containing the pairs.
+    """
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    items = list(pairs)
+    parts = _partition(items, chunks or workers, rng)
+    seeds = [rng.getrandbits(64) for _ in parts]
+    result: TreapArena[KT, VT] = TreapArena(seed=seed)
+    for keys, values, priorities, left, right, _, root in _run(_build_chunk, list(zip(parts, seeds)), workers):
+        if root < 0:
+            continue
+        # Part 1) Append the chunk's columns, shifting its links past the nodes already stored
+        store, offset = result._store, len(result._store.keys)
+        store.keys.extend(keys)
+        store.values.extend(values)
+        store.priorities.extend(priorities)
+        store.left.extend(array("q", (i + offset if i >= 0 else NIL for i in left)))
+        store.right.extend(array("q", (i + offset if i >= 0 else NIL for i in right)))
+        parent = array("q", [NIL]) * len(keys)
+        for i in range(len(keys)):
+            if left[i] >= 0:
+                parent[left[i]] = i + offset
+            if right[i] >= 0:
+                parent[right[i]] = i + offset
+        store.parent.extend(parent)
+
+        # Part 2) Join the chunk, whose keys are all larger, to the arena built so far
+        part = result._empty_like()
+        part._root = root + offset
+        result.join(part)
+    return result
+
+
+def parallel_union(
+    a: TreapMap[KT, VT],
+    b: TreapMap[KT, VT],
+    combine: Union[str, Callable[[VT, VT], VT]] = "right",
+    workers: Optional[int] = None,
+    chunks: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> TreapMap[KT, VT]:
+    """Return a new TreapMap with the keys of either map, using several processes.
+
+    Both maps are read in order and cut at shared key boundaries. Each
+    worker merges its two sorted runs and builds the merged chunk's
+    shape. `a` and `b` are left untouched. The result has the
+    configuration of `a` (monoid, lazy deletion, fingers, ...), with
+    the aggregates recomputed here.
+
+    Args:
+        a: The left operand.
+        b: The right operand.
+        combine: How to resolve a key present in both; see
+            `TreapMap.meld`. A callable must be picklable, e.g. a
+            module-level function.
+        workers: Number of worker processes; defaults to the CPU count.
+        chunks: Number of key ranges; defaults to `workers`.
+        seed: Seed for reproducible priorities.
+
+    Raises:
+        ValueError: If the maps have different monoids or key functions,
+            or are ordered by a key_func: the workers cut, merge and
+            de-duplicate by raw key.
+    """
+    a._check_compatible(b)
+    if a._key_func is not None:
+        raise ValueError("parallel_union does not support maps ordered by a key_func")
+    workers = workers or os.cpu_count() or 1
+    rng = random.Random(seed)
+    a_items, b_items = list(a.items()), list(b.items())
+
+    # Part 1) Cut both sorted runs at the same boundary keys, taken evenly from the larger one
+    count = max(1, chunks or workers)
+    larger = a_items if len(a_items) >= len(b_items) else b_items
+    bounds = sorted({larger[len(larger) * i // count][0] for i in range(1, count)}) if larger else []
+    a_cuts = _cut_points([k for k, _ in a_items], bounds)
+    b_cuts = _cut_points([k for k, _ in b_items], bounds)
+    tasks = [
+        (a_items[a_cuts[i]:a_cuts[i + 1]], b_items[b_cuts[i]:b_cuts[i + 1]], combine, rng.getrandbits(64))
+        for i in range(len(a_cuts) - 1)
+    ]
+
+    # Part 2) Merge and encode the chunks in the workers, then stitch them here
+    return _stitch(_run(_union_chunk, tasks, workers), a._empty_like())
+
+
+def _run(fn: Callable[[Any], Encoded], tasks: List[Any], workers: int) -> List[Encoded]:
+    """Apply `fn` to every task, in a process pool when there is more than one worker."""
+    if workers <= 1 or len(tasks) <= 1:
+        return [fn(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        return list(executor.map(fn, tasks))
+
+
+def _partition(items: List[Tuple[Any, Any]], count: int, rng: random.Random) -> List[List[Tuple[Any, Any]]]:
+    """Split pairs into `count` lists covering consecutive key ranges.
+
+    Equal keys always land in the same list, in their input order.
+    """
+    if count <= 1 or len(items) <= count:
+        return [items]
+    # Part 1) Sorted input -> cut into equal slices, moving each cut past runs of equal keys
+    if all(not items[i][0] < items[i - 1][0] for i in range(1, len(items))):
+        cuts = [0]
+        for i in range(1, count):
+            cut = max(len(items) * i // count, cuts[-1])
+            while 0 < cut < len(items) and not items[cut - 1][0] < items[cut][0]:
+                cut += 1
+            cuts.append(cut)
+        cuts.append(len(items))
+        return [items[cuts[i]:cuts[i + 1]] for i in range(count) if cuts[i] < cuts[i + 1]]
+
+    # Part 2) Unsorted input -> pick boundaries from a sorted sample and bucket each pair
+    sample = sorted(key for key, _ in rng.sample(items, min(len(items), count * _OVERSAMPLE)))
+    bounds = sorted({sample[len(sample) * i // count] for i in range(1, count)})
+    buckets: List[List[Tuple[Any, Any]]] = [[] for _ in range(len(bounds) + 1)]
+    for pair in items:
+        buckets[bisect_right(bounds, pair[0])].append(pair)
+    return [bucket for bucket in buckets if bucket]
+
+
+def _cut_points(keys: Sequence[Any], bounds: Sequence[Any]) -> List[int]:
+    """Return slice boundaries putting keys below each bound before it."""
+    return [0] + [bisect_right(keys, bound) for bound in bounds] + [len(keys)]
+
+
+def _build_chunk(task: Tuple[List[Tuple[Any, Any]], int]) -> Encoded:
+    """Worker: sort one chunk of pairs and encode its treap."""
+    items, seed = task
+    return _encode_sorted(TreapMap._sorted_items(items), seed)
+
+
+def _union_chunk(task: Tuple[List[Tuple[Any, Any]], List[Tuple[Any, Any]], Any, int]) -> Encoded:
+    """Worker: merge two sorted runs of pairs and encode the merged treap."""
+    left, right, combine, seed = task
+    resolve = TreapMap._resolver(combine)
+    merged: List[Tuple[Any, Any]] = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i][0] < right[j][0]:
+            merged.append(left[i])
+            i += 1
+        elif right[j][0] < left[i][0]:
+            merged.append(right[j])
+            j += 1
+        else:
+            merged.append((left[i][0], resolve(left[i][1], right[j][1])))
+            i += 1
+            j += 1
+    merged.extend(left[i:])
+    merged.extend(right[j:])
+    return _encode_sorted(merged, seed)
+
+
+def _encode_sorted(items: List[Tuple[Any, Any]], seed: int) -> Encoded:
+    """Encode the treap of pairs sorted by key as flat arrays.
+
+    Runs the same stack-based Cartesian tree build as
+    `TreapMap.from_sorted`, but on indices, and also computes every
+    subtree size so the parent does not have to. The root index is -1
+    for an empty chunk.
+    """
+    keys: List[Any] = []
+    values: List[Any] = []
+    for key, value in items:
+        # Repeated key -> keep the last value
+        if keys and not keys[-1] < key:
+            values[-1] = value
+            continue
+        keys.append(key)
+        values.append(value)
+
+    draw = RandomPriority(seed)
+    n = len(keys)
+    priorities = array("Q", (draw(key) for key in keys))
+    left = array("q", [-1]) * n
+    right = array("q", [-1]) * n
+    sizes = array("q", [1]) * n
+    spine: List[int] = []
+
+    def finish(i: int) -> None:
+        # Children are finished before their parents
+        if left[i] >= 0:
+            sizes[i] += sizes[left[i]]
+        if right[i] >= 0:
+            sizes[i] += sizes[right[i]]
+
+    for i in range(n):
+        popped = -1
+        while spine and priorities[spine[-1]] < priorities[i]:
+            popped = spine.pop()
+            finish(popped)
+        left[i] = popped
+        if spine:
+            right[spine[-1]] = i
+        spine.append(i)
+    root = spine[0] if spine else -1
+    while spine:
+        finish(spine.pop())
+    return keys, values, priorities, left, right, sizes, root
+
+
+def _decode(treap: TreapMap[KT, VT], encoded: Encoded) -> None:
+    """Materialize an encoded chunk as the nodes of the empty `treap`.
+
+    This is the per-node Python work left in the parent: one TreapNode
+    and a few attribute stores per key, with the sizes copied from the
+    worker's array. Monoid aggregates cannot be computed in the workers,
+    so a map with a monoid refreshes every node bottom-up as well.
+    """
+    keys, values, priorities, left, right, sizes, root = encoded
+    nodes = [TreapNode(key, value, None, priority) for key, value, priority in zip(keys, values, priorities)]
+    for node, l, r, size in zip(nodes, left, right, sizes):
+        node.size = size
+        if l >= 0:
+            child = nodes[l]
+            node.left_child = child
+            child.parent = node
+        if r >= 0:
+            child = nodes[r]
+            node.right_child = child
+            child.parent = node
+    treap.root = nodes[root] if root >= 0 else None
+    if treap._monoid is not None and treap.root is not None:
+        # Reverse preorder visits every child before its parent
+        preorder: List[TreapNode] = []
+        stack = [treap.root]
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            if node.left_child is not None:
+                stack.append(node.left_child)
+            if node.right_child is not None:
+                stack.append(node.right_child)
+        for node in reversed(preorder):
+            treap._refresh(node)
+
+
+def _stitch(encoded: List[Encoded], result: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+    """Decode the chunks and join them in key order into the empty `result`."""
+    for chunk in encoded:
+        part = result._empty_like()
+        _decode(part, chunk)
+        result.join(part)
+    return result
@@ -0,0 +1,277 @@
+"""
+This module contains PersistentTreapMap, a path-copying Treap.
+
+Nodes are never modified once built. `insert`, `remove`, `split` and
+`join` copy only the O(log n) nodes on the paths they touch and share
+every other subtree with the previous version. A version is just a
+root pointer, so `snapshot()` is O(1) and a snapshot keeps seeing the
+same keys no matter what is done to the map afterwards.
+
+In-place rotations need parent pointers, which path copying cannot
+keep consistent, so the nodes here have no `parent` attribute.
+
+"""
+
+from __future__ import annotations
+import typing
+from typing import Callable, List, Optional, Tuple
+
+from py_treaps.priority import RandomPriority
+from py_treaps.treap import KT, VT, Treap
+
+
+class PersistentNode:
+    """An immutable treap node without a parent pointer.
+
+    Attributes:
+        key (KT): The key of the node.
+        value (VT): The value associated with the key of the node.
+        priority (int): The priority of the node.
+        left_child (PersistentNode): The left child of the node.
+        right_child (PersistentNode): The right child of the node.
+        size (int): The number of nodes in the subtree rooted at the node.
+    """
+
+    __slots__ = ("key", "value", "priority", "left_child", "right_child", "size")
+
+    def __init__(
+        self,
+        key: KT,
+        value: VT,
+        priority: int,
+        left_child: Optional[PersistentNode] = None,
+        right_child: Optional[PersistentNode] = None,
+    ):
+        self.key = key
+        self.value = value
+        self.priority = priority
+        self.left_child = left_child
+        self.right_child = right_child
+        self.size = 1 + (left_child.size if left_child else 0) + (right_child.size if right_child else 0)
+
+
+def _with_children(
+    node: PersistentNode, left: Optional[PersistentNode], right: Optional[PersistentNode]
+) -> PersistentNode:
+    """Copy `node` with new children."""
+    return PersistentNode(node.key, node.value, node.priority, left, right)
+
+
+class PersistentTreapMap(Treap[KT, VT]):
+    """A Treap whose updates produce new versions sharing structure.
+
+    The mutating methods of the Treap interface move this map to the
+    new version; versions taken earlier with `snapshot()` (or kept by
+    `split`) are not affected.
+    """
+
+    def __init__(
+        self,
+        priority_source: Optional[Callable[[KT], int]] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            priority_source: Callable mapping the key of a new node to its
+                priority. Defaults to a `RandomPriority` owned by this map.
+            seed: Seed for the default priority source.
+        """
+        self._priority_source = priority_source if priority_source is not None else RandomPriority(seed)
+        self.root: Optional[PersistentNode] = None
+
+    def _version(self, root: Optional[PersistentNode]) -> PersistentTreapMap[KT, VT]:
+        """Wrap `root` in a map sharing this map's priority source."""
+        treap: PersistentTreapMap[KT, VT] = PersistentTreapMap(self._priority_source)
+        treap.root = root
+        return treap
+
+    def snapshot(self) -> PersistentTreapMap[KT, VT]:
+        """Return the current version as a separate map, in O(1).
+
+        Later updates to either map are not visible in the other.
+        """
+        return self._version(self.root)
+
+    def get_root_node(self) -> Optional[PersistentNode]:
+        """Return the root node, or None if the Treap is empty."""
+        return self.root
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        """Retrieve the value associated with a key in this Treap.
+
+        Args:
+            key: The key whose associated value should be retrieved.
+
+        Returns:
+            The value associated with the key, or `None` if the key
+            is not in this Treap.
+        """
+        current = self.root
+        while current is not None:
+            if key < current.key:
+                current = current.left_child
+            elif current.key < key:
+                current = current.right_child
+            else:
+                return current.value
+        return None
+
+    def insert(self, key: KT, value: VT) -> None:
+        """Add a key-value pair, copying only the nodes on its path.
+
+        Any old value associated with the key is lost.
+
+        Args:
+            key: The key to add to this Treap. Cannot be None.
+            value: The value to associate with the key. Cannot be None.
+        """
+        self.root = self._insert(self.root, key, value)
+
+    def _insert(self, node: Optional[PersistentNode], key: KT, value: VT) -> PersistentNode:
+        """Return a copy of the subtree at `node` with `key` set to `value`."""
+        # Part 0) Empty slot -> the new leaf
+        if node is None:
+            return PersistentNode(key, value, self._priority_source(key))
+        # Part 1) Insert on the left; a higher priority child is rotated up by rebuilding the pair
+        if key < node.key:
+            left = self._insert(node.left_child, key, value)
+            if left.priority > node.priority:
+                return _with_children(left, left.left_child, _with_children(node, left.right_child, node.right_child))
+            return _with_children(node, left, node.right_child)
+        # Part 2) Insert on the right, symmetrically
+        if node.key < key:
+            right = self._insert(node.right_child, key, value)
+            if right.priority > node.priority:
+                return _with_children(right, _with_children(node, node.left_child, right.left_child), right.right_child)
+            return _with_children(node, node.left_child, right)
+        # Part 3) Existing key -> copy the node with the new value
+        return PersistentNode(key, value, node.priority, node.left_child, node.right_child)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        """Remove a key, copying only the nodes on its path.
+
+        Args:
+            key: The key to remove.
+
+        Returns:
+            The value associated with the key, or `None` if the key
+            is not present.
+        """
+        self.root, value = self._remove(self.root, key)
+        return value
+
+    def _remove(self, node: Optional[PersistentNode], key: KT) -> Tuple[Optional[PersistentNode], Optional[VT]]:
+        """Return the subtree without `key` and the removed value.
+
+        Nothing is copied when `key` is missing.
+        """
+        if node is None:
+            return None, None
+        if key < node.key:
+            left, value = self._remove(node.left_child, key)
+            return (node if value is None else _with_children(node, left, node.right_child)), value
+        if node.key < key:
+            right, value = self._remove(node.right_child, key)
+            return (node if value is None else _with_children(node, node.left_child, right)), value
+        return self._join(node.left_child, node.right_child), node.value
+
+    def _split(
+        self, node: Optional[PersistentNode], threshold: KT
+    ) -> Tuple[Optional[PersistentNode], Optional[PersistentNode]]:
+        """Return copies of the parts of `node` below and not below `threshold`."""
+        if node is None:
+            return None, None
+        if node.key < threshold:
+            low, high = self._split(node.right_child, threshold)
+            return _with_children(node, node.left_child, low), high
+        low, high = self._split(node.left_child, threshold)
+        return low, _with_children(node, high, node.right_child)
+
+    def _join(self, a: Optional[PersistentNode], b: Optional[PersistentNode]) -> Optional[PersistentNode]:
+        """Join two subtrees where every key of `a` is below every key of `b`, copying their inner spines."""
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if a.priority > b.priority:
+            return _with_children(a, a.left_child, self._join(a.right_child, b))
+        return _with_children(b, self._join(a, b.left_child), b.right_child)
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        """Split this Treap into two new versions.
+
+        The left Treap contains keys less than `threshold` and the right
+        Treap contains keys greater than or equal to `threshold`. Only the
+        nodes on the split path are copied, and this Treap is unchanged.
+
+        Args:
+            threshold: The key to split this Treap with.
+
+        Returns:
+            A list containing the left Treap at index 0 and the right
+            Treap at index 1.
+        """
+        low, high = self._split(self.root, threshold)
+        return [self._version(low), self._version(high)]
+
+    def join(self, other: Treap[KT, VT]) -> None:
+        """Join this Treap with another PersistentTreapMap whose keys are all larger.
+
+        Only the nodes on the two inner spines are copied; `other` is
+        unchanged.
+
+        Args:
+            other: The Treap to join with.
+        """
+        self.root = self._join(self.root, other.root)
+
+    def meld(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def balance_factor(self) -> float:
+        raise AttributeError
+
+    def __len__(self) -> int:
+        """Return the number of keys in this version in O(1)."""
+        return self.root.size if self.root else 0
+
+    def __str__(self) -> str:
+        """Build a human-readable representation of this Treap.
+
+        Uses the same pre-order layout as `TreapMap.__str__`.
+        """
+        if self.root is None:
+            return "<empty treap>"
+        result = []
+
+        def recurse(node: PersistentNode, prefix: str) -> None:
+            result.append(f"{prefix}[{node.priority}]<{node.key}, {node.value}>")
+            if node.left_child is not None or node.right_child is not None:
+                for child, tag in ((node.left_child, "L---"), (node.right_child, "R---")):
+                    if child is not None:
+                        recurse(child, prefix + tag)
+                    else:
+                        result.append(f"{prefix}{tag}<empty>")
+
+        recurse(self.root, "")
+        return "\n".join(result)
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        """Return a new iterator over the keys of this version, in sorted order.
+
+        The iterator keeps walking the version it started on even if the
+        map moves on to a newer one.
+        """
+        stack: List[PersistentNode] = []
+        current = self.root
+        while stack or current is not None:
+            # Walk down the left spine, then visit the deepest pending node
+            while current is not None:
+                stack.append(current)
+                current = current.left_child
+            current = stack.pop()
+            yield current.key
+            current = current.right_child
@@ -0,0 +1,57 @@
+"""
+This module contains the priority sources used by TreapMap.
+
+A priority source is any callable that takes the key of a node being
+created and returns its integer priority. Each TreapMap owns its own
+source, so node creation is O(1) and no state is shared between maps.
+"""
+
+from __future__ import annotations
+import random
+from typing import Any, Optional
+
+# Width of the priorities drawn by the built-in sources
+PRIORITY_BITS = 64
+
+_MASK64 = (1 << 64) - 1
+
+
+class RandomPriority:
+    """Draw priorities from a seeded pseudo-random generator.
+
+    Two maps created with the same seed and fed the same operations
+    build identical treaps.
+
+    Attributes:
+        bits (int): The width of the generated priorities.
+    """
+
+    def __init__(self, seed: Optional[int] = None, bits: int = PRIORITY_BITS):
+        self.bits = bits
+        self._getrandbits = random.Random(seed).getrandbits
+
+    def __call__(self, key: Any) -> int:
+        return self._getrandbits(self.bits)
+
+
+class HashPriority:
+    """Derive priorities from a hash of the key.
+
+    The same key always gets the same priority, so the shape of the
+    treap depends only on its set of keys and not on insertion order.
+    Note that `str` and `bytes` hashes are salted per process unless
+    PYTHONHASHSEED is set.
+
+    Attributes:
+        seed (int): Mixed into every hash to pick a different shape.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    def __call__(self, key: Any) -> int:
+        # splitmix64 finalizer spreads nearby hashes (e.g. small ints) over all 64 bits
+        z = (hash(key) + self.seed * 0x9E3779B97F4A7C15) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
@@ -0,0 +1,296 @@
+"""
+This module contains a compact binary format for TreapMaps.
+
+Pickling a TreapMap walks the linked node graph recursively and stores
+every node as a separate object. `dump` instead writes the treap as a
+few flat columns, all in pre-order:
+
+    header      magic, version, key, value and priority codecs, node count
+    priorities  one little-endian uint64, int64 or float64 per node
+    shape       two bits per node: has a left child, has a right child
+    keys        one column, encoded by the key codec
+    values      one column, encoded by the value codec
+
+Every section starts on an 8-byte boundary. Columns of ints that fit
+in 64 bits and of floats are stored as packed arrays, str and bytes as
+an offset array plus one blob, and anything else as a single pickle.
+
+The exact shape is stored, so `load` relinks the nodes without any key
+comparisons or rotations. `load` accepts any buffer, including a
+`memoryview` or an `mmap`; the packed columns are read through
+zero-copy views of the buffer.
+
+"""
+
+from __future__ import annotations
+import pickle
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Callable, List, Optional, Tuple, Union
+
+from py_treaps.monoid import Monoid
+from py_treaps.treap import KT, VT, Treap
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+MAGIC = b"TRP1"
+VERSION = 1
+
+# magic, version, key codec, value codec, priority codec, node count
+_HEADER = struct.Struct("<4sBBBBQ")
+
+# Column codecs
+_INT64 = 0
+_FLOAT64 = 1
+_STR = 2
+_BYTES = 3
+_PICKLE = 4
+
+# Priority codecs, as array typecodes indexed by the header byte; files without one hold 0 there
+_PRIORITY_TYPECODES = "Qqd"
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def dump(treap: Treap[KT, VT], fp: BinaryIO) -> None:
+    """Write a Treap to a binary file in the columnar format.
+
+    Any Treap whose nodes expose `key`, `value`, `priority`,
+    `left_child` and `right_child` can be dumped.
+
+    Args:
+        treap: The Treap to write. It is not modified.
+        fp: A file object opened for binary writing.
+
+    Raises:
+        TypeError: If the priorities are not all ints or all floats.
+        ValueError: If an int priority does not fit in 64 bits.
+    """
+    # Part 0) Tombstones of a lazy-delete TreapMap are not written; drop them from a copy
+    if getattr(treap, "_dead", 0):
+        treap = treap.copy()
+        treap.compact()
+    # Part 1) Walk the nodes in pre-order without recursion
+    keys: List[Any] = []
+    values: List[Any] = []
+    priorities: List[Any] = []
+    # The node count is only known after the walk, since not every Treap has a len()
+    shape = bytearray()
+    stack = [treap.get_root_node()] if treap.get_root_node() is not None else []
+    while stack:
+        node = stack.pop()
+        i = len(keys)
+        keys.append(node.key)
+        values.append(node.value)
+        priorities.append(node.priority)
+        bits = (node.left_child is not None) | (node.right_child is not None) << 1
+        if i & 3 == 0:
+            shape.append(0)
+        shape[i >> 2] |= bits << ((i & 3) * 2)
+        # Push right first so the left subtree is visited next
+        if node.right_child is not None:
+            stack.append(node.right_child)
+        if node.left_child is not None:
+            stack.append(node.left_child)
+
+    # Part 2) Write the header and the columns, each padded to 8 bytes
+    key_codec, value_codec = _codec_for(keys), _codec_for(values)
+    priority_codec = _priority_codec_for(priorities)
+    _write(fp, _HEADER.pack(MAGIC, VERSION, key_codec, value_codec, priority_codec, len(keys)))
+    _write(fp, _packed(array(_PRIORITY_TYPECODES[priority_codec], priorities)))
+    _write(fp, bytes(shape))
+    _write_column(fp, key_codec, keys)
+    _write_column(fp, value_codec, values)
+
+
+def load(
+    source: Union[BinaryIO, Buffer, Any],
+    priority_source: Optional[Callable[[KT], int]] = None,
+    seed: Optional[int] = None,
+    monoid: Optional[Monoid] = None,
+    key_func: Optional[Callable[[KT], Any]] = None,
+) -> TreapMap[KT, VT]:
+    """Read a TreapMap written by `dump`.
+
+    Args:
+        source: A binary file object, or any object supporting the
+            buffer protocol such as `bytes`, `memoryview` or `mmap`.
+            A file object is read into memory first; a buffer is read
+            in place.
+        priority_source: Passed on to the TreapMap constructor, for
+            nodes inserted after loading.
+        seed: Passed on to the TreapMap constructor.
+        monoid: Passed on to the TreapMap constructor; aggregates are
+            computed while the nodes are relinked.
+        key_func: The `key_func` of the TreapMap that was dumped.
+
+    Returns:
+        A new TreapMap with the same keys, values, priorities and shape.
+
+    Raises:
+        ValueError: If the data is not in this format.
+
+    Warning:
+        Columns that are not ints, floats, str or bytes are stored with
+        `pickle` and unpickled here, so loading a file from an untrusted
+        source can run arbitrary code. Only load data you wrote yourself.
+    """
+    view = memoryview(source.read() if hasattr(source, "read") else source).cast("B")
+    if len(view) < _HEADER.size:
+        raise ValueError("truncated treap data")
+    magic, version, key_codec, value_codec, priority_codec, n = _HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a treap dump, or an unsupported version")
+
+    # Part 1) Locate the columns
+    offset = _HEADER.size
+    priorities, offset = _read_packed(view, offset, _priority_typecode(priority_codec), n)
+    shape = view[offset:offset + (2 * n + 7) // 8]
+    offset = _aligned(offset + len(shape))
+    keys, offset = _read_column(view, offset, key_codec, n)
+    values, offset = _read_column(view, offset, value_codec, n)
+
+    # Part 2) Relink the nodes in pre-order; `pending` holds the nodes still waiting for a right child
+    treap: TreapMap[KT, VT] = TreapMap(priority_source=priority_source, seed=seed, monoid=monoid, key_func=key_func)
+    nodes: List[TreapNode] = []
+    pending: List[TreapNode] = []
+    parent: Optional[TreapNode] = None
+    is_left = False
+    for i in range(n):
+        node = TreapNode(keys[i], values[i], parent, priorities[i])
+        if key_func is not None:
+            node.sort_key = key_func(node.key)
+        if parent is None:
+            treap.root = node
+        elif is_left:
+            parent.left_child = node
+        else:
+            parent.right_child = node
+        nodes.append(node)
+
+        bits = shape[i >> 2] >> ((i & 3) * 2)
+        if bits & 2:
+            pending.append(node)
+        if bits & 1:
+            parent, is_left = node, True
+        elif pending:
+            parent, is_left = pending.pop(), False
+
+    # Part 3) Every node comes after its ancestors in pre-order, so refresh in reverse
+    for node in reversed(nodes):
+        treap._refresh(node)
+    return treap
+
+
+def _codec_for(column: List[Any]) -> int:
+    """Pick the most compact codec that can hold every item of a column."""
+    if all(type(item) is int and -(1 << 63) <= item < (1 << 63) for item in column):
+        return _INT64
+    if all(type(item) is float for item in column):
+        return _FLOAT64
+    if all(type(item) is str for item in column):
+        return _STR
+    if all(type(item) is bytes for item in column):
+        return _BYTES
+    return _PICKLE
+
+
+def _priority_codec_for(priorities: List[Any]) -> int:
+    """Pick the packed type that holds every priority exactly.
+
+    Raises:
+        TypeError: If the priorities are not all ints or all floats.
+        ValueError: If an int priority does not fit in 64 bits.
+    """
+    if all(type(p) is int for p in priorities):
+        if all(0 <= p < (1 << 64) for p in priorities):
+            return 0
+        if all(-(1 << 63) <= p < (1 << 63) for p in priorities):
+            return 1
+        raise ValueError("int priorities must fit in 64 bits, signed or unsigned")
+    if all(type(p) is float for p in priorities):
+        return 2
+    raise TypeError("priorities must be all ints or all floats")
+
+
+def _priority_typecode(codec: int) -> str:
+    """Return the array typecode of a priority codec read from a header."""
+    if codec >= len(_PRIORITY_TYPECODES):
+        raise ValueError(f"unknown priority codec {codec}")
+    return _PRIORITY_TYPECODES[codec]
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _write(fp: BinaryIO, data: bytes) -> None:
+    """Write data followed by zero padding up to the next 8-byte boundary."""
+    fp.write(data)
+    fp.write(bytes(_aligned(len(data)) - len(data)))
+
+
+def _packed(column: array) -> bytes:
+    """Return the items of an array as little-endian bytes."""
+    if not _LITTLE_ENDIAN:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _write_column(fp: BinaryIO, codec: int, column: List[Any]) -> None:
+    if codec == _INT64:
+        _write(fp, _packed(array("q", column)))
+    elif codec == _FLOAT64:
+        _write(fp, _packed(array("d", column)))
+    elif codec == _PICKLE:
+        blob = pickle.dumps(column, protocol=pickle.HIGHEST_PROTOCOL)
+        _write(fp, struct.pack("<Q", len(blob)) + blob)
+    else:
+        # str and bytes: n + 1 offsets into one blob
+        items = [item.encode("utf-8") for item in column] if codec == _STR else column
+        offsets = array("Q", [0])
+        for item in items:
+            offsets.append(offsets[-1] + len(item))
+        _write(fp, _packed(offsets))
+        _write(fp, b"".join(items))
+
+
+def _read_packed(view: memoryview, offset: int, typecode: str, count: int) -> Tuple[Any, int]:
+    """Return a view of `count` packed items at offset, and the offset after them.
+
+    On little-endian machines this is a zero-copy cast of the buffer.
+    """
+    end = offset + 8 * count
+    if end > len(view):
+        raise ValueError("truncated treap data")
+    if _LITTLE_ENDIAN:
+        column: Any = view[offset:end].cast(typecode)
+    else:
+        column = array(typecode, view[offset:end])
+        column.byteswap()
+    return column, _aligned(end)
+
+
+def _read_column(view: memoryview, offset: int, codec: int, count: int) -> Tuple[Any, int]:
+    """Return an indexable column at offset, and the offset after it."""
+    if codec == _INT64:
+        return _read_packed(view, offset, "q", count)
+    if codec == _FLOAT64:
+        return _read_packed(view, offset, "d", count)
+    if codec == _PICKLE:
+        (length,) = struct.unpack_from("<Q", view, offset)
+        start = offset + 8
+        return pickle.loads(view[start:start + length]), _aligned(start + length)
+    if codec in (_STR, _BYTES):
+        offsets, start = _read_packed(view, offset, "Q", count + 1)
+        blob = view[start:start + offsets[count]]
+        if codec == _STR:
+            items = [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count)]
+        else:
+            items = [bytes(blob[offsets[i]:offsets[i + 1]]) for i in range(count)]
+        return items, _aligned(start + len(blob))
+    raise ValueError(f"unknown column codec {codec}")
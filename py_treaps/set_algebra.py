@@ -0,0 +1,63 @@
+"""
+This module contains non-destructive set operations on TreapMaps.
+
+The TreapMap methods `meld`, `difference`, `intersection` and
+`symmetric_difference` update the left operand in place and consume the
+right one. The functions below run the same split/join algorithms on
+copies instead, so both arguments are left untouched. Copying costs
+O(n + m) on top of the operation itself.
+
+Both arguments may be the same map: each side gets its own copy, so
+`union(a, a)` and `intersection(a, a)` return a copy of `a`, while the
+in-place methods reject a map combined with itself.
+
+"""
+
+from __future__ import annotations
+from typing import Callable, Union
+
+from py_treaps.treap import KT, VT
+from py_treaps.treap_map import TreapMap
+
+Combine = Union[str, Callable[[VT, VT], VT]]
+
+
+def union(a: TreapMap[KT, VT], b: TreapMap[KT, VT], combine: Combine = "right") -> TreapMap[KT, VT]:
+    """Return a new TreapMap with the keys of either map.
+
+    Args:
+        a: The left operand.
+        b: The right operand.
+        combine: How to resolve a key present in both; see `TreapMap.meld`.
+    """
+    result = a.copy()
+    # b is copied separately even if it is a, so meld never sees one tree on both sides
+    result.meld(b.copy(), combine)
+    return result
+
+
+def difference(a: TreapMap[KT, VT], b: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+    """Return a new TreapMap with the keys of `a` that are not in `b`."""
+    result = a.copy()
+    result.difference(b.copy())
+    return result
+
+
+def intersection(a: TreapMap[KT, VT], b: TreapMap[KT, VT], combine: Combine = "left") -> TreapMap[KT, VT]:
+    """Return a new TreapMap with the keys present in both maps.
+
+    Args:
+        a: The left operand.
+        b: The right operand.
+        combine: Which value each key ends up with; see `TreapMap.meld`.
+    """
+    result = a.copy()
+    result.intersection(b.copy(), combine)
+    return result
+
+
+def symmetric_difference(a: TreapMap[KT, VT], b: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+    """Return a new TreapMap with the keys present in exactly one map."""
+    result = a.copy()
+    result.symmetric_difference(b.copy())
+    return result
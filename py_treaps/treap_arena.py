@@ -0,0 +1,452 @@
+"""
+This module contains TreapArena, a memory-lean Treap backend.
+
+Instead of one Python object per node, a TreapArena keeps its nodes in
+parallel columns indexed by int: keys and values in lists, priorities
+and child/parent links in typed arrays. Slots freed by `remove` go on a
+free list and are reused by later inserts.
+
+"""
+
+from __future__ import annotations
+import typing
+from array import array
+from typing import Any, Callable, List, Optional, Tuple
+
+from py_treaps.priority import RandomPriority
+from py_treaps.treap import KT, VT, Treap
+
+# Index used for a missing child or parent
+NIL = -1
+
+
+class _ArenaStore:
+    """The node columns, shared by every TreapArena split from one arena."""
+
+    __slots__ = ("keys", "values", "priorities", "left", "right", "parent", "free")
+
+    def __init__(self):
+        self.keys: List[Any] = []
+        self.values: List[Any] = []
+        # Priorities must fit in an unsigned 64-bit integer
+        self.priorities = array("Q")
+        self.left = array("q")
+        self.right = array("q")
+        self.parent = array("q")
+        # Indices of released slots, reused before the columns grow
+        self.free: List[int] = []
+
+    def allocate(self, key: Any, value: Any, priority: int) -> int:
+        """Store a detached node and return its index."""
+        if self.free:
+            i = self.free.pop()
+            self.keys[i] = key
+            self.values[i] = value
+            self.priorities[i] = priority
+            self.left[i] = self.right[i] = self.parent[i] = NIL
+            return i
+        self.keys.append(key)
+        self.values.append(value)
+        self.priorities.append(priority)
+        self.left.append(NIL)
+        self.right.append(NIL)
+        self.parent.append(NIL)
+        return len(self.keys) - 1
+
+    def release(self, i: int) -> None:
+        """Put a slot on the free list, dropping its key and value."""
+        self.keys[i] = None
+        self.values[i] = None
+        self.free.append(i)
+
+
+class ArenaNode:
+    """A read-only view of one node of a TreapArena.
+
+    It exposes the same attributes as TreapNode so code written against
+    `get_root_node()` works with either backend. Views are created on
+    demand, so compare them with `==` rather than `is`.
+    """
+
+    __slots__ = ("_store", "index")
+
+    def __init__(self, store: _ArenaStore, index: int):
+        self._store = store
+        self.index = index
+
+    def _view(self, i: int) -> Optional[ArenaNode]:
+        return None if i == NIL else ArenaNode(self._store, i)
+
+    @property
+    def key(self) -> Any:
+        return self._store.keys[self.index]
+
+    @property
+    def value(self) -> Any:
+        return self._store.values[self.index]
+
+    @property
+    def priority(self) -> int:
+        return self._store.priorities[self.index]
+
+    @property
+    def parent(self) -> Optional[ArenaNode]:
+        return self._view(self._store.parent[self.index])
+
+    @property
+    def left_child(self) -> Optional[ArenaNode]:
+        return self._view(self._store.left[self.index])
+
+    @property
+    def right_child(self) -> Optional[ArenaNode]:
+        return self._view(self._store.right[self.index])
+
+    def __eq__(self, other: Any) -> bool:
+        return (
+            isinstance(other, ArenaNode)
+            and other._store is self._store
+            and other.index == self.index
+        )
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self.index))
+
+
+class TreapArena(Treap[KT, VT]):
+    """A Treap storing its nodes as struct-of-arrays columns.
+
+    Treaps produced by `split` share their columns with the arena they
+    came from, so splitting and re-joining them moves no data.
+    """
+
+    def __init__(
+        self,
+        priority_source: Optional[Callable[[KT], int]] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            priority_source: Callable mapping the key of a new node to its
+                priority. Defaults to a `RandomPriority` owned by this arena.
+            seed: Seed for the default priority source.
+        """
+        self._priority_source = priority_source if priority_source is not None else RandomPriority(seed)
+        self._store = _ArenaStore()
+        self._root = NIL
+
+    def _empty_like(self) -> TreapArena[KT, VT]:
+        """Create an empty TreapArena sharing this arena's columns."""
+        treap: TreapArena[KT, VT] = TreapArena(self._priority_source)
+        treap._store = self._store
+        return treap
+
+    def get_root_node(self) -> Optional[ArenaNode]:
+        """Return a view of the root node, or None if the Treap is empty."""
+        return None if self._root == NIL else ArenaNode(self._store, self._root)
+
+    def _lookup_index(self, key: KT) -> int:
+        """Return the index of the node holding `key`, or NIL."""
+        keys, left, right = self._store.keys, self._store.left, self._store.right
+        current = self._root
+        while current != NIL:
+            current_key = keys[current]
+            if key < current_key:
+                current = left[current]
+            elif current_key < key:
+                current = right[current]
+            else:
+                return current
+        return NIL
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        """Retrieve the value associated with a key in this Treap.
+
+        Args:
+            key: The key whose associated value should be retrieved.
+
+        Returns:
+            The value associated with the key, or `None` if the key
+            is not in this Treap.
+        """
+        i = self._lookup_index(key)
+        return None if i == NIL else self._store.values[i]
+
+    def insert(self, key: KT, value: VT) -> None:
+        """Add a key-value pair to this Treap.
+
+        Any old value associated with the key is lost.
+
+        Args:
+            key: The key to add to this Treap. Cannot be None.
+            value: The value to associate with the key. Cannot be None.
+        """
+        s = self._store
+        # Part 0) Empty treap -> the new node is the root
+        if self._root == NIL:
+            self._root = s.allocate(key, value, self._priority_source(key))
+            return
+
+        # Part 1) Descend once; overwrite in place if the key exists, else attach a new leaf
+        current = self._root
+        while True:
+            current_key = s.keys[current]
+            if key < current_key:
+                if s.left[current] == NIL:
+                    x = s.allocate(key, value, self._priority_source(key))
+                    s.left[current] = x
+                    break
+                current = s.left[current]
+            elif current_key < key:
+                if s.right[current] == NIL:
+                    x = s.allocate(key, value, self._priority_source(key))
+                    s.right[current] = x
+                    break
+                current = s.right[current]
+            else:
+                s.values[current] = value
+                return
+        s.parent[x] = current
+
+        # Part 2) Rotate the new leaf up until the heap property holds
+        priorities, parent = s.priorities, s.parent
+        while parent[x] != NIL and priorities[x] > priorities[parent[x]]:
+            if s.left[parent[x]] == x:
+                self._rotate_right(parent[x])
+            else:
+                self._rotate_left(parent[x])
+
+    def remove(self, key: KT) -> Optional[VT]:
+        """Remove a key from this Treap.
+
+        The freed slot is reused by a later insert.
+
+        Args:
+            key: The key to remove.
+
+        Returns:
+            The value associated with the key, or `None` if the key
+            is not present.
+        """
+        s = self._store
+        x = self._lookup_index(key)
+        if x == NIL:
+            return None
+
+        # Part 1) Rotate x down, lifting its higher priority child, until it is a leaf
+        while s.left[x] != NIL or s.right[x] != NIL:
+            if s.left[x] != NIL and (
+                s.right[x] == NIL or s.priorities[s.left[x]] > s.priorities[s.right[x]]
+            ):
+                self._rotate_right(x)
+            else:
+                self._rotate_left(x)
+
+        # Part 2) Unlink the leaf and free its slot
+        p = s.parent[x]
+        if p == NIL:
+            self._root = NIL
+        elif s.left[p] == x:
+            s.left[p] = NIL
+        else:
+            s.right[p] = NIL
+        value = s.values[x]
+        s.release(x)
+        return value
+
+    def _rotate_left(self, i: int) -> None:
+        """Rotate left around the node at index `i`."""
+        s = self._store
+        new_root = s.right[i]
+        s.right[i] = s.left[new_root]
+        if s.left[new_root] != NIL:
+            s.parent[s.left[new_root]] = i
+        s.left[new_root] = i
+        self._update_parents(i, new_root)
+
+    def _rotate_right(self, i: int) -> None:
+        """Rotate right around the node at index `i`."""
+        s = self._store
+        new_root = s.left[i]
+        s.left[i] = s.right[new_root]
+        if s.right[new_root] != NIL:
+            s.parent[s.right[new_root]] = i
+        s.right[new_root] = i
+        self._update_parents(i, new_root)
+
+    def _update_parents(self, i: int, new_root: int) -> None:
+        """Hang `new_root` where `i` was and make it the parent of `i`."""
+        s = self._store
+        p = s.parent[i]
+        s.parent[new_root] = p
+        if p == NIL:
+            self._root = new_root
+        elif s.left[p] == i:
+            s.left[p] = new_root
+        else:
+            s.right[p] = new_root
+        s.parent[i] = new_root
+
+    def _split(self, i: int, threshold: KT) -> Tuple[int, int]:
+        """Split the subtree at `i` into keys < threshold and keys >= threshold."""
+        s = self._store
+        if i == NIL:
+            return NIL, NIL
+        if s.keys[i] < threshold:
+            low, high = self._split(s.right[i], threshold)
+            s.right[i] = low
+            if low != NIL:
+                s.parent[low] = i
+            return i, high
+        low, high = self._split(s.left[i], threshold)
+        s.left[i] = high
+        if high != NIL:
+            s.parent[high] = i
+        return low, i
+
+    def _merge(self, a: int, b: int) -> int:
+        """Merge two subtrees where every key of `a` is below every key of `b`."""
+        s = self._store
+        if a == NIL:
+            return b
+        if b == NIL:
+            return a
+        if s.priorities[a] > s.priorities[b]:
+            merged = self._merge(s.right[a], b)
+            s.right[a] = merged
+            s.parent[merged] = a
+            return a
+        merged = self._merge(a, s.left[b])
+        s.left[b] = merged
+        s.parent[merged] = b
+        return b
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        """Split this Treap into two Treaps.
+
+        The left Treap contains keys less than `threshold` and the right
+        Treap contains keys greater than or equal to `threshold`. Both
+        share this arena's columns, and this Treap is left empty.
+
+        Args:
+            threshold: The key to split this Treap with.
+
+        Returns:
+            A list containing the left Treap at index 0 and the right
+            Treap at index 1.
+        """
+        low, high = self._split(self._root, threshold)
+        self._root = NIL
+        left, right = self._empty_like(), self._empty_like()
+        for treap, root in ((left, low), (right, high)):
+            if root != NIL:
+                self._store.parent[root] = NIL
+            treap._root = root
+        return [left, right]
+
+    def join(self, other: Treap[KT, VT]) -> None:
+        """Join this Treap with another TreapArena whose keys are all larger.
+
+        Arenas sharing columns are joined in O(log n) without moving data;
+        the nodes of an unrelated arena are copied into this one first.
+        `other` is left empty.
+
+        Args:
+            other: The TreapArena to join with.
+        """
+        if not isinstance(other, TreapArena):
+            raise TypeError("TreapArena can only be joined with another TreapArena")
+        other_root = other._root
+        if other._store is not self._store:
+            other_root = self._adopt(other)
+        other._root = NIL
+        self._root = self._merge(self._root, other_root)
+        if self._root != NIL:
+            self._store.parent[self._root] = NIL
+
+    def _adopt(self, other: TreapArena[KT, VT]) -> int:
+        """Copy the nodes of an arena with different columns into this one.
+
+        Returns:
+            The index of the copied root in this arena's columns.
+        """
+        s, o = self._store, other._store
+
+        def copy(j: int, parent: int) -> int:
+            if j == NIL:
+                return NIL
+            i = s.allocate(o.keys[j], o.values[j], o.priorities[j])
+            s.parent[i] = parent
+            s.left[i] = copy(o.left[j], i)
+            s.right[i] = copy(o.right[j], i)
+            return i
+
+        return copy(other._root, NIL)
+
+    def copy(self) -> TreapArena[KT, VT]:
+        """Return a copy of this Treap with the same shape and priorities.
+
+        The copy gets columns of its own, holding only this Treap's
+        nodes. Takes O(n) time and does no key comparisons.
+        """
+        clone: TreapArena[KT, VT] = TreapArena(self._priority_source)
+        if self._root == NIL:
+            return clone
+        s, c = self._store, clone._store
+        clone._root = c.allocate(s.keys[self._root], s.values[self._root], s.priorities[self._root])
+        # Pairs of (index here, index in the clone) whose children are still to be copied
+        stack = [(self._root, clone._root)]
+        while stack:
+            j, i = stack.pop()
+            for children, copied in ((s.left, c.left), (s.right, c.right)):
+                child = children[j]
+                if child != NIL:
+                    x = c.allocate(s.keys[child], s.values[child], s.priorities[child])
+                    copied[i] = x
+                    c.parent[x] = i
+                    stack.append((child, x))
+        return clone
+
+    def meld(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError
+
+    def balance_factor(self) -> float:
+        raise AttributeError
+
+    def __str__(self) -> str:
+        """Build a human-readable representation of this Treap.
+
+        Uses the same pre-order layout as `TreapMap.__str__`.
+        """
+        if self._root == NIL:
+            return "<empty treap>"
+        s = self._store
+        result = []
+
+        def recurse(i: int, prefix: str) -> None:
+            result.append(f"{prefix}[{s.priorities[i]}]<{s.keys[i]}, {s.values[i]}>")
+            if s.left[i] != NIL or s.right[i] != NIL:
+                for child, tag in ((s.left[i], "L---"), (s.right[i], "R---")):
+                    if child != NIL:
+                        recurse(child, prefix + tag)
+                    else:
+                        result.append(f"{prefix}{tag}<empty>")
+
+        recurse(self._root, "")
+        return "\n".join(result)
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        """Return a new iterator over the keys in this Treap, in sorted order."""
+        s = self._store
+        stack: List[int] = []
+        current = self._root
+        while stack or current != NIL:
+            # Walk down the left spine, then visit the deepest pending node
+            while current != NIL:
+                stack.append(current)
+                current = s.left[current]
+            current = stack.pop()
+            yield s.keys[current]
+            current = s.right[current]
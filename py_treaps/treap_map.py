@@ -1,27 +1,304 @@
 from __future__ import annotations
+import __future__
+import ast
+import functools
+import inspect
 import random
+import textwrap
+import types
 import typing
-from collections.abc import Iterator
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
 from logging import currentframe
 from mailcap import lookup
+from operator import itemgetter
+from time import perf_counter_ns
 from pickle import FALSE
-from typing import List, Optional, cast
+from typing import Any, Callable, List, Optional, Tuple, Union, cast
 
+from py_treaps.instrumentation import LatencyHistogram
+from py_treaps.monoid import Monoid
+from py_treaps.priority import RandomPriority
 from py_treaps.treap import KT, VT, Treap
 from py_treaps.treap_node import TreapNode
 
 
+# Value of a node removed in lazy-delete mode; the node stays in the tree until compaction
+_TOMBSTONE: Any = object()
+
+# Key types whose comparisons are cheap C calls; see `_lookup_node`
+_BUILTIN_KEY_TYPES = frozenset((int, float, str, bytes, tuple))
+
+# Operations timed by `TreapMap.instrument` unless told otherwise
+INSTRUMENTED_OPERATIONS = ("insert", "lookup", "remove", "split", "join")
+
+# Key searches whose every `<` compares two keys; `enable_counters` installs counting copies
+_COUNTED_SEARCHES = ("_lookup_node", "_descend", "_finger_lookup", "_finger_search", "lookup_many")
+
+
+class _RouteComparisons(ast.NodeTransformer):
+    """Rewrite every `a < b` into `less(a, b)`."""
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        self.generic_visit(node)
+        if len(node.ops) == 1 and isinstance(node.ops[0], ast.Lt):
+            call = ast.Call(ast.Name("less", ast.Load()), [node.left, node.comparators[0]], [])
+            return ast.copy_location(call, node)
+        return node
+
+
+@functools.lru_cache(maxsize=None)
+def _counting_factory(method: Callable[..., Any]) -> Callable[[Callable[[Any, Any], bool]], Callable[..., Any]]:
+    """Compile a copy of `method` whose `<` comparisons call a given `less(a, b)`.
+
+    The copy is generated from the method's own source, so the counted
+    and the plain searches cannot drift apart. Line numbers are kept,
+    so tracebacks point at the original lines.
+
+    Returns:
+        A function that takes `less` and returns the copy.
+    """
+    lines, first_line = inspect.getsourcelines(method)
+    function = ast.parse(textwrap.dedent("".join(lines))).body[0]
+    ast.increment_lineno(function, first_line - 1)
+    factory = ast.parse("def factory(less):\n    pass").body[0]
+    factory.body = [_RouteComparisons().visit(function), ast.Return(ast.Name(function.name, ast.Load()))]
+    module = ast.fix_missing_locations(ast.Module([factory], []))
+    code = compile(module, inspect.getsourcefile(method), "exec", flags=__future__.annotations.compiler_flag, dont_inherit=True)
+    namespace: dict = {}
+    exec(code, globals(), namespace)
+    return namespace["factory"]
+
+
 # Example usage found in test_treaps.py
 class TreapMap(Treap[KT, VT]):
     # Add an __init__ if you want. Make the parameters optional, though.
-    def __init__(self, key: Optional[KT] = None, value: Optional[VT] = None):
+    def __init__(
+        self,
+        key: Optional[KT] = None,
+        value: Optional[VT] = None,
+        priority_source: Optional[Callable[[KT], int]] = None,
+        seed: Optional[int] = None,
+        monoid: Optional[Monoid] = None,
+        key_func: Optional[Callable[[KT], Any]] = None,
+        lazy_delete: Optional[float] = None,
+        fingers: int = 0,
+        self_adjusting: bool = False,
+        cache_size: int = 0,
+    ):
+        """
+        Args:
+            key: Optional key of the first node.
+            value: Optional value of the first node.
+            priority_source: Callable mapping the key of a new node to its
+                priority. Defaults to a `RandomPriority` owned by this map.
+            seed: Seed for the default priority source, for reproducible
+                treap shapes. Ignored if `priority_source` is given.
+            monoid: Optional monoid whose per-subtree aggregates are kept
+                on every node, enabling O(log n) `aggregate` queries.
+            key_func: Optional function of one key that the keys are
+                ordered by, as in `sorted(key=...)`. It is called once per
+                inserted key and the result is cached on the node, so
+                descents compare cached values. Keys with equal results
+                count as the same key.
+            lazy_delete: Turns on lazy deletion: `remove` only marks the
+                node as a tombstone, and the whole treap is rebuilt
+                without tombstones once they make up more than this
+                fraction of its nodes.
+            fingers: Number of recently looked up nodes to keep. When
+                nonzero, `lookup` searches from the most recent one (see
+                `_finger_search`), so sequential and repeated lookups
+                cost O(log d) for a rank distance d instead of O(log n).
+            self_adjusting: When true, every successful `lookup` draws a
+                fresh priority for the node and keeps the larger of the
+                two, rotating the node up if it grew. A key looked up c
+                times then has the priority of the best of c + 1 draws,
+                so frequently used keys settle near the root.
+            cache_size: When nonzero, `lookup` results for up to this
+                many keys are kept in an LRU cache, so hot keys are
+                answered without a descent. Sort keys must then be
+                hashable. See `cache_info`.
+        """
+        # Every map draws from its own priority source instead of the shared TreapNode pool
+        self._priority_source = priority_source if priority_source is not None else RandomPriority(seed)
+        self._monoid = monoid
+        self._key_func = key_func
+        self._lazy_delete = lazy_delete
+        # Recently looked up nodes, most recent first; None when finger lookups are off
+        self._fingers: Optional[typing.Deque[TreapNode]] = deque(maxlen=fingers) if fingers else None
+        self._self_adjusting = self_adjusting
+        # Sort key -> lookup result, least recently used first; None when caching is off
+        self._cache: Optional[typing.OrderedDict[Any, Optional[VT]]] = OrderedDict() if cache_size else None
+        self._cache_size = cache_size
+        self._cache_hits = 0
+        self._cache_misses = 0
         # If the key & value are provided, then create a TreapNode object & make it the root
         if key is not None and value is not None:
-            self.root = TreapNode(key, value)
+            self.root = self._new_node(key, value)
         # No root node
         else:
             self.root = None
 
+    def _new_node(self, key: KT, value: VT, sort_key: Any = None) -> TreapNode:
+        """Create a detached node with a priority from this map's source.
+
+        `sort_key` passes on an already computed `_sort_key_of(key)`.
+        """
+        x = TreapNode(key, value, priority=self._priority_source(key))
+        if self._key_func is not None:
+            x.sort_key = self._key_func(key) if sort_key is None else sort_key
+        return x
+
+    def _sort_key_of(self, key: KT) -> Any:
+        """Return what `key` is ordered by in this Treap: `key_func(key)`, or the key itself."""
+        return key if self._key_func is None else self._key_func(key)
+
+    def _empty_like(self) -> TreapMap[KT, VT]:
+        """Create an empty TreapMap sharing this map's configuration."""
+        return TreapMap(
+            priority_source=self._priority_source,
+            monoid=self._monoid,
+            key_func=self._key_func,
+            lazy_delete=self._lazy_delete,
+            fingers=self._fingers.maxlen if self._fingers is not None else 0,
+            self_adjusting=self._self_adjusting,
+            cache_size=self._cache_size,
+        )
+
+    @classmethod
+    def from_sorted(
+        cls,
+        pairs: Iterable[Tuple[KT, VT]],
+        priority_source: Optional[Callable[[KT], int]] = None,
+        seed: Optional[int] = None,
+        monoid: Optional[Monoid] = None,
+        key_func: Optional[Callable[[KT], Any]] = None,
+    ) -> TreapMap[KT, VT]:
+        """Build a TreapMap from (key, value) pairs already sorted by key.
+
+        The treap is built in a single O(n) pass as a Cartesian tree: the
+        right spine of the partially built treap is kept on a stack, and each
+        new node pops every spine node with a lower priority and adopts them
+        as its left subtree. No key lookups or rotations are performed.
+
+        Repeated keys keep the last value, matching repeated `insert` calls.
+
+        Args:
+            pairs: The (key, value) pairs, in ascending key order.
+            priority_source: Passed on to the TreapMap constructor.
+            seed: Passed on to the TreapMap constructor.
+            monoid: Passed on to the TreapMap constructor.
+            key_func: Passed on to the TreapMap constructor; the pairs
+                must be sorted by `key_func` of their keys.
+
+        Returns:
+            A new TreapMap containing the pairs.
+
+        Raises:
+            ValueError: If the keys are not in ascending order.
+        """
+        treap = cls(priority_source=priority_source, seed=seed, monoid=monoid, key_func=key_func)
+        treap._build_sorted(pairs)
+        return treap
+
+    def _build_sorted(self, pairs: Iterable[Tuple[KT, VT]]) -> None:
+        """Fill this empty Treap from pairs sorted by key; see `from_sorted`."""
+        self._link_sorted(self._nodes_from_sorted(pairs))
+
+    def _nodes_from_sorted(self, pairs: Iterable[Tuple[KT, VT]]) -> typing.Iterator[TreapNode]:
+        """Create a node for each distinct key of pairs sorted by key."""
+        last = None
+        for key, value in pairs:
+            # Repeated key -> update the previous node, which is not linked in yet
+            sort_key = self._sort_key_of(key)
+            if last is not None:
+                if sort_key < last.sort_key:
+                    raise ValueError("from_sorted requires keys in ascending order")
+                if not last.sort_key < sort_key:
+                    last.value = value
+                    continue
+            last = self._new_node(key, value, sort_key)
+            yield last
+
+    def _link_sorted(self, nodes: Iterable[TreapNode]) -> None:
+        """Make the nodes, in key order, the treap of their priorities in one pass.
+
+        The nodes' old links are overwritten, so this also rebuilds
+        existing nodes (see `compact`).
+        """
+        # The right spine of the treap built so far, from root to the last node
+        self.root = None
+        spine: List[TreapNode] = []
+        for x in nodes:
+            # Part 1) Nothing is linked below x yet
+            x.left_child = x.right_child = None
+
+            # Part 2) Pop the spine nodes with a lower priority; the last one popped becomes x's left subtree
+            # A popped node's subtree is complete, so its size is final
+            popped = None
+            while spine and spine[-1].priority < x.priority:
+                popped = spine.pop()
+                self._refresh(popped)
+            x.parent = None
+            if popped is not None:
+                x.left_child = popped
+                popped.parent = x
+
+            # Part 3) x becomes the right child of the remaining spine node (or the new root)
+            if spine:
+                spine[-1].right_child = x
+                x.parent = spine[-1]
+            else:
+                self.root = x
+            spine.append(x)
+
+        # Part 4) Finish the nodes still on the spine, deepest first
+        while spine:
+            self._refresh(spine.pop())
+
+    @classmethod
+    def from_items(
+        cls,
+        pairs: Iterable[Tuple[KT, VT]],
+        priority_source: Optional[Callable[[KT], int]] = None,
+        seed: Optional[int] = None,
+        monoid: Optional[Monoid] = None,
+        key_func: Optional[Callable[[KT], Any]] = None,
+    ) -> TreapMap[KT, VT]:
+        """Build a TreapMap from (key, value) pairs in any order.
+
+        Sorted input is built directly in O(n); otherwise the pairs are
+        sorted by key first (stably, so a repeated key keeps its last value)
+        and then built in one linear pass.
+
+        Args:
+            pairs: The (key, value) pairs to add.
+            priority_source: Passed on to the TreapMap constructor.
+            seed: Passed on to the TreapMap constructor.
+            monoid: Passed on to the TreapMap constructor.
+            key_func: Passed on to the TreapMap constructor.
+
+        Returns:
+            A new TreapMap containing the pairs.
+        """
+        return cls.from_sorted(cls._sorted_items(pairs, key_func), priority_source, seed, monoid, key_func)
+
+    @staticmethod
+    def _sorted_items(
+        pairs: Iterable[Tuple[KT, VT]], key_func: Optional[Callable[[KT], Any]] = None
+    ) -> List[Tuple[KT, VT]]:
+        """Return the pairs as a list sorted by key (or by `key_func` of the key), keeping the order of repeated keys."""
+        items = list(pairs)
+        if key_func is not None:
+            items.sort(key=lambda pair: key_func(pair[0]))
+            return items
+        # Only sort when some adjacent pair is out of order
+        for i in range(1, len(items)):
+            if items[i][0] < items[i - 1][0]:
+                items.sort(key=itemgetter(0))
+                break
+        return items
+
     def get_root_node(self) -> Optional[TreapNode]:
         """Return the internal TreeNode that represents the root
         element.
@@ -37,32 +314,47 @@ class TreapMap(Treap[KT, VT]):
         """
         return self.root
 
-    def _lookup_node(self, key:KT) -> Optional[TreapNode]:
+    def _lookup_node(self, sort_key: Any) -> Optional[TreapNode]:
         """Retrieve the TreapNode object associated with a key in this Treap.
 
+        Keys of built-in types take a three-way branch per level and stop
+        at the key. Other keys make one `<` comparison per level: the
+        descent keeps the last node whose key is not above `sort_key` and
+        goes all the way down, and a single comparison at the end tells
+        whether that node holds the key. For keys with costly comparisons
+        this halves the comparisons of testing `<` and `>` at every node.
+
         Args:
-            key: The key whose associated value should be retrieved.
+            sort_key: The `_sort_key_of` the key to find.
 
         Returns:
             The TreapNode object associated with the key, or `None` if the key
             is not in this Treap.
         """
         current = self.root
+        # Built-in keys compare in C, so stopping early at the key beats saving a comparison
+        if type(sort_key) in _BUILTIN_KEY_TYPES:
+            while current is not None:
+                node_key = current.sort_key
+                if sort_key < node_key:
+                    current = current.left_child
+                elif node_key < sort_key:
+                    current = current.right_child
+                else:
+                    return current
+            return None
+        candidate = None
         while current is not None:
-            # Go to the right side of tree
-            if current.key < key:
-                # Traverse down the tree with the newly assigned current node
-                current = current.right_child
-                if current is None:
-                    break
             # Go to the left side of tree
-            elif current.key > key:
+            if sort_key < current.sort_key:
                 current = current.left_child
-                if current is None:
-                    break
-            # Found the node ('if current.key = key')
+            # Go to the right side of tree, remembering the node as the last one not above the key
             else:
-                return current
+                candidate = current
+                current = current.right_child
+        # Found the node if the candidate is not below the key either
+        if candidate is not None and not candidate.sort_key < sort_key:
+            return candidate
         # Did not find the node
         return None
 
@@ -76,26 +368,89 @@ class TreapMap(Treap[KT, VT]):
             The value associated with the key, or `None` if the key
             is not in this Treap.
         """
-        node = self._lookup_node(key)
-        return node.value if node else None
+        # Inlined `_sort_key_of`: lookup is the hottest entry point
+        sort_key = key if self._key_func is None else self._key_func(key)
+        cache = self._cache
+        if cache is not None:
+            if sort_key in cache:
+                self._cache_hits += 1
+                cache.move_to_end(sort_key)
+                return cache[sort_key]
+            self._cache_misses += 1
+
+        node = self._lookup_node(sort_key) if self._fingers is None else self._finger_lookup(sort_key)
+        if node is None or node.value is _TOMBSTONE:
+            value = None
+        else:
+            if self._self_adjusting:
+                self._promote(node)
+            value = node.value
+
+        # Missing keys are cached too; inserting the key invalidates the entry
+        if cache is not None:
+            cache[sort_key] = value
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def cache_info(self) -> dict:
+        """Return the lookup cache's hits, misses, current size and maximum size.
+
+        All four are 0 when the map was created without `cache_size`.
+        """
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "size": len(self._cache) if self._cache is not None else 0,
+            "maxsize": self._cache_size,
+        }
+
+    def _lookup_mutates(self) -> bool:
+        """Tell whether `lookup` changes this Treap's state, so it cannot share a read lock.
+
+        Self-adjusting lookups rotate the tree, and finger and cache
+        lookups update their bookkeeping. Counters (`enable_counters`)
+        and latency histograms (`instrument`) are updated by lookups too.
+        """
+        return (
+            self._self_adjusting
+            or self._fingers is not None
+            or self._cache is not None
+            or "_counters" in self.__dict__
+            or "_latencies" in self.__dict__
+        )
+
+    def _promote(self, node: TreapNode) -> None:
+        """Raise the priority of an accessed node to the larger of it and a fresh draw.
+
+        The expected depth of a key stays O(log(N / c)) for c accesses
+        out of N, as in a treap weighted by access counts.
+        """
+        drawn = self._priority_source(node.key)
+        if drawn > node.priority:
+            node.priority = drawn
+            self._sift_up(node)
 
     def insert(self, key: KT, value: VT) -> None:
         """
         Add a key-value pair to this Treap.
         """
-        # Create object for new node 'x = TreapNode(key, value)'
-        x = TreapNode(key, value)
-        # call insert function to insert new node 'x' with a (key-value) pair
-        self._generic_insert(x, False)
+        # One descent finds either the existing node or the empty slot for the new one
+        sort_key = self._sort_key_of(key)
+        node, parent, is_left = self._descend(sort_key)
+        if node is not None:
+            self._set_value(node, value)
+            return
+        # Create object for new node 'x = TreapNode(key, value)' and hang it in the slot
+        self._attach(self._new_node(key, value, sort_key), parent, is_left)
 
     def insert_priority(self, key: KT, value: VT, priority) -> None:
         """
         Add a key-value-priority pair to this Treap.
         """
-        # Create object for new node 'x = TreapNode(key, value)'
-        x = TreapNode(key, value)
-        # Assign priority value to the new node 'x'
-        x.priority = priority
+        # Create object for new node 'x = TreapNode(key, value)' with the given priority
+        x = TreapNode(key, value, priority=priority)
+        x.sort_key = self._sort_key_of(key)
         # call insert function to insert new node 'x' with a (key-value) pair
         self._generic_insert(x, True)
 
@@ -104,64 +459,324 @@ class TreapMap(Treap[KT, VT]):
         Any old value associated with the key is lost.
 
         Insert node, with properties key & value, into appropriate position on tree. We first
-        (1) insert at the appropriate leaf position using property 'key' & following BST rules, and then
-        (2) fix property 'value' following Heap rules by rotating up the treap & reiterating with while loop until the parents have higher values
+        (1) find the existing node or the leaf position in a single descent following BST rules, and then
+        (2) fix property 'priority' following Heap rules by rotating the node up (or down, for a lowered priority)
 
         Args:
-            key: The key to add to this Treap. Cannot be None.
-            value: The value to associate with the key. Cannot be None.
+            x: The detached node holding the key and value to add.
+            priorityBool: Whether an existing node should also take the priority of `x`.
         """
+        # Part 1) Single descent for the key of 'x'
+        existing_node, parent, is_left = self._descend(x.sort_key)
+
+        # Part 2a) Key exists: replace the value (and the priority) in place
+        if existing_node is not None:
+            self._set_value(existing_node, x.value)
+            if priorityBool and existing_node.priority != x.priority:
+                raised = x.priority > existing_node.priority
+                existing_node.priority = x.priority
+                if raised:
+                    self._sift_up(existing_node)
+                else:
+                    self._sift_down(existing_node)
+        # Part 2b) Key doesn't exist: attach 'x' as a leaf and rotate it up
+        else:
+            self._attach(x, parent, is_left)
+
+    def _set_value(self, node: TreapNode, value: VT) -> None:
+        """Give an existing node a new value, reviving it if it is a tombstone."""
+        revived = node.value is _TOMBSTONE
+        node.value = value
+        if self._cache is not None:
+            self._cache.pop(node.sort_key, None)
+        # A revived node counts again in the sizes above it
+        if revived or self._monoid is not None:
+            self._refresh_upward(node)
+
+    def _descend(self, sort_key: Any) -> Tuple[Optional[TreapNode], Optional[TreapNode], bool]:
+        """Walk from the root towards the key with `sort_key` once.
+
+        Like `_lookup_node`, stops at the key for built-in key types and
+        otherwise makes one `<` comparison per level and one more at the end.
+
+        Returns:
+            A tuple (node, parent, is_left). `node` is the node holding
+            the key, or None if it is missing; in that case `parent` is the
+            node under which the key belongs (None for an empty treap) and
+            `is_left` tells on which side.
+        """
+        parent = None
+        is_left = False
+        current = self.root
+        if type(sort_key) in _BUILTIN_KEY_TYPES:
+            while current is not None:
+                node_key = current.sort_key
+                if sort_key < node_key:
+                    parent, is_left = current, True
+                    current = current.left_child
+                elif node_key < sort_key:
+                    parent, is_left = current, False
+                    current = current.right_child
+                else:
+                    return current, parent, is_left
+            return None, parent, is_left
+        candidate = None
+        while current is not None:
+            parent = current
+            # Go to left child if the key is less
+            if sort_key < current.sort_key:
+                is_left = True
+                current = current.left_child
+            # Otherwise go right, remembering the last node not above the key
+            else:
+                is_left = False
+                candidate = current
+                current = current.right_child
+        # Found the node
+        if candidate is not None and not candidate.sort_key < sort_key:
+            return candidate, candidate.parent, candidate.parent is not None and candidate is candidate.parent.left_child
+        return None, parent, is_left
+
+    def _attach(self, x: TreapNode, parent: Optional[TreapNode], is_left: bool) -> None:
+        """Hang the detached node 'x' in an empty slot found by `_descend`, then restore the heap property."""
+        # A cached miss for this key is now wrong
+        if self._cache is not None:
+            self._cache.pop(x.sort_key, None)
+        if self._monoid is not None:
+            self._refresh(x)
         # Part 0) Make the node the root if there's no tree
-        if self.root is None:
+        if parent is None:
             self.root = x
             return
+        # Part 1) Link 'x' as the left or right child of its parent
+        if is_left:
+            parent.left_child = x
+        else:
+            parent.right_child = x
+        x.parent = parent
 
-        # Part 1a) Check if a node with the same key already exists
-        # Go to (2) Heap property if it does already exist
-        existing_node = self._lookup_node(x.key)
-        if existing_node:
-            # Replace the value of the existing node
-            existing_node.value = x.value
-            if priorityBool:
-                existing_node.priority = x.priority
-            # Proceed to Part 2 with `existing_node` instead of `x`
-            x = existing_node  # Set x to the existing node for priority correction
-        # Part 1b) If key doesn't exist
-        # Insert new node 'x' into the correct location for property 'key' following BST rules
+        # Part 2) Count the new leaf in the subtree size (and aggregate) of every ancestor
+        if self._monoid is not None:
+            self._refresh_upward(parent)
         else:
-            # Traverse the tree to find the correct position of the new node 'x'
-            current = self.root
-            while True:
-                # Go to left child if new node's key is less
-                if x.key < current.key:
-                    # Assign the left child & parent (as its own) if there's no left child
-                    if current.left_child is None:
-                        current.left_child = x
-                        x.parent = current
-                        break # Once the new node is inserted, there's no need to continue to traverse the tree
-                    # Moves to the next node if the current node already has a left child
-                    else:
-                        current = current.left_child
-                # Go to right child if new node's key is greater
-                elif x.key > current.key:
-                    # Assign the right child & parent (as its own) if there's no right child
-                    if current.right_child is None:
-                        current.right_child = x
-                        x.parent = current
-                        break
-                    else:
-                        current = current.right_child
-
-        # Part 2) Correct new node 'x' into the correct location for property 'priority' following Heap rules
-        # Check's if new node 'x' is not the root & Heap property violated if 'x' priority is larger than its parent's priority
+            ancestor = parent
+            while ancestor is not None:
+                ancestor.size += 1
+                ancestor = ancestor.parent
+
+        # Part 3) Rotate 'x' up until its parent has a higher priority
+        self._sift_up(x)
+
+    def _sift_up(self, x: TreapNode) -> None:
+        """
+        Rotate x up while its priority is larger than its parent's priority
+        """
         while x.parent and x.priority > x.parent.priority:
-            # if the new node 'x' is the left child
+            # if the node 'x' is the left child
             if x == x.parent.left_child:
                 self._rotate_right(x.parent)
-            # if the new node 'x' is the right child
+            # if the node 'x' is the right child
             else:
                 self._rotate_left(x.parent)
 
+    def _sift_down(self, x: TreapNode) -> None:
+        """
+        Rotate x down while one of its children has a larger priority
+        """
+        while True:
+            left, right = x.left_child, x.right_child
+            # Pick the child with the larger priority
+            if left and (right is None or left.priority > right.priority):
+                if left.priority <= x.priority:
+                    return
+                self._rotate_right(x)
+            elif right:
+                if right.priority <= x.priority:
+                    return
+                self._rotate_left(x)
+            else:
+                return
+
+    def insert_many(self, pairs: Iterable[Tuple[KT, VT]]) -> None:
+        """Add a batch of key-value pairs to this Treap.
+
+        The batch is sorted if it is not already, built into a treap in
+        one linear pass with `from_sorted`, and melded in. For a batch of
+        k pairs this costs O(k log(n/k + 1)) tree work instead of k
+        separate descents from the root. Later pairs win over earlier
+        ones and over existing values, as with repeated `insert` calls.
+
+        Args:
+            pairs: The (key, value) pairs to add.
+        """
+        batch = self._empty_like()
+        batch._build_sorted(self._sorted_items(pairs, self._key_func))
+        self.meld(batch, "right")
+
+    def lookup_many(self, keys: Iterable[KT]) -> List[Optional[VT]]:
+        """Retrieve the values for a batch of keys.
+
+        For a sorted batch, each search starts from the node where the
+        previous one ended (finger search) instead of from the root, so
+        nearby keys are found after a short climb.
+
+        Args:
+            keys: The keys to look up, ideally in ascending order.
+
+        Returns:
+            The value for each key, or `None` for keys not in this Treap,
+            in the order of `keys`.
+        """
+        results: List[Optional[VT]] = []
+        finger = self.root
+        previous = None
+        for key in keys:
+            sort_key = self._sort_key_of(key)
+            # Out-of-order keys restart from the root
+            if previous is not None and sort_key < previous:
+                finger = self.root
+            previous = sort_key
+            if finger is None:
+                results.append(None)
+                continue
+            node, finger = self._finger_search(finger, sort_key)
+            results.append(node.value if node is not None and node.value is not _TOMBSTONE else None)
+        return results
+
+    def _finger_lookup(self, sort_key: Any) -> Optional[TreapNode]:
+        """Find the node with a sort key starting from the fingers, and update them."""
+        fingers = self._fingers
+        if not fingers:
+            if self.root is None:
+                return None
+            node, last = self._finger_search(self.root, sort_key)
+        else:
+            # Part 1) A key looked up recently is taken straight from the older fingers
+            node = None
+            for i in range(1, len(fingers)):
+                finger = fingers[i]
+                if not (finger.sort_key < sort_key or sort_key < finger.sort_key):
+                    node = last = finger
+                    del fingers[i]
+                    break
+            # Part 2) Otherwise search from the most recent finger
+            if node is None:
+                node, last = self._finger_search(fingers[0], sort_key)
+                if last is not fingers[0] and last in fingers:
+                    fingers.remove(last)
+        # Part 3) The last visited node becomes the most recent finger
+        if not fingers or fingers[0] is not last:
+            fingers.appendleft(last)
+        return node
+
+    def _finger_search(self, finger: TreapNode, key: Any) -> Tuple[Optional[TreapNode], TreapNode]:
+        """Search for the sort key `key` starting at the node `finger` instead of the root.
+
+        Climbs from the finger to the lowest ancestor whose subtree can
+        hold `key`, then descends from there. This costs O(log d)
+        expected time where d is the rank distance between the two keys.
+
+        Returns:
+            A tuple (node, last): the node holding `key` (or None), and
+            the last node visited, to use as the next finger.
+        """
+        current = finger
+        # Part 1) Climb while the key lies outside the current subtree's key range
+        if key < current.sort_key:
+            while current.parent is not None:
+                parent = current.parent
+                # Coming up from a right child: parent's key is the lower bound of this subtree
+                if current is parent.right_child and parent.sort_key < key:
+                    break
+                current = parent
+        elif current.sort_key < key:
+            while current.parent is not None:
+                parent = current.parent
+                # Coming up from a left child: parent's key is the upper bound of this subtree
+                if current is parent.left_child and key < parent.sort_key:
+                    break
+                current = parent
+        else:
+            return current, current
+
+        # Part 2) Ordinary descent from there
+        while True:
+            if key < current.sort_key:
+                if current.left_child is None:
+                    return None, current
+                current = current.left_child
+            elif current.sort_key < key:
+                if current.right_child is None:
+                    return None, current
+                current = current.right_child
+            else:
+                return current, current
+
+    def setdefault(self, key: KT, default: VT) -> VT:
+        """Return the value for `key`, inserting `default` if it is missing.
+
+        Uses a single descent.
+
+        Args:
+            key: The key to look up.
+            default: The value to insert if `key` is missing.
+
+        Returns:
+            The existing value, or `default` after inserting it.
+        """
+        sort_key = self._sort_key_of(key)
+        node, parent, is_left = self._descend(sort_key)
+        if node is not None:
+            if node.value is _TOMBSTONE:
+                self._set_value(node, default)
+            return node.value
+        self._attach(self._new_node(key, default, sort_key), parent, is_left)
+        return default
+
+    def get_or_insert(self, key: KT, factory: Callable[[], VT]) -> VT:
+        """Return the value for `key`, inserting `factory()` if it is missing.
+
+        `factory` is only called when the key is missing.
+
+        Args:
+            key: The key to look up.
+            factory: Builds the value to insert.
+
+        Returns:
+            The existing or newly inserted value.
+        """
+        sort_key = self._sort_key_of(key)
+        node, parent, is_left = self._descend(sort_key)
+        if node is not None:
+            if node.value is _TOMBSTONE:
+                self._set_value(node, factory())
+            return node.value
+        value = factory()
+        self._attach(self._new_node(key, value, sort_key), parent, is_left)
+        return value
+
+    def update_with(self, key: KT, fn: Callable[[VT], VT], default: Optional[VT] = None) -> VT:
+        """Replace the value for `key` with `fn(value)` in a single descent.
+
+        A missing key is inserted with `fn(default)`, so counters can be
+        kept with `update_with(key, lambda n: n + 1, 0)`.
+
+        Args:
+            key: The key whose value to update.
+            fn: Computes the new value from the current one.
+            default: Passed to `fn` when `key` is missing.
+
+        Returns:
+            The new value.
+        """
+        sort_key = self._sort_key_of(key)
+        node, parent, is_left = self._descend(sort_key)
+        if node is not None:
+            self._set_value(node, fn(default if node.value is _TOMBSTONE else node.value))
+            return node.value
+        value = fn(default)
+        self._attach(self._new_node(key, value, sort_key), parent, is_left)
+        return value
 
     def remove(self, key: KT) -> Optional[VT]:
         """Remove a key from this Treap.
@@ -177,10 +792,19 @@ class TreapMap(Treap[KT, VT]):
             is not present.
         """
         # Part 1) Find the deleted node x
-        x = self._lookup_node(key)
+        x = self._lookup_node(self._sort_key_of(key))
         # Key is not found
-        if x is None:
+        if x is None or x.value is _TOMBSTONE:
             return None
+        if self._cache is not None:
+            self._cache.pop(x.sort_key, None)
+        # Lazy-delete mode: mark x as a tombstone, uncount it on the path, and compact when too many pile up
+        if self._lazy_delete is not None:
+            value = x.value
+            x.value = _TOMBSTONE
+            self._refresh_upward(x)
+            self._compact_if_needed()
+            return value
 
         # Part 2) Repeatedly rotate until the node becomes a leaf node
         # Not a leaf node if one of the child nodes exist
@@ -211,6 +835,19 @@ class TreapMap(Treap[KT, VT]):
         else:
             x.parent.right_child = None
 
+        # x is no longer in this Treap, so it cannot be a starting point for lookups
+        if self._fingers and x in self._fingers:
+            self._fingers.remove(x)
+
+        # Part 4) Uncount x from the subtree size (and aggregate) of every ancestor
+        if self._monoid is not None:
+            self._refresh_upward(x.parent)
+        else:
+            ancestor = x.parent
+            while ancestor is not None:
+                ancestor.size -= 1
+                ancestor = ancestor.parent
+
         return x.value
 
     def _rotate_left(self, node: TreapNode):
@@ -229,6 +866,9 @@ class TreapMap(Treap[KT, VT]):
         new_root.left_child = node
         # Update parent's attribute
         self._update_parents(node, new_root)
+        # Node is now the child of new_root, so its size is recomputed first
+        self._refresh(node)
+        self._refresh(new_root)
 
     def _rotate_right(self, node: TreapNode):
         """
@@ -246,6 +886,9 @@ class TreapMap(Treap[KT, VT]):
         new_root.right_child = node
         # Update parent's attribute
         self._update_parents(node, new_root)
+        # Node is now the child of new_root, so its size is recomputed first
+        self._refresh(node)
+        self._refresh(new_root)
 
     def _update_parents(self, node:TreapNode, new_root:TreapNode):
         """
@@ -267,6 +910,42 @@ class TreapMap(Treap[KT, VT]):
         # Node sets new parent to the new root
         node.parent = new_root
 
+    def _refresh(self, node: TreapNode) -> None:
+        """
+        Recompute the subtree size (and monoid aggregate) cached on node from its children
+        """
+        left, right = node.left_child, node.right_child
+        # Tombstones stay in the tree but not in the sizes
+        live = node.value is not _TOMBSTONE
+        size = 1 if live else 0
+        dead = 0 if live else 1
+        if left:
+            size += left.size
+            dead += left.dead
+        if right:
+            size += right.size
+            dead += right.dead
+        node.size = size
+        node.dead = dead
+
+        monoid = self._monoid
+        if monoid is not None:
+            # Combine in key order: left subtree, this node, right subtree
+            aggregate = monoid.project(node.value) if live else monoid.identity
+            if left:
+                aggregate = monoid.combine(left.aggregate, aggregate)
+            if right:
+                aggregate = monoid.combine(aggregate, right.aggregate)
+            node.aggregate = aggregate
+
+    def _refresh_upward(self, node: Optional[TreapNode]) -> None:
+        """
+        Refresh node and every ancestor of node, bottom-up
+        """
+        while node is not None:
+            self._refresh(node)
+            node = node.parent
+
     def split(self, threshold: KT) -> List[Treap[KT, VT]]:
         """Split this Treap into two Treaps.
 
@@ -274,55 +953,34 @@ class TreapMap(Treap[KT, VT]):
         the right Treap should contain values greater than or equal to
         `threshold`.
 
+        The split walks one root-to-leaf path and relinks the existing
+        nodes, so it takes O(log n), allocates no nodes and works for any
+        threshold, present or not. This Treap is left empty.
+
         Args:
-            key: The key to split this Treap with.
+            threshold: The key to split this Treap with.
 
         Returns:
             A list containing two Treaps. The left Treap should be
             in index 0 and the right Treap should be in index 1.
         """
-        # Part 0) Splitting an empty tree
-        if self.root is None:
-            return [TreapMap(), TreapMap()]
-
-        # Part 1) Looking up if the node exists in the Treap. If it does, will return its own value. If it doesn't exist, will return None.
-        existing_node = self._lookup_node(threshold)
-        existing_node_value = existing_node.value
-        existing_node_priority = existing_node.priority
-
-        #Part 2) Insert the split node if it doesn't exist. If it does exist, save settings
-        # Node doesn't exist -> value set as None -> deletes node after splitting since 'None' indicates a temp node
-        if existing_node is None:
-            split_node = TreapNode(threshold, None)
-        # Node exists -> set value as itself
-        else:
-            split_node = TreapNode(threshold, existing_node.value)
-        #split_node.priority = TreapNode.MAX_PRIORITY
-        # Insert the split node because it doesn't exist -> makes it easier for splitting the tree b/c split_node will be new root due to MAX_PRIORITY
-        self.insert_priority(split_node.key, split_node.value, TreapNode.MAX_PRIORITY)
-
-        # Part 3) Split the Treap into 2 Treaps (t1, t2)
-        # Objects for left & right trees
-        t1 = TreapMap()
-        t2 = TreapMap()
-        # Split from the newly inserted node, which is the root now b/c MAX_PRIORITY
-        # If there's no left child, t1 = None
-        # Split into the left subtree
-        if self.root.left_child:
-            # Assign the left child of the root as the new root of t1
-            t1.root = self.root.left_child
-            # Disconnects from the original parent
-            t1.root.parent = None
-        # If there's no right child, t2 = None
-        # Split into the right subtree
-        if self.root.right_child:
-            # Assign the right child of the root as the new root of t2
-            t2.root = self.root.right_child
-            # Disconnects from the original parent
-            t2.root.parent = None
-
-        if existing_node:
-            t2.insert_priority(existing_node.key, existing_node_value, existing_node_priority)
+        # Part 0) Drop the fingers and cached lookups, which the parts could not track
+        self._before_restructure()
+        # Part 1) Split the nodes into keys below, equal to and above the threshold
+        low, equal, high = self._split_nodes(self.root, self._sort_key_of(threshold))
+        # Part 2) The node equal to the threshold belongs to the right Treap
+        if equal is not None:
+            high = self._join_nodes(equal, high)
+
+        # Part 3) Hand the two halves to new Treaps; this Treap keeps nothing
+        t1 = self._empty_like()
+        t2 = self._empty_like()
+        t1.root = self._detached(low)
+        t2.root = self._detached(high)
+        self.root = None
+        # Each part counts its own tombstones and may have crossed the threshold alone
+        t1._compact_if_needed()
+        t2._compact_if_needed()
         return [t1, t2]
 
     def join(self, other: Treap[KT, VT]) -> None:
@@ -331,45 +989,912 @@ class TreapMap(Treap[KT, VT]):
         At the end of the join, this Treap will contain the result.
         This method may destructively modify both Treaps.
 
+        Every key of this Treap must be smaller than every key of
+        `other`. The two treaps are merged along the right spine of this
+        Treap and the left spine of `other` in O(log n), without a
+        temporary root node. `other` is left empty.
+
         Args:
             other: The Treap to join with.
+
+        Raises:
+            ValueError: If the key ranges of the two Treaps overlap, or
+                if they have different monoids or key functions.
         """
+        self._check_compatible(other)
+        # Part 0) Drop fingers, then the largest key here must be below the smallest key of other
+        self._before_restructure(other)
+        if self.root is not None and other.root is not None:
+            # Tombstones at the two ends may overlap the other range even though the keys do not
+            if not self._last_node().sort_key < other._first_node().sort_key and (self._dead or getattr(other, "_dead", 0)):
+                self.compact()
+                other.compact()
+            if self.root is not None and other.root is not None and not self._last_node().sort_key < other._first_node().sort_key:
+                raise ValueError("join requires every key of this Treap to be smaller than every key of other")
+
+        # Part 1) Merge the two spines
+        self.root = self._detached(self._join_nodes(self.root, other.root))
+        other.root = None
+        self._compact_if_needed()
+
+    def __len__(self) -> int:
+        """Return the number of keys in this Treap in O(1)."""
+        return self.root.size if self.root else 0
+
+    def select(self, k: int) -> KT:
+        """Return the k-th smallest key in O(log n).
+
+        Args:
+            k: The zero-based rank of the key. Negative values count
+                from the largest key, as with list indexing.
+
+        Returns:
+            The key with exactly `k` smaller keys in this Treap.
+
+        Raises:
+            IndexError: If `k` is out of range.
+        """
+        n = len(self)
+        if k < 0:
+            k += n
+        if not 0 <= k < n:
+            raise IndexError("select index out of range")
+        current = self.root
+        while True:
+            left_size = current.left_child.size if current.left_child else 0
+            live = current.value is not _TOMBSTONE
+            # The k-th key is in the left subtree
+            if k < left_size:
+                current = current.left_child
+            # The k-th key is this node
+            elif k == left_size and live:
+                return current.key
+            # Skip the left subtree and this node, then continue on the right
+            else:
+                k -= left_size + live
+                current = current.right_child
+
+    def rank(self, key: KT) -> int:
+        """Return the number of keys smaller than `key` in O(log n).
+
+        `key` does not need to be in this Treap; if it is, this is its
+        zero-based position in sorted order.
+
+        Args:
+            key: The key to rank.
+        """
+        return self._rank(key, False)
+
+    def _rank(self, key: KT, inclusive: bool) -> int:
+        """Count the keys smaller than `key`, or not larger if `inclusive`."""
+        key = self._sort_key_of(key)
+        result = 0
+        current = self.root
+        while current is not None:
+            if current.sort_key < key or (inclusive and not key < current.sort_key):
+                # This node and its whole left subtree are before key
+                result += (current.value is not _TOMBSTONE) + (current.left_child.size if current.left_child else 0)
+                current = current.right_child
+            else:
+                current = current.left_child
+        return result
+
+    def median(self) -> KT:
+        """Return the median key (the lower one for an even count) in O(log n).
+
+        Raises:
+            IndexError: If this Treap is empty.
+        """
+        return self.select((len(self) - 1) // 2)
+
+    def aggregate(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+    ) -> Any:
+        """Combine the values of the keys between `lo` and `hi` in O(log n).
+
+        Values are combined in key order with this map's monoid, using
+        the aggregates cached on the O(log n) subtrees that exactly cover
+        the range.
+
+        Args:
+            lo: The lower bound, or None for no lower bound.
+            hi: The upper bound, or None for no upper bound.
+            inclusive: Whether each of `lo` and `hi` is included.
+
+        Returns:
+            The combined value, or the monoid's identity for an empty range.
+
+        Raises:
+            ValueError: If this TreapMap was created without a monoid.
+        """
+        monoid = self._monoid
+        if monoid is None:
+            raise ValueError("aggregate requires a TreapMap created with a monoid")
+        combine = monoid.combine
+
+        def project(value: VT) -> Any:
+            # Tombstones contribute nothing
+            return monoid.identity if value is _TOMBSTONE else monoid.project(value)
+
+        lo_inclusive, hi_inclusive = inclusive
+        lo = None if lo is None else self._sort_key_of(lo)
+        hi = None if hi is None else self._sort_key_of(hi)
+
+        def after_lo(key: KT) -> bool:
+            return lo is None or lo < key or (lo_inclusive and not key < lo)
+
+        def before_hi(key: KT) -> bool:
+            return hi is None or key < hi or (hi_inclusive and not hi < key)
+
+        # Part 1) Find the highest node in range, where the paths to the two bounds part
+        top = self.root
+        while top is not None:
+            if not after_lo(top.sort_key):
+                top = top.right_child
+            elif not before_hi(top.sort_key):
+                top = top.left_child
+            else:
+                break
+        if top is None:
+            return monoid.identity
+
+        # Part 2) Left of top: every node in range brings its right subtree along
+        low_part = monoid.identity
+        current = top.left_child
+        while current is not None:
+            if after_lo(current.sort_key):
+                piece = project(current.value)
+                if current.right_child:
+                    piece = combine(piece, current.right_child.aggregate)
+                low_part = combine(piece, low_part)
+                current = current.left_child
+            else:
+                current = current.right_child
+
+        # Part 3) Right of top: every node in range brings its left subtree along
+        high_part = monoid.identity
+        current = top.right_child
+        while current is not None:
+            if before_hi(current.sort_key):
+                piece = project(current.value)
+                if current.left_child:
+                    piece = combine(current.left_child.aggregate, piece)
+                high_part = combine(high_part, piece)
+                current = current.right_child
+            else:
+                current = current.left_child
+
+        return combine(combine(low_part, project(top.value)), high_part)
+
+    def irange(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+        reverse: bool = False,
+    ) -> typing.Iterator[KT]:
+        """Iterate over the keys between `lo` and `hi` in sorted order.
+
+        Only the O(log n) nodes on the path to the first key in range
+        and the k keys in range are visited.
+
+        Args:
+            lo: The lower bound, or None for no lower bound.
+            hi: The upper bound, or None for no upper bound.
+            inclusive: Whether each of `lo` and `hi` is included.
+            reverse: Iterate from `hi` down to `lo` instead.
+        """
+        for node in self._range_nodes(lo, hi, inclusive, reverse):
+            yield node.key
+
+    def items_range(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+        reverse: bool = False,
+    ) -> typing.Iterator[Tuple[KT, VT]]:
+        """Iterate over the (key, value) pairs between `lo` and `hi`.
+
+        Takes the same arguments as `irange`.
+        """
+        for node in self._range_nodes(lo, hi, inclusive, reverse):
+            yield node.key, node.value
+
+    def count_range(
+        self,
+        lo: Optional[KT] = None,
+        hi: Optional[KT] = None,
+        inclusive: Tuple[bool, bool] = (True, False),
+    ) -> int:
+        """Count the keys between `lo` and `hi` in O(log n) using subtree sizes.
+
+        Takes the same bounds as `irange`.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        # Keys before the upper bound minus keys before the lower bound
+        end = len(self) if hi is None else self._rank(hi, hi_inclusive)
+        start = 0 if lo is None else self._rank(lo, not lo_inclusive)
+        return max(0, end - start)
+
+    def _range_nodes(
+        self,
+        lo: Optional[KT],
+        hi: Optional[KT],
+        inclusive: Tuple[bool, bool],
+        reverse: bool,
+    ) -> typing.Iterator[TreapNode]:
+        """Yield the nodes with keys between `lo` and `hi` in key order.
+
+        Seeks the first node in range in O(log n), then steps along
+        successor (or predecessor) links until the first node out of range.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        lo = None if lo is None else self._sort_key_of(lo)
+        hi = None if hi is None else self._sort_key_of(hi)
+        if reverse:
+            node = self._seek(hi, hi_inclusive, True)
+            while node is not None and (lo is None or lo < node.sort_key or (lo_inclusive and not node.sort_key < lo)):
+                if node.value is not _TOMBSTONE:
+                    yield node
+                node = self._predecessor(node)
+        else:
+            node = self._seek(lo, lo_inclusive, False)
+            while node is not None and (hi is None or node.sort_key < hi or (hi_inclusive and not hi < node.sort_key)):
+                if node.value is not _TOMBSTONE:
+                    yield node
+                node = self._successor(node)
+
+    def _seek(self, key: Optional[Any], inclusive: bool, reverse: bool) -> Optional[TreapNode]:
+        """Find the node an iteration starting at the sort key `key` begins with.
+
+        Forwards this is the smallest key after `key` (or equal to it if
+        `inclusive`); in reverse it is the largest key before `key`. A
+        `key` of None means the first (or last) node.
+        """
+        if key is None:
+            return self._last_node() if reverse else self._first_node()
+        found = None
+        current = self.root
+        while current is not None:
+            # Reverse seeking mirrors the comparisons and the children
+            if reverse:
+                if current.sort_key < key or (inclusive and not key < current.sort_key):
+                    found = current
+                    current = current.right_child
+                else:
+                    current = current.left_child
+            elif key < current.sort_key or (inclusive and not current.sort_key < key):
+                found = current
+                current = current.left_child
+            else:
+                current = current.right_child
+        return found
+
+    def _first_node(self) -> Optional[TreapNode]:
+        """Return the node with the smallest key, or None if empty."""
+        current = self.root
+        if current is not None:
+            while current.left_child is not None:
+                current = current.left_child
+        return current
+
+    def _last_node(self) -> Optional[TreapNode]:
+        """Return the node with the largest key, or None if empty."""
+        current = self.root
+        if current is not None:
+            while current.right_child is not None:
+                current = current.right_child
+        return current
+
+    @staticmethod
+    def _successor(node: TreapNode) -> Optional[TreapNode]:
+        """Return the node with the next larger key, using parent pointers.
+
+        Walking a whole treap this way touches each edge twice, so each
+        step costs O(1) amortized.
+        """
+        # Part 1) The leftmost node of the right subtree comes next
+        if node.right_child is not None:
+            node = node.right_child
+            while node.left_child is not None:
+                node = node.left_child
+            return node
+        # Part 2) Otherwise climb until we come up from a left child
+        parent = node.parent
+        while parent is not None and node is parent.right_child:
+            node = parent
+            parent = node.parent
+        return parent
+
+    @staticmethod
+    def _predecessor(node: TreapNode) -> Optional[TreapNode]:
+        """Return the node with the next smaller key, using parent pointers."""
+        # Part 1) The rightmost node of the left subtree comes next
+        if node.left_child is not None:
+            node = node.left_child
+            while node.right_child is not None:
+                node = node.right_child
+            return node
+        # Part 2) Otherwise climb until we come up from a right child
+        parent = node.parent
+        while parent is not None and node is parent.left_child:
+            node = parent
+            parent = node.parent
+        return parent
+
+    def keys(self) -> typing.Iterator[KT]:
+        """Iterate over the keys in sorted order."""
+        return iter(self)
+
+    def values(self) -> typing.Iterator[VT]:
+        """Iterate over the values in key order."""
+        node = self._first_node()
+        while node is not None:
+            if node.value is not _TOMBSTONE:
+                yield node.value
+            node = self._successor(node)
+
+    def items(self) -> typing.Iterator[Tuple[KT, VT]]:
+        """Iterate over the (key, value) pairs in key order."""
+        node = self._first_node()
+        while node is not None:
+            if node.value is not _TOMBSTONE:
+                yield node.key, node.value
+            node = self._successor(node)
+
+    def __reversed__(self) -> typing.Iterator[KT]:
+        """Iterate over the keys from largest to smallest."""
+        node = self._last_node()
+        while node is not None:
+            if node.value is not _TOMBSTONE:
+                yield node.key
+            node = self._predecessor(node)
+
+    def iter_from(self, key: KT, reverse: bool = False) -> typing.Iterator[KT]:
+        """Iterate over the keys starting at `key`.
+
+        `key` does not need to be in this Treap.
+
+        Args:
+            key: Start at the first key >= `key` (or the last key <= `key`
+                when `reverse` is set).
+            reverse: Iterate towards smaller keys.
+        """
+        if reverse:
+            return self.irange(hi=key, inclusive=(True, True), reverse=True)
+        return self.irange(lo=key)
+
+    def meld(self, other: Treap[KT, VT], combine: Union[str, Callable[[VT, VT], VT]] = "right") -> None: # KARMA
+        """Meld this Treap with another Treap (set union of the keys).
+
+        Uses the split-based union: the root with the higher priority
+        stays on top, the other treap is split around its key, and the
+        two halves are melded into its subtrees recursively. This costs
+        O(m log(n/m + 1)) for treaps of sizes m <= n, instead of the
+        O(m log n) of inserting every key.
+
+        At the end of the meld, this Treap contains the result and
+        `other` is empty.
+
+        Args:
+            other: The Treap to meld with.
+            combine: How to resolve a key present in both treaps: "left"
+                keeps this Treap's value, "right" keeps `other`'s value,
+                and a callable gets (this value, other value) and returns
+                the value to keep.
+
+        Raises:
+            ValueError: If `combine` is not "left", "right" or callable,
+                if `other` is this Treap, or if the two have different
+                monoids or key functions.
+        """
+        self._reject_self(other, "meld")
+        self._check_compatible(other)
+        resolve = self._resolver(combine)
+        self._before_restructure(other)
+        self.root = self._detached(self._union(self.root, other.root, resolve, True))
+        other.root = None
+        self._compact_if_needed()
+
+    def _reject_self(self, other: Treap[KT, VT], operation: str) -> None:
+        """Raise ValueError if a two-treap operation was given this Treap as `other`.
+
+        The operations split `other` around this Treap's nodes and empty
+        it at the end, so running one on a single tree would lose keys.
+        """
+        if other is self:
+            raise ValueError(f"cannot {operation} a Treap with itself")
+
+    def _check_compatible(self, other: Treap[KT, VT]) -> None:
+        """Raise ValueError if `other`'s nodes cannot be linked into this Treap.
+
+        Nodes keep the aggregates of their own map's monoid and the sort
+        keys of their own map's key_func, so subtrees moved between maps
+        that differ in either would be combined with the wrong aggregates
+        or ordered by the wrong keys. This is checked before any node is
+        touched.
+        """
+        if getattr(other, "_monoid", None) is not self._monoid:
+            raise ValueError("cannot combine Treaps that keep different monoids")
+        if getattr(other, "_key_func", None) is not self._key_func:
+            raise ValueError("cannot combine Treaps ordered by different key functions")
+
+    @staticmethod
+    def _resolver(combine: Union[str, Callable[[VT, VT], VT]]) -> Callable[[VT, VT], VT]:
+        """Turn a `combine` policy into a function of (left value, right value)."""
+        if combine == "left":
+            return lambda left, right: left
+        if combine == "right":
+            return lambda left, right: right
+        if callable(combine):
+            return combine
+        raise ValueError(f"combine must be 'left', 'right' or a callable, not {combine!r}")
+
+    def _union(
+        self,
+        a: Optional[TreapNode],
+        b: Optional[TreapNode],
+        resolve: Callable[[VT, VT], VT],
+        a_is_left: bool,
+    ) -> Optional[TreapNode]:
+        """Meld the subtrees `a` and `b` and return the root of the result.
+
+        `a_is_left` tells whether `a` came from the left operand of the
+        meld, so duplicate values are passed to `resolve` in order.
+        """
+        if a is None:
+            return b
+        if b is None:
+            return a
+        # Part 1) Keep the higher priority root on top
+        if a.priority < b.priority:
+            a, b = b, a
+            a_is_left = not a_is_left
+        # Part 2) Split the other subtree around the root's key; a matching node is merged into the root
+        low, duplicate, high = self._split_nodes(b, a.sort_key)
+        # A tombstone on either side means the key is only in the other one
+        if duplicate is not None and duplicate.value is not _TOMBSTONE:
+            if a.value is _TOMBSTONE:
+                a.key, a.value = duplicate.key, duplicate.value
+            else:
+                a.value = resolve(a.value, duplicate.value) if a_is_left else resolve(duplicate.value, a.value)
+        # Part 3) Meld each half into the matching side of the root
+        self._set_left(a, self._union(a.left_child, low, resolve, a_is_left))
+        self._set_right(a, self._union(a.right_child, high, resolve, a_is_left))
+        return a
+
+    def _split_nodes(
+        self, node: Optional[TreapNode], key: Any
+    ) -> Tuple[Optional[TreapNode], Optional[TreapNode], Optional[TreapNode]]:
+        """Split the subtree at `node` around the sort key `key`, destructively.
+
+        Returns:
+            A tuple (low, equal, high): the roots of the subtrees holding
+            the keys below and above `key`, and the detached node holding
+            `key` itself (or None). Roots may keep a stale parent pointer;
+            callers link them with `_set_left`/`_set_right` or `_detached`.
+        """
+        if node is None:
+            return None, None, None
+        # The node and its left subtree are below key; split its right subtree
+        if node.sort_key < key:
+            low, equal, high = self._split_nodes(node.right_child, key)
+            self._set_right(node, low)
+            return node, equal, high
+        # The node and its right subtree are above key; split its left subtree
+        if key < node.sort_key:
+            low, equal, high = self._split_nodes(node.left_child, key)
+            self._set_left(node, high)
+            return low, equal, node
+        # The node holds key: its two subtrees are the two halves
+        low, high = node.left_child, node.right_child
+        node.left_child = node.right_child = None
+        self._refresh(node)
+        return low, node, high
+
+    def _set_left(self, node: TreapNode, child: Optional[TreapNode]) -> None:
+        """
+        Make child the left subtree of node and refresh node's cached size
+        """
+        node.left_child = child
+        if child is not None:
+            child.parent = node
+        self._refresh(node)
+
+    def _set_right(self, node: TreapNode, child: Optional[TreapNode]) -> None:
+        """
+        Make child the right subtree of node and refresh node's cached size
+        """
+        node.right_child = child
+        if child is not None:
+            child.parent = node
+        self._refresh(node)
+
+    @staticmethod
+    def _detached(node: Optional[TreapNode]) -> Optional[TreapNode]:
+        """
+        Clear the parent pointer of a subtree root so it can become a treap root
+        """
+        if node is not None:
+            node.parent = None
+        return node
+
+    def difference(self, other: Treap[KT, VT]) -> None: # KARMA
+        """Remove the keys of another Treap from this Treap.
+
+        Splits `other` around each root key of this Treap and recurses,
+        joining the two sides back together wherever a key is dropped,
+        so no per-key removal is done.
+
+        At the end, this Treap holds its keys that are not in `other`,
+        and `other` is empty.
+
+        Args:
+            other: A Treap containing elements to remove from this Treap.
+
+        Raises:
+            ValueError: If `other` is this Treap, or has a different
+                monoid or key function.
+        """
+        self._reject_self(other, "difference")
+        self._check_compatible(other)
+        self._before_restructure(other)
+        self.root = self._detached(self._difference(self.root, other.root))
+        other.root = None
+        self._compact_if_needed()
+
+    def intersection(self, other: Treap[KT, VT], combine: Union[str, Callable[[VT, VT], VT]] = "left") -> None:
+        """Keep only the keys that are also in another Treap.
+
+        At the end, this Treap holds the keys present in both treaps,
+        and `other` is empty.
+
+        Args:
+            other: The Treap to intersect with.
+            combine: Which value a kept key ends up with; see `meld`.
+                Defaults to this Treap's value.
+
+        Raises:
+            ValueError: If `other` is this Treap, or has a different
+                monoid or key function.
+        """
+        self._reject_self(other, "intersect")
+        self._check_compatible(other)
+        resolve = self._resolver(combine)
+        self._before_restructure(other)
+        self.root = self._detached(self._intersection(self.root, other.root, resolve))
+        other.root = None
+        self._compact_if_needed()
+
+    def symmetric_difference(self, other: Treap[KT, VT]) -> None:
+        """Keep the keys that are in exactly one of the two treaps.
+
+        At the end, this Treap holds the result and `other` is empty.
+
+        Args:
+            other: The Treap to combine with.
+
+        Raises:
+            ValueError: If `other` is this Treap, or has a different
+                monoid or key function.
+        """
+        self._reject_self(other, "take the symmetric difference of")
+        self._check_compatible(other)
+        self._before_restructure(other)
+        self.root = self._detached(self._symmetric_difference(self.root, other.root))
+        other.root = None
+        self._compact_if_needed()
+
+    def _difference(self, a: Optional[TreapNode], b: Optional[TreapNode]) -> Optional[TreapNode]:
+        """Return the root of the subtree `a` without the keys of subtree `b`."""
+        if a is None or b is None:
+            return a
+        low, duplicate, high = self._split_nodes(b, a.sort_key)
+        left = self._difference(a.left_child, low)
+        right = self._difference(a.right_child, high)
+        # The root's key is in b -> drop the root and join what is left of its subtrees
+        if duplicate is not None and duplicate.value is not _TOMBSTONE:
+            return self._join_nodes(left, right)
+        self._set_left(a, left)
+        self._set_right(a, right)
+        return a
+
+    def _intersection(
+        self, a: Optional[TreapNode], b: Optional[TreapNode], resolve: Callable[[VT, VT], VT]
+    ) -> Optional[TreapNode]:
+        """Return the root of the subtree of `a` keys that also appear in subtree `b`."""
+        if a is None or b is None:
+            return None
+        low, duplicate, high = self._split_nodes(b, a.sort_key)
+        left = self._intersection(a.left_child, low, resolve)
+        right = self._intersection(a.right_child, high, resolve)
+        # The root's key is missing from b (or removed on either side) -> drop the root
+        if duplicate is None or duplicate.value is _TOMBSTONE or a.value is _TOMBSTONE:
+            return self._join_nodes(left, right)
+        a.value = resolve(a.value, duplicate.value)
+        self._set_left(a, left)
+        self._set_right(a, right)
+        return a
+
+    def _symmetric_difference(self, a: Optional[TreapNode], b: Optional[TreapNode]) -> Optional[TreapNode]:
+        """Return the root of the keys that are in exactly one of subtrees `a` and `b`."""
+        if a is None:
+            return b
+        if b is None:
+            return a
+        # Keep the higher priority root on top, as in `_union`
+        if a.priority < b.priority:
+            a, b = b, a
+        low, duplicate, high = self._split_nodes(b, a.sort_key)
+        left = self._symmetric_difference(a.left_child, low)
+        right = self._symmetric_difference(a.right_child, high)
+        # The root's key is in both (or removed on both sides) -> drop it
+        if duplicate is not None:
+            if (a.value is _TOMBSTONE) == (duplicate.value is _TOMBSTONE):
+                return self._join_nodes(left, right)
+            # Only removed from a -> the key is in exactly one treap, b
+            if a.value is _TOMBSTONE:
+                a.key, a.value = duplicate.key, duplicate.value
+        self._set_left(a, left)
+        self._set_right(a, right)
+        return a
+
+    def _join_nodes(self, a: Optional[TreapNode], b: Optional[TreapNode]) -> Optional[TreapNode]:
+        """Join two subtrees where every key of `a` is below every key of `b`.
+
+        Walks down the right spine of `a` and the left spine of `b`,
+        always keeping the higher priority node on top.
+
+        Returns:
+            The root of the joined subtree. Like `_split_nodes`, it may
+            keep a stale parent pointer.
+        """
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if a.priority > b.priority:
+            self._set_right(a, self._join_nodes(a.right_child, b))
+            return a
+        self._set_left(b, self._join_nodes(a, b.left_child))
+        return b
+
+    def copy(self) -> TreapMap[KT, VT]:
+        """Return a copy of this Treap with the same shape and priorities.
+
+        Takes O(n) time and does no key comparisons. The walk keeps its
+        own stack, so even a degenerate, path-shaped Treap is copied.
+        """
+        clone = self._empty_like()
+
+        def copy_node(node: TreapNode, parent: Optional[TreapNode]) -> TreapNode:
+            x = TreapNode(node.key, node.value, parent, node.priority)
+            x.size = node.size
+            x.aggregate = node.aggregate
+            x.sort_key = node.sort_key
+            x.dead = node.dead
+            return x
 
-        # Part 0) Handle an empty left or right tree
-        # If both trees are empty
-        if self.root is None and other.root is None:
-            return
-        # If the left tree is empty
         if self.root is None:
-            self.root = other.root
-            return
-        # If the right tree is empty
-        if other.root is None:
+            return clone
+        clone.root = copy_node(self.root, None)
+        # Pairs of (original, copy) whose children are still to be copied
+        stack = [(self.root, clone.root)]
+        while stack:
+            node, x = stack.pop()
+            if node.left_child is not None:
+                x.left_child = copy_node(node.left_child, x)
+                stack.append((node.left_child, x.left_child))
+            if node.right_child is not None:
+                x.right_child = copy_node(node.right_child, x)
+                stack.append((node.right_child, x.right_child))
+        return clone
+
+    def compact(self) -> None:
+        """Drop the tombstones left by lazy deletion, in O(n).
+
+        The live nodes are relinked in key order by their priorities,
+        with no key comparisons, so the shape is the one the treap would
+        have had if the removed keys had never been inserted.
+        """
+        if not self._dead:
             return
+        live = []
+        node = self._first_node()
+        while node is not None:
+            if node.value is not _TOMBSTONE:
+                live.append(node)
+            node = self._successor(node)
+        self._link_sorted(live)
+        # The removed nodes are cut off from the tree
+        if self._fingers:
+            self._fingers.clear()
+
+    @property
+    def _dead(self) -> int:
+        """The number of tombstones in this Treap, read off the root in O(1)."""
+        return self.root.dead if self.root is not None else 0
+
+    def _compact_if_needed(self) -> None:
+        """Compact once tombstones exceed the lazy_delete fraction of the nodes.
+
+        A TreapMap without lazy_delete can only get tombstones by
+        adopting nodes from one with it, and drops them right away.
+        """
+        dead = self._dead
+        if dead:
+            threshold = self._lazy_delete if self._lazy_delete is not None else 0.0
+            if dead > threshold * (len(self) + dead):
+                self.compact()
+
+    def _before_restructure(self, other: Optional[Treap[KT, VT]] = None) -> None:
+        """Prepare this Treap and `other` for an operation that moves nodes between treaps.
+
+        Fingers could end up pointing into another treap, and cached
+        lookups are dropped as the keys change hands. Tombstones need
+        nothing: every node counts those of its subtree, so each part
+        knows its own after relinking.
+        """
+        if self._fingers:
+            self._fingers.clear()
+        if self._cache:
+            self._cache.clear()
+        if other is not None:
+            if getattr(other, "_fingers", None):
+                other._fingers.clear()
+            if getattr(other, "_cache", None):
+                other._cache.clear()
+
+    def balance_factor(self) -> float:
+        """Return the height of this Treap over the minimum height for its size.
+
+        A perfectly balanced Treap, including an empty one, has a balance
+        factor of 1.0; a random treap stays within a small constant.
+        Tombstones left by lazy deletion count as nodes, since they add
+        to the height.
+        """
+        n = len(self) + self._dead
+        if n == 0:
+            return 1.0
+        return self.stats()["height"] / n.bit_length()
+
+    def stats(self) -> dict:
+        """Describe the shape of this Treap in one O(n) walk.
+
+        Returns:
+            A dict with:
+            - "size": the number of nodes;
+            - "height": the number of nodes on the longest root-to-leaf path;
+            - "depth_histogram": a list whose entry d counts the nodes at
+              depth d, the root being at depth 0;
+            - "average_path_length": the mean number of nodes visited by a
+              successful search, over all keys;
+            - "tombstones": the nodes removed in lazy-delete mode that
+              are still in the tree (counted in the other entries);
+            - "rotations" and "comparisons": the totals counted since
+              `enable_counters()`, or None while counters are off.
+        """
+        histogram: List[int] = []
+        stack = [(self.root, 0)] if self.root is not None else []
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(histogram):
+                histogram.append(0)
+            histogram[depth] += 1
+            for child in (node.left_child, node.right_child):
+                if child is not None:
+                    stack.append((child, depth + 1))
+
+        size = sum(histogram)
+        counters = self.__dict__.get("_counters")
+        return {
+            "size": size,
+            "height": len(histogram),
+            "depth_histogram": histogram,
+            "average_path_length": sum((d + 1) * count for d, count in enumerate(histogram)) / size if size else 0.0,
+            "tombstones": self._dead,
+            "rotations": counters["rotations"] if counters else None,
+            "comparisons": counters["comparisons"] if counters else None,
+        }
+
+    def enable_counters(self) -> None:
+        """Start counting rotations and key comparisons, from zero.
+
+        The counting versions of the rotations and of the key searches,
+        from the root or from fingers, are installed on this instance
+        only, so a TreapMap without counters runs the plain methods and
+        pays nothing. Comparisons are those made while searching for a
+        key, by lookups, `lookup_many` and inserts. The counting searches are compiled
+        from the plain ones with each `<` turned into a counted call, so
+        they take the same paths and key classes see no wrapper objects.
+        Read the totals with `stats()`.
+        """
+        counters = {"rotations": 0, "comparisons": 0}
+        cls = type(self)
+
+        def rotate_left(node: TreapNode) -> None:
+            counters["rotations"] += 1
+            cls._rotate_left(self, node)
+
+        def rotate_right(node: TreapNode) -> None:
+            counters["rotations"] += 1
+            cls._rotate_right(self, node)
+
+        def less(a: Any, b: Any) -> bool:
+            counters["comparisons"] += 1
+            return a < b
+
+        self._counters = counters
+        self._rotate_left = rotate_left
+        self._rotate_right = rotate_right
+        for name in _COUNTED_SEARCHES:
+            setattr(self, name, types.MethodType(_counting_factory(getattr(cls, name))(less), self))
+
+    def disable_counters(self) -> None:
+        """Stop counting and go back to the plain methods."""
+        for name in ("_counters", "_rotate_left", "_rotate_right") + _COUNTED_SEARCHES:
+            self.__dict__.pop(name, None)
+
+    def instrument(
+        self,
+        operations: typing.Iterable[str] = INSTRUMENTED_OPERATIONS,
+        slow_ns: Optional[int] = None,
+        on_slow: Optional[Callable[[str, int, tuple], None]] = None,
+    ) -> typing.Dict[str, LatencyHistogram]:
+        """Start recording the latency of public operations of this Treap.
+
+        Like `enable_counters`, timing wrappers are installed on this
+        instance only; an uninstrumented TreapMap runs the plain methods.
+        Calling this again starts over with empty histograms.
+
+        Args:
+            operations: Names of the methods to time.
+            slow_ns: Duration, in nanoseconds, from which an operation
+                counts as slow.
+            on_slow: Called as `on_slow(operation, duration_ns, args)`
+                after every slow operation.
+
+        Returns:
+            A LatencyHistogram for each operation, updated live; also
+            available later from `latencies()`.
+        """
+        self.uninstrument()
+        cls = type(self)
+        histograms = {operation: LatencyHistogram() for operation in operations}
+
+        def timed(operation: str, method: Callable[..., typing.Any]) -> Callable[..., typing.Any]:
+            record = histograms[operation].record
+
+            def wrapper(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+                start = perf_counter_ns()
+                try:
+                    return method(self, *args, **kwargs)
+                finally:
+                    duration = perf_counter_ns() - start
+                    record(duration)
+                    if on_slow is not None and slow_ns is not None and duration >= slow_ns:
+                        on_slow(operation, duration, args)
+
+            return wrapper
+
+        for operation in histograms:
+            setattr(self, operation, timed(operation, getattr(cls, operation)))
+        self._latencies = histograms
+        return histograms
+
+    def uninstrument(self) -> None:
+        """Stop recording latencies and go back to the plain methods."""
+        for operation in self.__dict__.pop("_latencies", ()):
+            self.__dict__.pop(operation, None)
+
+    def latencies(self) -> typing.Dict[str, dict]:
+        """Return `LatencyHistogram.summary()` for each instrumented operation."""
+        return {operation: histogram.summary() for operation, histogram in self.__dict__.get("_latencies", {}).items()}
 
-        # Part 1) Create new node 'x' with MAX_PRIORITY to set it as the root in order to join self and _other
-        x = TreapNode(float('inf'), None)
-        x.priority = TreapNode.MAX_PRIORITY
-        x.left_child = self.root
-        x.right_child = other.root
-
-        # Part 2) Assign join node 'x' as the parent of each of the roots
-        # If the left tree exists
-        self.root.parent = x
-        other.root.parent = x
-
-        # Part 3) Self and _other are joined under one (temp) root, which allows the remove operation to properly merge the two treaps
-        # Set the join node 'x' as the current root
-        self.root = x
-        # Remove the join node 'x' since its temporary to merge self and _other root
-        self.remove(x.key)
-
-    def meld(self, other: Treap[KT, VT]) -> None: # KARMA
-        raise AttributeError
-    def difference(self, other: Treap[KT, VT]) -> None: # KARMA
-        raise AttributeError
-    def balance_factor(self) -> float: # KARMA
-        raise AttributeError
     def __str__(self) -> str:
         # (optional method, ungraded)
         """Build a human-readable representation of this Treap.
@@ -433,17 +1958,10 @@ class TreapMap(Treap[KT, VT]):
 
         The iterator should iterate in sorted order.
 
-        In-Order Traversal: left subtree --> root --> right subtree
+        In-Order Traversal: start at the leftmost node, then follow successor links
         """
-        def inorderTraversal(node):
-            if node is not None:
-                # First recur on left subtree
-                yield from inorderTraversal(node.left_child)
-
-                # Now deal with the node
+        node = self._first_node()
+        while node is not None:
+            if node.value is not _TOMBSTONE:
                 yield node.key
-
-                # Then recur on right subtree
-                yield from inorderTraversal(node.right_child)
-
-        yield from inorderTraversal(self.root)
\ No newline at end of file
+            node = self._successor(node)
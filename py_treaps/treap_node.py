@@ -2,12 +2,15 @@ from __future__ import annotations
 import random
 import typing
 from collections.abc import Iterator
-from typing import List, Optional, cast, Set
+from typing import Any, List, Optional, cast, Set
 
 from py_treaps.comparable import KT, VT
 
 class TreapNode:
 
+    # Fixed attribute layout: no per-instance __dict__, which dominates memory in large treaps
+    __slots__ = ("key", "value", "priority", "parent", "left_child", "right_child", "size", "aggregate", "sort_key", "dead")
+
     unused_priorities: Optional[List[int]] = None
 
     # The maximum priority that a node can have.
@@ -28,18 +31,35 @@ class TreapNode:
         parent (TreapNode): The parent of the node.
         left_child (TreapNode): The left child of the node.
         right_child (TreapNode): The right child of the node.
+        size (int): The number of nodes in the subtree rooted at the node.
+        aggregate (Any): The monoid aggregate of the subtree, if the map has a monoid.
+        sort_key (Any): What the node is ordered by: the key, or the map's key_func of it.
+        dead (int): The number of lazy-delete tombstones in the subtree rooted at the node.
     """
 
     def __init__(
-        self, key: KT, value: VT, parent: Optional[TreapNode] = None
+        self,
+        key: KT,
+        value: VT,
+        parent: Optional[TreapNode] = None,
+        priority: Optional[int] = None,
     ):
         self.key: KT = key
         self.value: VT = value
-        self.priority: int = self.get_priority()
+        # Nodes created by a TreapMap take their priority from the map's own source
+        self.priority: int = self.get_priority() if priority is None else priority
 
         self.parent: Optional[TreapNode] = parent
         self.left_child: Optional[TreapNode] = None
         self.right_child: Optional[TreapNode] = None
+        # Number of nodes in the subtree rooted here, maintained by TreapMap
+        self.size: int = 1
+        # Monoid aggregate of the subtree, maintained by TreapMaps created with a monoid
+        self.aggregate: Any = None
+        # Cached ordering key; TreapMaps with a key_func replace it with key_func(key)
+        self.sort_key: Any = key
+        # Tombstones in the subtree rooted here, maintained by TreapMaps created with lazy_delete
+        self.dead: int = 0
 
     def get_priority(self):
         """Generate a new priority for a treap node.
@@ -1,10 +1,23 @@
 from random import random, randrange
 
-from Tools.demo.sortvisu import insertionsort
-
-from py_treaps.treap_map import TreapMap
+from py_treaps import parallel, serialization, set_algebra
+from py_treaps.concurrent_treap import ConcurrentTreapMap, ReadWriteLock
+from py_treaps.instrumentation import LatencyHistogram
+from py_treaps.mapped_treap import MappedTreap, write_mapped
+from py_treaps.monoid import COUNT, MAX, SUM
+from py_treaps.persistent_treap import PersistentTreapMap
+from py_treaps.priority import HashPriority
+from py_treaps.treap_arena import TreapArena
+from py_treaps.treap_map import _TOMBSTONE, TreapMap
+from py_treaps.treap_node import TreapNode
 
+import functools
+import io
+import mmap
 import pytest
+import sys
+import tempfile
+import threading
 from typing import Any
 
 # This file includes some starter test cases that you can use
@@ -170,10 +183,13 @@ def test_split_by_median_starter() -> None: #PASS
     print("\n", left)
     print("\n", right)
 
+    # Keys below the (absent) threshold 6 go left, the rest go right
+    assert list(left) == [0, 1, 2, 3, 4, 5]
     for key in left:
-        assert 0 <= key < 5
-    for i in range(5, 11):
+        assert 0 <= key < 6
+    for i in range(7, 11):
         assert right.lookup(i) == str(i)
+    assert right.lookup(6) is None
 
     """
     # Custom Cases: join empty trees
@@ -235,3 +251,1255 @@ def test_bst_property_simple_starter() -> None: #PASS
         if root_node.key != "9":
             assert root_node.key <= root_node.right_child.key
 
+
+
+def _assert_treap_invariants(node, lo=None, hi=None) -> int:
+    """Recursively check the BST, heap and parent-pointer properties.
+
+    Returns the number of nodes in the subtree rooted at `node`.
+    """
+    if node is None:
+        return 0
+    if lo is not None:
+        assert lo < node.key
+    if hi is not None:
+        assert node.key < hi
+    for child in (node.left_child, node.right_child):
+        if child is not None:
+            assert child.parent is node
+            assert node.priority >= child.priority
+    return (
+        1
+        + _assert_treap_invariants(node.left_child, lo, node.key)
+        + _assert_treap_invariants(node.right_child, node.key, hi)
+    )
+
+
+def test_from_sorted_builds_valid_treap() -> None:
+    """Test the linear-time bulk constructor on sorted input."""
+    N = 500
+    treap = TreapMap.from_sorted((i, str(i)) for i in range(N))
+    assert treap.get_root_node().parent is None
+    assert _assert_treap_invariants(treap.get_root_node()) == N
+    assert list(treap) == list(range(N))
+    for i in range(N):
+        assert treap.lookup(i) == str(i)
+
+    # Repeated keys keep the last value
+    treap = TreapMap.from_sorted([(1, "a"), (1, "b"), (2, "c")])
+    assert list(treap) == [1, 2]
+    assert treap.lookup(1) == "b"
+
+    assert TreapMap.from_sorted([]).get_root_node() is None
+    with pytest.raises(ValueError):
+        TreapMap.from_sorted([(2, 2), (1, 1)])
+
+
+def test_from_items_sorts_unsorted_input() -> None:
+    """Test the bulk constructor falls back to sorting."""
+    keys = [randrange(1000) for _ in range(300)]
+    treap = TreapMap.from_items((k, k * 2) for k in keys)
+    assert _assert_treap_invariants(treap.get_root_node()) == len(set(keys))
+    assert list(treap) == sorted(set(keys))
+    for k in keys:
+        assert treap.lookup(k) == k * 2
+
+    treap = TreapMap.from_items([("b", 1), ("a", 2), ("b", 3)])
+    assert treap.lookup("b") == 3
+
+
+def test_seeded_priorities_are_reproducible() -> None:
+    """Test that maps built with the same seed have the same shape."""
+
+    def shape(node):
+        if node is None:
+            return None
+        return (node.key, node.priority, shape(node.left_child), shape(node.right_child))
+
+    a: TreapMap[int, int] = TreapMap(seed=42)
+    b: TreapMap[int, int] = TreapMap(seed=42)
+    for i in range(200):
+        a.insert(i, i)
+        b.insert(i, i)
+    assert shape(a.get_root_node()) == shape(b.get_root_node())
+    assert a.get_root_node().priority >= 2 ** 16  # wider than the old pool, almost surely
+
+
+def test_priority_sources_scale_past_old_pool() -> None:
+    """Test that maps do not share or exhaust a global priority pool."""
+    N = TreapNode.MAX_PRIORITY + 10
+    treap = TreapMap.from_sorted((i, i) for i in range(N))
+    assert _assert_treap_invariants(treap.get_root_node()) == N
+
+    # Hash priorities depend only on the key set, not the insertion order
+    forward = TreapMap(priority_source=HashPriority(seed=7))
+    backward = TreapMap(priority_source=HashPriority(seed=7))
+    for i in range(100):
+        forward.insert(i, i)
+        backward.insert(99 - i, i)
+    assert forward.get_root_node().key == backward.get_root_node().key
+    assert _assert_treap_invariants(forward.get_root_node()) == 100
+
+
+def test_treap_node_has_no_instance_dict() -> None:
+    """Test that TreapNode uses slots."""
+    node = TreapNode(1, "one", priority=5)
+    assert not hasattr(node, "__dict__")
+    with pytest.raises(AttributeError):
+        node.color = "red"
+
+
+def test_arena_matches_dict_and_reuses_slots() -> None:
+    """Test TreapArena against a dict under random inserts and removes."""
+    arena: TreapArena[int, int] = TreapArena(seed=3)
+    expected = {}
+    for _ in range(2000):
+        k = randrange(200)
+        if randrange(3):
+            arena.insert(k, k + 1)
+            expected[k] = k + 1
+        else:
+            assert arena.remove(k) == expected.pop(k, None)
+    assert list(arena) == sorted(expected)
+    for k in range(200):
+        assert arena.lookup(k) == expected.get(k)
+    # Removed slots are recycled, so the columns never outgrow the peak size
+    assert len(arena._store.keys) <= 200
+
+    root = arena.get_root_node()
+    if root is not None and root.left_child is not None:
+        assert root.left_child.parent == root
+        assert root.priority >= root.left_child.priority
+
+
+def test_arena_split_and_join() -> None:
+    """Test that split arenas share columns and join back together."""
+    arena: TreapArena[int, str] = TreapArena()
+    for i in range(100):
+        arena.insert(i, str(i))
+    left, right = arena.split(40)
+    assert list(left) == list(range(40))
+    assert list(right) == list(range(40, 100))
+    assert list(arena) == []
+
+    left.join(right)
+    assert list(left) == list(range(100))
+    assert list(right) == []
+
+    other: TreapArena[int, str] = TreapArena()
+    for i in range(100, 120):
+        other.insert(i, str(i))
+    left.join(other)
+    assert list(left) == list(range(120))
+    assert left.lookup(110) == "110"
+
+
+def _assert_sizes(node) -> int:
+    """Check that every cached subtree size matches the actual count."""
+    if node is None:
+        return 0
+    size = 1 + _assert_sizes(node.left_child) + _assert_sizes(node.right_child)
+    assert node.size == size
+    return size
+
+
+def test_order_statistics() -> None:
+    """Test len, select, rank and median under inserts and removes."""
+    treap: TreapMap[int, int] = TreapMap()
+    assert len(treap) == 0
+    with pytest.raises(IndexError):
+        treap.median()
+
+    keys = set()
+    for _ in range(500):
+        k = randrange(300)
+        if randrange(4):
+            treap.insert(k, k)
+            keys.add(k)
+        else:
+            treap.remove(k)
+            keys.discard(k)
+        assert len(treap) == len(keys)
+    _assert_sizes(treap.get_root_node())
+
+    ordered = sorted(keys)
+    for i, k in enumerate(ordered):
+        assert treap.select(i) == k
+        assert treap.rank(k) == i
+    assert treap.select(-1) == ordered[-1]
+    assert treap.rank(-5) == 0
+    assert treap.rank(1000) == len(ordered)
+    assert treap.median() == ordered[(len(ordered) - 1) // 2]
+    with pytest.raises(IndexError):
+        treap.select(len(ordered))
+
+
+def test_sizes_after_bulk_build_split_and_join() -> None:
+    """Test that subtree sizes survive from_sorted, split and join."""
+    treap = TreapMap.from_sorted((i, i) for i in range(100))
+    _assert_sizes(treap.get_root_node())
+    assert len(treap) == 100
+
+    left, right = treap.split(30)
+    _assert_sizes(left.get_root_node())
+    _assert_sizes(right.get_root_node())
+    assert (len(left), len(right)) == (30, 70)
+
+    left.join(right)
+    _assert_sizes(left.get_root_node())
+    assert len(left) == 100
+    assert left.select(50) == 50
+
+
+def test_range_queries() -> None:
+    """Test irange, items_range and count_range against a sorted list."""
+    keys = sorted({randrange(1000) for _ in range(300)})
+    treap = TreapMap.from_sorted((k, str(k)) for k in keys)
+
+    for _ in range(50):
+        lo, hi = sorted((randrange(-10, 1010), randrange(-10, 1010)))
+        for inclusive in ((True, False), (True, True), (False, False), (False, True)):
+            expected = [
+                k
+                for k in keys
+                if (lo < k or (inclusive[0] and k == lo))
+                and (k < hi or (inclusive[1] and k == hi))
+            ]
+            assert list(treap.irange(lo, hi, inclusive)) == expected
+            assert list(treap.irange(lo, hi, inclusive, reverse=True)) == expected[::-1]
+            assert treap.count_range(lo, hi, inclusive) == len(expected)
+        assert list(treap.items_range(lo, hi)) == [
+            (k, str(k)) for k in keys if lo <= k < hi
+        ]
+
+    assert list(treap.irange()) == keys
+    assert list(treap.irange(hi=keys[5])) == keys[:5]
+    assert treap.count_range(lo=keys[-3]) == 3
+    assert treap.count_range(10, 5) == 0
+    assert list(TreapMap().irange(1, 2)) == []
+
+
+def test_successor_iterators() -> None:
+    """Test keys, values, items, reversed and iter_from."""
+    keys = sorted({randrange(500) for _ in range(200)})
+    treap: TreapMap[int, str] = TreapMap()
+    for k in reversed(keys):
+        treap.insert(k, str(k))
+
+    assert list(treap) == keys
+    assert list(treap.keys()) == keys
+    assert list(treap.values()) == [str(k) for k in keys]
+    assert list(treap.items()) == [(k, str(k)) for k in keys]
+    assert list(reversed(treap)) == keys[::-1]
+
+    for probe in (keys[0] - 1, keys[10], keys[10] + 1, keys[-1] + 1):
+        assert list(treap.iter_from(probe)) == [k for k in keys if k >= probe]
+        assert list(treap.iter_from(probe, reverse=True)) == [k for k in reversed(keys) if k <= probe]
+
+    empty: TreapMap[int, str] = TreapMap()
+    assert list(reversed(empty)) == []
+    assert list(empty.items()) == []
+
+
+def test_iteration_does_not_recurse() -> None:
+    """Test iterating a path deeper than the recursion limit."""
+    depth = sys.getrecursionlimit() + 100
+    path = TreapMap.from_sorted(((i, i) for i in range(depth)), priority_source=lambda key: -key)
+    assert list(path) == list(range(depth))
+    assert next(reversed(path)) == depth - 1
+
+
+def test_upsert_helpers() -> None:
+    """Test setdefault, get_or_insert and update_with."""
+    treap: TreapMap[str, Any] = TreapMap()
+    assert treap.setdefault("a", 1) == 1
+    assert treap.setdefault("a", 2) == 1
+
+    calls = []
+    assert treap.get_or_insert("b", lambda: calls.append(1) or [0]) == [0]
+    assert treap.get_or_insert("b", lambda: calls.append(1) or [9]) == [0]
+    assert calls == [1]
+
+    words = "the cat and the hat and the bat".split()
+    counts: TreapMap[str, int] = TreapMap()
+    for word in words:
+        counts.update_with(word, lambda n: n + 1, 0)
+    assert list(counts.items()) == sorted((w, words.count(w)) for w in set(words))
+    assert len(counts) == 5
+    _assert_sizes(counts.get_root_node())
+    assert _assert_treap_invariants(counts.get_root_node()) == 5
+
+
+def test_insert_priority_can_lower_priority() -> None:
+    """Test that lowering a priority moves the node back down."""
+    treap: TreapMap[int, int] = TreapMap()
+    for i in range(50):
+        treap.insert_priority(i, i, i)
+    assert treap.get_root_node().key == 49
+    treap.insert_priority(49, 0, -1)
+    assert treap.get_root_node().key == 48
+    assert treap.lookup(49) == 0
+    assert _assert_treap_invariants(treap.get_root_node()) == 50
+    _assert_sizes(treap.get_root_node())
+
+
+def test_meld_is_union() -> None:
+    """Test meld against dict union for each duplicate policy."""
+    for combine in ("left", "right", lambda a, b: a + b):
+        left_items = {randrange(400): randrange(100) for _ in range(150)}
+        right_items = {randrange(400): randrange(100) for _ in range(300)}
+        left = TreapMap.from_items(left_items.items())
+        right = TreapMap.from_items(right_items.items())
+        left.meld(right, combine)
+
+        expected = dict(left_items)
+        for k, v in right_items.items():
+            if k not in expected or combine == "right":
+                expected[k] = v
+            elif callable(combine):
+                expected[k] = expected[k] + v
+        assert list(left.items()) == sorted(expected.items())
+        assert _assert_treap_invariants(left.get_root_node()) == len(expected)
+        _assert_sizes(left.get_root_node())
+        assert left.get_root_node().parent is None
+        assert right.get_root_node() is None
+
+    empty: TreapMap[int, int] = TreapMap()
+    empty.meld(TreapMap.from_sorted([(1, 1)]))
+    assert list(empty) == [1]
+    with pytest.raises(ValueError):
+        empty.meld(TreapMap(), combine="middle")
+
+    # Melding a map with itself is rejected before anything is moved
+    same = TreapMap.from_sorted((k, k) for k in range(10))
+    with pytest.raises(ValueError):
+        same.meld(same)
+    assert list(same) == list(range(10)) and len(same) == 10
+
+
+def test_in_place_set_algebra() -> None:
+    """Test difference, intersection and symmetric_difference against sets."""
+    for op in ("difference", "intersection", "symmetric_difference"):
+        a_items = {randrange(500): "a" for _ in range(250)}
+        b_items = {randrange(500): "b" for _ in range(250)}
+        a = TreapMap.from_items(a_items.items())
+        b = TreapMap.from_items(b_items.items())
+        getattr(a, op)(b)
+
+        expected = getattr(set(a_items), op)(set(b_items))
+        assert list(a) == sorted(expected)
+        assert _assert_treap_invariants(a.get_root_node()) == len(expected)
+        _assert_sizes(a.get_root_node())
+        assert b.get_root_node() is None
+        for k in expected:
+            assert a.lookup(k) == ("a" if k in a_items else "b")
+
+        # Combining a map with itself is rejected before anything is moved
+        same = TreapMap.from_sorted((k, k) for k in range(10))
+        with pytest.raises(ValueError):
+            getattr(same, op)(same)
+        assert list(same) == list(range(10)) and len(same) == 10
+
+
+def test_pure_set_algebra_leaves_inputs_intact() -> None:
+    """Test the set_algebra functions against Python sets."""
+    a = TreapMap.from_sorted((i, i) for i in range(0, 300, 2))
+    b = TreapMap.from_sorted((i, -i) for i in range(0, 300, 3))
+    sa, sb = set(a), set(b)
+
+    assert list(set_algebra.union(a, b)) == sorted(sa | sb)
+    assert list(set_algebra.difference(a, b)) == sorted(sa - sb)
+    assert list(set_algebra.intersection(a, b)) == sorted(sa & sb)
+    assert list(set_algebra.symmetric_difference(a, b)) == sorted(sa ^ sb)
+    assert set_algebra.intersection(a, b, combine="right").lookup(6) == -6
+
+    assert list(a) == sorted(sa) and list(b) == sorted(sb)
+    assert _assert_treap_invariants(a.get_root_node()) == len(sa)
+
+    # The same map on both sides is copied twice, so the results follow set algebra
+    assert list(set_algebra.union(a, a)) == sorted(sa)
+    assert list(set_algebra.intersection(a, a)) == sorted(sa)
+    assert list(set_algebra.difference(a, a)) == []
+    assert list(set_algebra.symmetric_difference(a, a)) == []
+    assert list(a) == sorted(sa)
+
+    # A path deeper than the recursion limit is copied too
+    n = sys.getrecursionlimit() + 100
+    path = TreapMap.from_sorted(((k, k) for k in range(n)), priority_source=lambda k: -k, monoid=SUM)
+    clone = path.copy()
+    clone.insert(n, n)
+    assert list(clone) == list(range(n + 1)) and len(path) == n
+    node, parent = clone.get_root_node(), None
+    while node is not None:
+        assert node.left_child is None and node.parent is parent
+        parent, node = node, node.right_child
+    assert clone.aggregate(0, 10) == sum(range(10))
+
+
+def test_split_join_any_threshold() -> None:
+    """Test split with present, absent and out-of-range thresholds."""
+    keys = list(range(0, 100, 3))
+    for threshold in (-1, 0, 1, 50, 51, 99, 200):
+        treap = TreapMap.from_sorted((k, k) for k in keys)
+        left, right = treap.split(threshold)
+        assert list(left) == [k for k in keys if k < threshold]
+        assert list(right) == [k for k in keys if k >= threshold]
+        assert treap.get_root_node() is None
+        for part in (left, right):
+            _assert_sizes(part.get_root_node())
+            assert _assert_treap_invariants(part.get_root_node()) == len(part)
+
+        left.join(right)
+        assert list(left) == keys
+        assert right.get_root_node() is None
+
+    # String keys work too: no numeric sentinel key is involved
+    words = TreapMap.from_sorted((w, w) for w in ["ant", "bee", "cat", "dog"])
+    low, high = words.split("c")
+    assert list(low) == ["ant", "bee"]
+    low.join(high)
+    assert list(low) == ["ant", "bee", "cat", "dog"]
+
+    with pytest.raises(ValueError):
+        TreapMap.from_sorted([(5, 5)]).join(TreapMap.from_sorted([(1, 1)]))
+
+
+def test_insert_many_and_lookup_many() -> None:
+    """Test the batch APIs against per-key insert and lookup."""
+    treap: TreapMap[int, int] = TreapMap()
+    reference: TreapMap[int, int] = TreapMap()
+    for batch_number in range(20):
+        batch = [(randrange(2000), batch_number) for _ in range(100)]
+        if batch_number % 2:
+            batch.sort()
+        treap.insert_many(batch)
+        for k, v in batch:
+            reference.insert(k, v)
+    assert list(treap.items()) == list(reference.items())
+    _assert_sizes(treap.get_root_node())
+    assert _assert_treap_invariants(treap.get_root_node()) == len(reference)
+
+    probes = sorted(randrange(-10, 2010) for _ in range(500))
+    assert treap.lookup_many(probes) == [reference.lookup(k) for k in probes]
+    shuffled = probes[::-1]
+    assert treap.lookup_many(shuffled) == [reference.lookup(k) for k in shuffled]
+    assert TreapMap().lookup_many([1, 2]) == [None, None]
+
+
+def _add_values(left: int, right: int) -> int:
+    """Picklable combine function for the parallel union test."""
+    return left + right
+
+
+def test_parallel_build_and_union() -> None:
+    """Test the process-pool builders against the sequential ones."""
+    pairs = [(randrange(5000), i) for i in range(3000)]
+    expected = TreapMap.from_items(pairs)
+    for workers, chunks in ((1, 4), (2, 4)):
+        built = parallel.parallel_build(pairs, workers=workers, chunks=chunks, seed=5)
+        assert list(built.items()) == list(expected.items())
+        assert _assert_treap_invariants(built.get_root_node()) == len(expected)
+        _assert_sizes(built.get_root_node())
+
+    # Sorted input with repeated keys straddling the chunk boundaries
+    runs = [(i // 10, i) for i in range(1000)]
+    built = parallel.parallel_build(runs, workers=2, chunks=7)
+    assert list(built.items()) == [(k, k * 10 + 9) for k in range(100)]
+
+    # The arena builder appends the chunks' columns and links them up
+    for workers, chunks in ((1, 4), (2, 4)):
+        arena = parallel.parallel_build_arena(pairs, workers=workers, chunks=chunks, seed=5)
+        assert list(arena) == list(expected)
+        assert all(arena.lookup(k) == v for k, v in expected.items())
+        s = arena._store
+        assert s.parent[arena._root] == -1
+        for i in range(len(s.keys)):
+            for child in (s.left[i], s.right[i]):
+                if child != -1:
+                    assert s.parent[child] == i and s.priorities[i] >= s.priorities[child]
+    assert list(parallel.parallel_build_arena([], workers=1)) == []
+
+    a = TreapMap.from_sorted((i, 1) for i in range(0, 2000, 2))
+    b = TreapMap.from_sorted((i, 2) for i in range(0, 2000, 3))
+    union = parallel.parallel_union(a, b, combine=_add_values, workers=2, chunks=3)
+    reference = set_algebra.union(a, b, combine=_add_values)
+    assert list(union.items()) == list(reference.items())
+    assert _assert_treap_invariants(union.get_root_node()) == len(reference)
+    assert len(a) == 1000 and len(b) == 667
+
+    # Workers compare raw keys, so maps ordered by a key_func are refused
+    negate = lambda k: -k
+    a = TreapMap.from_items(((i, i) for i in range(10)), key_func=negate)
+    b = TreapMap.from_items(((i, i) for i in range(5, 15)), key_func=negate)
+    with pytest.raises(ValueError):
+        parallel.parallel_union(a, b, workers=1)
+    with pytest.raises(ValueError):
+        parallel.parallel_union(a, TreapMap.from_sorted([(1, 1)]), workers=1)
+
+    # The union keeps the operands' monoid and aggregates the merged values
+    a = TreapMap.from_items(((i, i) for i in range(0, 300, 2)), monoid=SUM)
+    b = TreapMap.from_items(((i, 1) for i in range(0, 300, 3)), monoid=SUM)
+    union = parallel.parallel_union(a, b, workers=1, chunks=4, seed=2)
+    expected = dict(a.items())
+    expected.update(b.items())
+    assert union.aggregate() == sum(expected.values())
+    assert _assert_aggregates(union.get_root_node(), SUM) == sum(expected.values())
+    assert _assert_treap_invariants(union.get_root_node()) == len(expected)
+
+
+def _assert_persistent_invariants(node, lo=None, hi=None) -> int:
+    """Check BST, heap and size properties of a parent-free subtree."""
+    if node is None:
+        return 0
+    assert lo is None or lo < node.key
+    assert hi is None or node.key < hi
+    for child in (node.left_child, node.right_child):
+        if child is not None:
+            assert node.priority >= child.priority
+    size = (
+        1
+        + _assert_persistent_invariants(node.left_child, lo, node.key)
+        + _assert_persistent_invariants(node.right_child, node.key, hi)
+    )
+    assert node.size == size
+    return size
+
+
+def test_persistent_snapshots_are_isolated() -> None:
+    """Test that snapshots keep their contents while the map changes."""
+    treap: PersistentTreapMap[int, int] = PersistentTreapMap(seed=1)
+    expected = {}
+    versions = []
+    for step in range(600):
+        k = randrange(100)
+        if randrange(3):
+            treap.insert(k, step)
+            expected[k] = step
+        else:
+            assert treap.remove(k) == expected.pop(k, None)
+        if step % 50 == 0:
+            versions.append((treap.snapshot(), dict(expected)))
+
+    assert list(treap) == sorted(expected)
+    assert _assert_persistent_invariants(treap.get_root_node()) == len(expected)
+    for snapshot, contents in versions:
+        assert list(snapshot) == sorted(contents)
+        assert len(snapshot) == len(contents)
+        for k, v in contents.items():
+            assert snapshot.lookup(k) == v
+
+
+def test_persistent_updates_share_structure() -> None:
+    """Test that an update copies only one path."""
+    treap: PersistentTreapMap[int, int] = PersistentTreapMap(seed=2)
+    for i in range(1000):
+        treap.insert(i, i)
+    before = treap.snapshot()
+    treap.insert(500, -1)
+
+    def nodes(node):
+        return [] if node is None else [node] + nodes(node.left_child) + nodes(node.right_child)
+
+    old_ids = {id(n) for n in nodes(before.get_root_node())}
+    copied = [n for n in nodes(treap.get_root_node()) if id(n) not in old_ids]
+    assert 1 <= len(copied) <= 60
+    assert before.lookup(500) == 500 and treap.lookup(500) == -1
+
+    left, right = treap.split(300)
+    assert list(left) == list(range(300))
+    assert list(right) == list(range(300, 1000))
+    assert len(treap) == 1000
+    left.join(right)
+    assert list(left) == list(range(1000))
+    assert _assert_persistent_invariants(left.get_root_node()) == 1000
+
+
+def test_concurrent_treap_map_under_threads() -> None:
+    """Test that readers always see consistent contents while a writer runs."""
+    for lock_free_reads in (False, True):
+        shared: ConcurrentTreapMap[int, int] = ConcurrentTreapMap(lock_free_reads=lock_free_reads)
+        with shared.write_batch() as treap:
+            for k in range(200):
+                treap.insert(k, k)
+        errors = []
+        done = threading.Event()
+
+        def reader() -> None:
+            try:
+                while not done.is_set():
+                    keys = list(shared)
+                    # The writer only ever moves keys between [0, 200) and [200, 400)
+                    assert len(keys) == 200 and keys == sorted(keys)
+                    assert shared.lookup(0) in (None, 0)
+            except AssertionError as error:
+                errors.append(error)
+
+        def writer() -> None:
+            for k in range(200):
+                with shared.write_batch() as treap:
+                    treap.remove(k)
+                    treap.insert(k + 200, k)
+            done.set()
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert list(shared) == list(range(200, 400))
+
+        left, right = shared.split(300)
+        assert list(left) == list(range(200, 300))
+        left.join(right)
+        assert len(left) == 200
+
+
+def test_concurrent_lookups_that_mutate_take_the_write_lock() -> None:
+    """Test that lookups of self-adjusting, finger, cached and measured maps run one at a time."""
+    for options in ({"self_adjusting": True}, {"fingers": 2}, {"cache_size": 8}, {}):
+        inner: TreapMap[int, int] = TreapMap(seed=12, **options)
+        for k in range(300):
+            inner.insert(k, k)
+        shared: ConcurrentTreapMap[int, int] = ConcurrentTreapMap(inner)
+        assert shared._lookup_writes() == bool(options)
+        errors = []
+
+        def reader(offset: int) -> None:
+            try:
+                for i in range(2000):
+                    k = (i * 7 + offset) % 300
+                    assert shared.lookup(k) == k
+            except AssertionError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=reader, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert _assert_treap_invariants(inner.get_root_node()) == 300
+
+    # Statistics switched on after wrapping are updated by lookups as well
+    inner = TreapMap(seed=12)
+    shared = ConcurrentTreapMap(inner)
+    assert not shared._lookup_writes()
+    inner.enable_counters()
+    assert shared._lookup_writes()
+    inner.disable_counters()
+    inner.instrument()
+    assert shared._lookup_writes()
+    inner.uninstrument()
+    assert not shared._lookup_writes()
+
+
+def test_concurrent_snapshot_of_any_inner_treap() -> None:
+    """Test that snapshot works for every inner map type, with and without the lock."""
+    for shared in (
+        ConcurrentTreapMap(TreapMap()),
+        ConcurrentTreapMap(PersistentTreapMap()),
+        ConcurrentTreapMap(TreapArena()),
+        ConcurrentTreapMap(lock_free_reads=True),
+    ):
+        for k in range(20):
+            shared.insert(k, k)
+        snapshot = shared.snapshot()
+        shared.insert(100, 100)
+        assert list(snapshot) == list(range(20))
+        assert list(shared) == list(range(20)) + [100]
+
+        # Updating a snapshot reaches neither the shared map nor its readers
+        snapshot.insert(-1, -1)
+        snapshot.remove(5)
+        assert list(shared) == list(range(20)) + [100]
+        assert shared.lookup(5) == 5 and shared.lookup(-1) is None
+        assert list(shared.snapshot()) == list(range(20)) + [100]
+
+
+def test_read_write_lock_excludes_writers() -> None:
+    """Test that a writer waits for readers to finish."""
+    lock = ReadWriteLock()
+    order = []
+    lock.acquire_read()
+
+    def write() -> None:
+        with lock.write_locked():
+            order.append("write")
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(0.05)
+    order.append("read done")
+    lock.release_read()
+    thread.join()
+    assert order == ["read done", "write"]
+
+
+def _assert_aggregates(node, monoid) -> Any:
+    """Check the aggregate cached on every node against its subtree and return it."""
+    if node is None:
+        return monoid.identity
+    expected = monoid.combine(
+        monoid.combine(_assert_aggregates(node.left_child, monoid), monoid.project(node.value)),
+        _assert_aggregates(node.right_child, monoid),
+    )
+    assert node.aggregate == expected
+    return expected
+
+
+def test_monoid_range_aggregates() -> None:
+    """Test range aggregates against brute force through updates, split, join and meld."""
+    for monoid in (SUM, MAX, COUNT):
+        expected = {}
+        treap: TreapMap[int, int] = TreapMap(seed=7, monoid=monoid)
+        for _ in range(400):
+            k = randrange(200)
+            if randrange(4):
+                expected[k] = randrange(-50, 50)
+                treap.insert(k, expected[k])
+            elif k in expected:
+                assert treap.remove(k) == expected.pop(k)
+        for k in list(expected)[:20]:
+            expected[k] += 1
+            treap.update_with(k, lambda v: v + 1)
+        _assert_aggregates(treap.get_root_node(), monoid)
+
+        def brute(lo, hi, inclusive=(True, False)):
+            result = monoid.identity
+            for k in sorted(expected):
+                if (lo is None or lo < k or (inclusive[0] and k == lo)) and (
+                    hi is None or k < hi or (inclusive[1] and k == hi)
+                ):
+                    result = monoid.combine(result, monoid.project(expected[k]))
+            return result
+
+        for _ in range(100):
+            lo, hi = randrange(-10, 210), randrange(-10, 210)
+            inclusive = (bool(randrange(2)), bool(randrange(2)))
+            assert treap.aggregate(lo, hi, inclusive) == brute(lo, hi, inclusive)
+        assert treap.aggregate() == brute(None, None)
+        assert treap.aggregate(hi=100) == brute(None, 100)
+
+        left, right = treap.split(100)
+        _assert_aggregates(left.get_root_node(), monoid)
+        assert left.aggregate() == brute(None, 100)
+        left.join(right)
+        assert left.aggregate() == brute(None, None)
+
+        other = TreapMap.from_items(((k, 1) for k in range(150, 250)), monoid=monoid)
+        left.meld(other)
+        expected.update((k, 1) for k in range(150, 250))
+        _assert_aggregates(left.get_root_node(), monoid)
+        assert left.aggregate(120, 220) == brute(120, 220)
+
+    with pytest.raises(ValueError):
+        TreapMap().aggregate()
+
+
+def test_mismatched_monoids_are_rejected() -> None:
+    """Test that combining maps with different monoids fails before either map changes."""
+    for op in ("join", "meld", "difference", "intersection", "symmetric_difference"):
+        for left_monoid, right_monoid in ((SUM, None), (None, SUM), (SUM, MAX)):
+            a = TreapMap.from_sorted(((k, k) for k in range(10)), monoid=left_monoid)
+            b = TreapMap.from_sorted(((k, k) for k in range(10, 20)), monoid=right_monoid)
+            with pytest.raises(ValueError):
+                getattr(a, op)(b)
+            assert list(a.items()) == [(k, k) for k in range(10)]
+            assert list(b.items()) == [(k, k) for k in range(10, 20)]
+            _assert_sizes(a.get_root_node())
+            if left_monoid is not None:
+                _assert_aggregates(a.get_root_node(), left_monoid)
+
+
+def test_dump_and_load_preserve_shape() -> None:
+    """Test that dump/load round-trips keys, values and the exact shape for every column codec."""
+
+    columns = [
+        [(k, k * 2) for k in range(300)],
+        [(k / 4, -k) for k in range(300)],
+        [(f"key{k:04}", f"v{k}".encode()) for k in range(300)],
+        [((k, "tuple"), [k]) for k in range(300)],
+        [(1 << 70 + k, None) for k in range(10)],
+        [],
+    ]
+    for pairs in columns:
+        treap = TreapMap.from_items(pairs, seed=3)
+        buffer = io.BytesIO()
+        serialization.dump(treap, buffer)
+        loaded = serialization.load(memoryview(buffer.getvalue()))
+        assert str(loaded) == str(treap)
+        assert list(loaded.items()) == list(treap.items())
+        if pairs:
+            assert _assert_treap_invariants(loaded.get_root_node()) == len(pairs)
+            _assert_sizes(loaded.get_root_node())
+
+    treap = TreapMap.from_items(((k, k) for k in range(1000)), seed=5)
+    with tempfile.TemporaryFile() as fp:
+        serialization.dump(treap, fp)
+        fp.seek(0)
+        assert str(serialization.load(fp)) == str(treap)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            loaded = serialization.load(mapped, monoid=SUM)
+    assert loaded.aggregate(10, 20) == sum(range(10, 20))
+    loaded.insert(-1, -1)
+    assert loaded.select(0) == -1
+
+    with pytest.raises(ValueError):
+        serialization.load(b"not a treap dump at all")
+
+
+def test_dump_accepts_any_treap_backend() -> None:
+    """Test that a TreapArena, which has no len(), can be dumped."""
+
+    arena: TreapArena[int, str] = TreapArena()
+    for k in range(50):
+        arena.insert(k, str(k))
+    buffer = io.BytesIO()
+    serialization.dump(arena, buffer)
+    loaded = serialization.load(buffer.getvalue())
+    assert list(loaded.items()) == [(k, str(k)) for k in range(50)]
+    assert loaded.get_root_node().key == arena.get_root_node().key
+
+
+def test_dump_keeps_signed_and_float_priorities(tmp_path) -> None:
+    """Test that both formats store negative and float priorities exactly, and reject the rest."""
+    for priority in (lambda k: -k, lambda k: k / 8 - 3.5, lambda k: (1 << 64) - 1 - k):
+        treap = TreapMap()
+        for k in range(100):
+            treap.insert_priority(k * 7 % 100, k, priority(k))
+        buffer = io.BytesIO()
+        serialization.dump(treap, buffer)
+        assert str(serialization.load(buffer.getvalue())) == str(treap)
+        path = tmp_path / "treap.bin"
+        with open(path, "wb") as fp:
+            write_mapped(treap, fp)
+        with MappedTreap(path) as mapped:
+            assert str(mapped) == str(treap)
+
+    for priorities, error in (([1, 2.5], TypeError), ([1 << 64, 0], ValueError), ([-1, 1 << 63], ValueError)):
+        treap = TreapMap()
+        for k, p in enumerate(priorities):
+            treap.insert_priority(k, k, p)
+        with pytest.raises(error):
+            serialization.dump(treap, io.BytesIO())
+        with pytest.raises(error):
+            write_mapped(treap, io.BytesIO())
+
+
+def test_mapped_treap_reads_from_file(tmp_path) -> None:
+    """Test that a MappedTreap answers reads like the TreapMap it was written from."""
+    for make_key in (lambda k: k * 3, lambda k: f"k{k:05}"):
+        treap = TreapMap.from_items(((make_key(randrange(5000)), randrange(100)) for _ in range(1000)), seed=11)
+        path = tmp_path / "treap.bin"
+        with open(path, "wb") as fp:
+            write_mapped(treap, fp)
+
+        with MappedTreap(path) as mapped:
+            assert str(mapped) == str(treap)
+            assert list(mapped.items()) == list(treap.items())
+            assert list(reversed(mapped)) == list(reversed(treap))
+            assert mapped.get_root_node().key == treap.get_root_node().key
+            for k in range(-1, 5001, 7):
+                key = make_key(k)
+                assert mapped.lookup(key) == treap.lookup(key)
+                assert mapped.rank(key) == treap.rank(key)
+            for k in (0, 17, -1):
+                assert mapped.select(k) == treap.select(k)
+            lo, hi = make_key(1000), make_key(3000)
+            for inclusive in ((True, False), (False, True)):
+                assert list(mapped.irange(lo, hi, inclusive)) == list(treap.irange(lo, hi, inclusive))
+                assert list(mapped.items_range(hi=hi, inclusive=inclusive, reverse=True)) == list(
+                    treap.items_range(hi=hi, inclusive=inclusive, reverse=True)
+                )
+                assert mapped.count_range(lo, hi, inclusive) == treap.count_range(lo, hi, inclusive)
+            with pytest.raises(AttributeError):
+                mapped.insert(make_key(1), 1)
+
+    with open(path, "wb") as fp:
+        write_mapped(TreapMap(), fp)
+    with MappedTreap(path) as mapped:
+        assert len(mapped) == 0 and list(mapped) == [] and mapped.lookup(1) is None
+    with open(path, "wb") as fp, pytest.raises(TypeError):
+        write_mapped(TreapMap.from_items([(1, object())]), fp)
+
+
+def test_balance_factor_and_stats() -> None:
+    """Test the shape statistics and the opt-in rotation and comparison counters."""
+    assert TreapMap().balance_factor() == 1.0
+    treap = TreapMap.from_sorted(((k, k) for k in range(1023)), seed=2)
+    stats = treap.stats()
+    assert stats["size"] == sum(stats["depth_histogram"]) == 1023
+    assert stats["height"] == len(stats["depth_histogram"]) and stats["depth_histogram"][0] == 1
+    assert treap.balance_factor() == stats["height"] / 10
+    assert 1.0 <= treap.balance_factor() < 4.0
+    assert stats["rotations"] is None and stats["comparisons"] is None
+
+    # A path: every key is one level deeper than the previous one
+    path = TreapMap()
+    for k in range(10):
+        path.insert_priority(k, k, 100 - k)
+    assert path.stats()["depth_histogram"] == [1] * 10
+    assert path.stats()["average_path_length"] == 5.5
+    assert path.balance_factor() == 10 / 4
+
+    # Tombstones still take up height, so they count towards the size
+    lazy = TreapMap(seed=2, lazy_delete=0.9)
+    for k in range(1023):
+        lazy.insert(k, k)
+    height = lazy.stats()["height"]
+    for k in range(0, 1023, 2):
+        lazy.remove(k)
+    assert len(lazy) == 511 and lazy.stats()["height"] == height
+    assert lazy.balance_factor() == height / 10
+
+    treap.enable_counters()
+    assert "_rotate_left" in vars(treap) and "_descend" in vars(treap)
+    treap.lookup(500)
+    assert 0 < treap.stats()["comparisons"] <= 2 * treap.stats()["height"]
+
+    # Counted int lookups take the same three-way path as uncounted ones
+    def three_way_comparisons(key: int) -> int:
+        node, count = treap.get_root_node(), 0
+        while node is not None:
+            count += 1
+            if key < node.key:
+                node = node.left_child
+                continue
+            count += 1
+            if node.key < key:
+                node = node.right_child
+            else:
+                break
+        return count
+
+    before = treap.stats()["comparisons"]
+    for k in range(-5, 1030, 7):
+        treap.lookup(k)
+    assert treap.stats()["comparisons"] - before == sum(three_way_comparisons(k) for k in range(-5, 1030, 7))
+    for k in range(1023, 1100):
+        treap.insert(k, k)
+    for k in range(0, 1100, 3):
+        treap.remove(k)
+    stats = treap.stats()
+    assert stats["rotations"] > 0
+    assert _assert_treap_invariants(treap.get_root_node()) == len(treap) == stats["size"]
+    treap.disable_counters()
+    assert "_rotate_left" not in vars(treap) and "_descend" not in vars(treap)
+    assert treap.stats()["rotations"] is None
+
+    # Key classes that read attributes of the other operand are compared directly
+    class Point:
+        def __init__(self, x: int):
+            self.x = x
+
+        def __lt__(self, other: "Point") -> bool:
+            return self.x < other.x
+
+    points: TreapMap[Point, int] = TreapMap(seed=3)
+    points.enable_counters()
+    keys = [Point(x) for x in range(50)]
+    for p in keys:
+        points.insert(p, p.x)
+    assert [points.lookup(p) for p in keys] == list(range(50))
+    assert points.stats()["comparisons"] > 0
+
+    # Searches from fingers are counted too
+    fingered: TreapMap[int, int] = TreapMap(seed=3, fingers=2)
+    fingered.enable_counters()
+    for k in range(200):
+        fingered.insert(k, k)
+    before = fingered.stats()["comparisons"]
+    assert [fingered.lookup(k) for k in range(0, 200, 5)] == list(range(0, 200, 5))
+    after_lookups = fingered.stats()["comparisons"]
+    assert after_lookups > before
+    assert fingered.lookup_many(range(50, 60)) == list(range(50, 60))
+    assert fingered.stats()["comparisons"] > after_lookups
+
+
+def test_latency_instrumentation() -> None:
+    """Test per-operation latency histograms and the slow-operation callback."""
+    treap: TreapMap[int, int] = TreapMap(seed=4)
+    assert treap.latencies() == {}
+    slow = []
+    histograms = treap.instrument(slow_ns=0, on_slow=lambda op, ns, args: slow.append((op, args)))
+    for k in range(100):
+        treap.insert(k, k)
+    for k in range(50):
+        assert treap.lookup(k) == k
+    treap.remove(7)
+    left, right = treap.split(40)
+    treap.join(left)
+    treap.join(right)
+
+    summary = treap.latencies()
+    assert {op: s["count"] for op, s in summary.items()} == {
+        "insert": 100, "lookup": 50, "remove": 1, "split": 1, "join": 2,
+    }
+    assert sum(histograms["insert"].buckets) == 100
+    assert 0 < summary["lookup"]["p50_ns"] <= summary["lookup"]["p99_ns"] <= summary["lookup"]["max_ns"]
+    assert len(slow) == 154 and slow[0] == ("insert", (0, 0))
+    assert list(treap) == [k for k in range(100) if k != 7]
+
+    treap.uninstrument()
+    assert "insert" not in vars(treap) and treap.latencies() == {}
+    treap.insert(7, 7)
+    assert histograms["insert"].count == 100
+
+
+def test_latency_histogram_percentiles() -> None:
+    """Test that percentiles come from the log2 buckets."""
+    histogram = LatencyHistogram()
+    assert histogram.percentile(99) == 0
+    for duration in [100] * 98 + [5000, 70000]:
+        histogram.record(duration)
+    assert histogram.percentile(50) == 127
+    assert histogram.percentile(99) == 8191
+    assert histogram.percentile(100) == 70000
+    assert histogram.summary()["mean_ns"] == (9800 + 75000) / 100
+
+
+def test_key_func_orders_by_cached_sort_keys() -> None:
+    """Test a TreapMap ordered by a key function, computed once per key."""
+
+    calls = []
+
+    def by_length_then_text(word: str) -> tuple:
+        calls.append(word)
+        return len(word), word
+
+    words = ["pear", "fig", "banana", "kiwi", "apple", "date", "plum", "cherry", "lime"]
+    treap = TreapMap(seed=8, key_func=by_length_then_text)
+    for i, word in enumerate(words):
+        treap.insert(word, i)
+    assert len(calls) == len(words)
+    expected = sorted(words, key=lambda w: (len(w), w))
+    assert list(treap) == expected
+    assert _assert_sizes(treap.get_root_node()) == len(words)
+    assert treap.lookup("kiwi") == 3 and treap.lookup("grape") is None
+    assert treap.rank("kiwi") == expected.index("kiwi")
+    assert list(treap.irange("kiwi", "apple")) == expected[expected.index("kiwi"):expected.index("apple")]
+
+    left, right = treap.split("date")
+    assert list(left) == expected[:expected.index("date")]
+    left.join(right)
+    assert left.remove("fig") == 1 and "fig" not in list(left)
+    left.insert_many([("melon", 9), ("fig", 10)])
+    assert list(left) == sorted(set(words + ["melon"]), key=lambda w: (len(w), w))
+
+    # Case-insensitive map: keys with the same sort key are the same key
+    folded = TreapMap.from_items([("B", 1), ("a", 2), ("b", 3)], key_func=str.lower)
+    assert list(folded.items()) == [("a", 2), ("B", 3)]
+    assert folded.lookup("A") == 2
+
+    # Maps ordered differently cannot be combined, and MappedTreap cannot apply a key_func
+    plain = TreapMap.from_sorted((k, k) for k in range(10, 20))
+    for op in ("join", "meld", "difference", "intersection", "symmetric_difference"):
+        with pytest.raises(ValueError):
+            getattr(folded, op)(plain)
+    assert list(plain) == list(range(10, 20))
+    with pytest.raises(TypeError):
+        write_mapped(folded, io.BytesIO())
+
+
+def test_descents_find_every_key() -> None:
+    """Test lookups and inserts of present and missing keys on both descent paths."""
+
+    @functools.total_ordering
+    class Boxed:
+        def __init__(self, n: int):
+            self.n = n
+
+        def __lt__(self, other: "Boxed") -> bool:
+            return self.n < other.n
+
+        def __eq__(self, other: object) -> bool:
+            return isinstance(other, Boxed) and self.n == other.n
+
+    # Built-in keys take the three-way path, Boxed keys the one-comparison path
+    for wrap in (int, Boxed):
+        treap = TreapMap.from_sorted(((wrap(k), k) for k in range(0, 2000, 2)), seed=9)
+        for k in range(-1, 2001):
+            assert treap.lookup(wrap(k)) == (k if k % 2 == 0 and 0 <= k < 2000 else None)
+        for k in range(1, 2000, 2):
+            treap.insert(wrap(k), -k)
+        treap.insert(wrap(0), 100)
+        assert treap.lookup(wrap(0)) == 100 and treap.lookup(wrap(999)) == -999
+        assert treap.remove(wrap(4)) == 4 and treap.lookup(wrap(4)) is None
+        assert _assert_sizes(treap.get_root_node()) == 1999
+
+
+def test_lazy_delete() -> None:
+    """Test that tombstones are invisible and compacted away past the threshold."""
+    treap: TreapMap[int, int] = TreapMap(seed=5, lazy_delete=0.5, monoid=SUM)
+    expected = {}
+    compactions = 0
+    for step in range(3000):
+        k = randrange(200)
+        if random() < 0.5:
+            treap.insert(k, step)
+            expected[k] = step
+        else:
+            dead = treap.stats()["tombstones"]
+            assert treap.remove(k) == expected.pop(k, None)
+            compactions += treap.stats()["tombstones"] < dead
+        assert len(treap) == len(expected)
+    assert compactions > 0
+
+    keys = sorted(expected)
+    assert list(treap) == keys
+    assert list(reversed(treap)) == keys[::-1]
+    assert list(treap.items()) == [(k, expected[k]) for k in keys]
+    assert [treap.lookup(k) for k in range(200)] == [expected.get(k) for k in range(200)]
+    assert [treap.select(i) for i in range(len(keys))] == keys
+    assert [treap.rank(k) for k in keys] == list(range(len(keys)))
+    assert list(treap.irange(50, 150)) == [k for k in keys if 50 <= k < 150]
+    assert treap.aggregate(50, 150) == sum(expected[k] for k in keys if 50 <= k < 150)
+
+    # A removed key can be inserted again, and compaction leaves only live nodes
+    k = keys[0]
+    treap.remove(k)
+    assert treap.setdefault(k, -1) == -1 and treap.lookup(k) == -1
+    treap.remove(k)
+    treap.compact()
+    assert treap.stats()["tombstones"] == 0
+    assert _assert_sizes(treap.get_root_node()) == len(keys) - 1
+
+
+def test_finger_lookup() -> None:
+    """Test lookups from fingers under sequential, repeated and random access with mutations."""
+    treap: TreapMap[int, int] = TreapMap(seed=6, fingers=3)
+    expected = {}
+    for k in range(0, 1000, 2):
+        treap.insert(k, k)
+        expected[k] = k
+
+    # Sequential scan, a few hot keys, then random keys mixed with inserts and removes
+    assert [treap.lookup(k) for k in range(1000)] == [expected.get(k) for k in range(1000)]
+    assert [treap.lookup(k) for k in [10, 500, 10, 998, 500, 10] * 5] == [10, 500, 10, 998, 500, 10] * 5
+    for _ in range(2000):
+        k = randrange(1000)
+        action = random()
+        if action < 0.2:
+            treap.insert(k, -k)
+            expected[k] = -k
+        elif action < 0.4:
+            assert treap.remove(k) == expected.pop(k, None)
+        else:
+            assert treap.lookup(k) == expected.get(k)
+    assert _assert_sizes(treap.get_root_node()) == len(expected)
+
+    # Nodes moved to another treap are never used as fingers
+    left, right = treap.split(500)
+    assert [left.lookup(k) for k in range(1000)] == [expected.get(k) if k < 500 else None for k in range(1000)]
+    assert [right.lookup(k) for k in range(1000)] == [expected.get(k) if k >= 500 else None for k in range(1000)]
+    left.join(right)
+    assert [left.lookup(k) for k in range(999, -1, -1)] == [expected.get(k) for k in range(999, -1, -1)]
+
+
+def test_self_adjusting_lookup() -> None:
+    """Test that repeatedly looked up keys rise toward the root and the treap stays valid."""
+    treap: TreapMap[int, int] = TreapMap(seed=8, self_adjusting=True, monoid=SUM)
+    for k in range(1000):
+        treap.insert(k, k)
+    for _ in range(200):
+        for hot in (123, 456, 789):
+            assert treap.lookup(hot) == hot
+    assert treap.lookup(1000) is None
+
+    def depth(key: int) -> int:
+        node, d = treap.get_root_node(), 0
+        while node.key != key:
+            node, d = (node.left_child if key < node.key else node.right_child), d + 1
+        return d
+
+    assert max(depth(hot) for hot in (123, 456, 789)) <= 3
+    _assert_treap_invariants(treap.get_root_node())
+    assert _assert_sizes(treap.get_root_node()) == 1000
+    assert treap.aggregate() == sum(range(1000))
+
+
+def test_lookup_cache() -> None:
+    """Test that the LRU lookup cache counts hits and misses and never serves stale values."""
+    treap: TreapMap[int, int] = TreapMap(seed=10, cache_size=4)
+    for k in range(100):
+        treap.insert(k, k)
+    assert [treap.lookup(k) for k in (1, 2, 1, 1, 200)] == [1, 2, 1, 1, None]
+    assert treap.cache_info() == {"hits": 2, "misses": 3, "size": 3, "maxsize": 4}
+
+    # Every mutation of a key, including inserting a cached miss, is seen by the next lookup
+    treap.insert(1, -1)
+    treap.insert(200, 200)
+    treap.remove(2)
+    assert [treap.lookup(k) for k in (1, 200, 2)] == [-1, 200, None]
+    assert treap.update_with(200, lambda v: v + 1) == 201 and treap.lookup(200) == 201
+
+    # The least recently used key is evicted first
+    for k in (10, 11, 12, 13):
+        treap.lookup(k)
+    assert treap.cache_info()["size"] == 4
+    hits = treap.cache_info()["hits"]
+    treap.lookup(13)
+    treap.lookup(1)
+    assert treap.cache_info()["hits"] == hits + 1
+
+    # Structural operations drop the cache of both treaps
+    left, right = treap.split(50)
+    assert left.cache_info()["size"] == 0 and left.lookup(13) == 13 and left.lookup(60) is None
+    other: TreapMap[int, int] = TreapMap(seed=11, cache_size=4)
+    other.insert(13, -13)
+    assert other.lookup(13) == -13
+    left.meld(other, "right")
+    assert left.lookup(13) == -13 and other.cache_info()["size"] == 0
+    left.join(right)
+    assert left.lookup(60) == 60
+
+
+def _assert_lazy_counts(node) -> Any:
+    """Check the cached live size and tombstone count of every node; return both for the root."""
+    if node is None:
+        return 0, 0
+    left_size, left_dead = _assert_lazy_counts(node.left_child)
+    right_size, right_dead = _assert_lazy_counts(node.right_child)
+    dead = node.value is _TOMBSTONE
+    assert node.size == left_size + right_size + (not dead)
+    assert node.dead == left_dead + right_dead + dead
+    return node.size, node.dead
+
+
+def test_lazy_delete_keeps_tombstones_through_restructuring() -> None:
+    """Test split, join, meld and set algebra on maps holding tombstones, without compaction."""
+    def lazy(keys, removed, tag):
+        treap = TreapMap(seed=len(keys) + tag, lazy_delete=0.9)
+        for k in keys:
+            treap.insert(k, tag)
+        for k in removed:
+            treap.remove(k)
+        return treap
+
+    a_keys, b_keys = range(0, 60), range(30, 90)
+    a_removed, b_removed = range(0, 60, 4), range(30, 90, 3)
+    a_live = set(a_keys) - set(a_removed)
+    b_live = set(b_keys) - set(b_removed)
+
+    treap = lazy(a_keys, a_removed, 1)
+    left, right = treap.split(25)
+    assert left.stats()["tombstones"] + right.stats()["tombstones"] == len(a_removed)
+    assert list(left) == sorted(k for k in a_live if k < 25) and len(right) == len(a_live) - len(left)
+    left.join(right)
+    assert list(left) == sorted(a_live)
+    assert _assert_lazy_counts(left.get_root_node()) == (len(a_live), len(a_removed))
+
+    # Meld keeps the right value of a shared key by default, intersection the left one
+    for op, expected, tag in (
+        ("meld", a_live | b_live, lambda k: 2 if k in b_live else 1),
+        ("difference", a_live - b_live, lambda k: 1),
+        ("intersection", a_live & b_live, lambda k: 1),
+        ("symmetric_difference", a_live ^ b_live, lambda k: 1 if k in a_live else 2),
+    ):
+        a, b = lazy(a_keys, a_removed, 1), lazy(b_keys, b_removed, 2)
+        getattr(a, op)(b)
+        assert list(a) == sorted(expected), op
+        assert [a.lookup(k) for k in sorted(expected)] == [tag(k) for k in sorted(expected)]
+        assert _assert_lazy_counts(a.get_root_node())[0] == len(expected)